@@ -1,14 +1,31 @@
 import streamlit as st
 import pandas as pd
-from utils.data_processing import parse_file
-from utils.calculations import calculate_metrics
-from utils.llm_analysis import generate_insights
-from utils.visualization import plot_metrics
+from utils.data_processing import parse_file, parse_workbook, sheets_to_portfolio, summarize_file_streaming
+from utils.parse_cache import ParseCache, file_cache_key
+from utils.calculations import METRICS_GRAPH, calculate_metrics, calculate_batch_metrics
+from utils.llm_analysis import generate_insights, InsightCache, INSIGHT_TYPES
+from utils.async_insights import generate_all_insights, stream_insights
+from utils.reporting import build_pdf_report
+from utils.visualization import (
+    metrics_figure, render_chart, scatter_figure, scenario_figure, sensitivity_heatmap_figure, series_figure,
+    tornado_figure,
+)
+from utils.proforma import project_cash_flows, run_pro_forma, pro_forma_table
+from utils.simulation import simulate_risk, format_simulation_summary
+from utils.profiling import ProfilingRun, timed_stage
+from utils.rent_roll import analyze_rent_roll, parse_unit_mix
+from utils.comps import CompsIndex, comp_benchmarks, format_comps_context
+from utils.deal_store import DealStore
+from utils.scenarios import BASE_SCENARIO, ScenarioEvaluator, default_scenarios, scenario_diff
+from utils.debt import size_loans, size_loans_grid, amortization_schedules, amortization_table
+from utils.sensitivity import (
+    build_sensitivity_grid, sensitivity_point, sensitivity_slice, tornado_table,
+    RENT_AXIS, EXPENSE_AXIS,
+)
+import numpy as np
 import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dotenv import load_dotenv
-import matplotlib.pyplot as plt
-from fpdf import FPDF
-from PIL import Image
 import openai
 import streamlit as st
 
@@ -24,9 +41,21 @@ additional_inputs = [
     "average_in_place_rent", "submarket_trends", "employment_growth_rate",
     "crime_rate", "school_ratings", "renovation_cost", "capex",
     "holding_period", "rent_variation", "expense_variation",
-    "parking_income", "laundry_income", "tenant_type"
+    "parking_income", "laundry_income", "tenant_type",
+    "interest_rate", "amortization_years", "discount_rate",
+    "latitude", "longitude", "benchmark_cap_rate",
+    "min_dscr", "max_ltv", "min_debt_yield", "io_years", "loan_term"
 ]
 
+# calculate_metrics reads these title-case keys; they are filled from the session inputs above
+METRIC_INPUT_KEYS = {
+    "Equity": "equity", "Debt Service": "debt_service", "Market Rent": "market_rent",
+    "Number of Units": "num_units", "Projected Cap Rate at Sale": "projected_cap_rate_at_sale",
+    "Market Growth Rate": "market_growth_rate", "Parking Income": "parking_income",
+    "Laundry Income": "laundry_income", "Rent Variation": "rent_variation",
+    "Expense Variation": "expense_variation", "Benchmark Cap Rate (%)": "benchmark_cap_rate",
+}
+
 # Initialize session states
 for input_name in basic_inputs + additional_inputs:
     if input_name not in st.session_state:
@@ -44,12 +73,76 @@ if "insight_type" not in st.session_state:
 if "chart_type" not in st.session_state:
     st.session_state["chart_type"] = "bar"
 
+# Each session memoizes its metrics on its own graph, so other sessions' inputs never evict them
+if "metrics_graph" not in st.session_state:
+    st.session_state["metrics_graph"] = METRICS_GRAPH.copy()
+
+@st.cache_resource
+def insights_executor():
+    """Thread pool generating the insight types that are not streamed, shared by every session."""
+    return ThreadPoolExecutor(max_workers=4)
+
+@st.cache_resource
+def workbook_executor():
+    """Worker processes for parsing large multi-sheet workbooks, started once per process."""
+    return ProcessPoolExecutor()
+
+@st.cache_resource
+def load_comps_index():
+    """Load the persisted comps store and its index once per process."""
+    return CompsIndex.load()
+
+# Parsed uploads are cached on disk by content hash, shared across sessions and reruns
+PARSE_CACHE = ParseCache()
+
+# Generated insights are memoized on disk, so reruns and PDF exports reuse them
+INSIGHT_CACHE = InsightCache()
+
+# Analyzed deals are saved to a local SQLite store for screening and reloading
+DEAL_STORE = DealStore()
+
+def generate_and_save_insights(name, inputs, metrics, data_ref, contexts):
+    """Generate every insight type and save them with the deal; runs on insights_executor."""
+    insights = generate_all_insights(metrics, model="gpt-4", contexts=contexts, api_key=OPENAI_API_KEY, cache=INSIGHT_CACHE)
+    DEAL_STORE.save_deal(name, inputs, metrics, data_ref=data_ref, insights=insights)
+    return insights
+
+# A deal picked under Saved Deals is restored here, before the input widgets are created
+if "load_deal_id" in st.session_state:
+    saved_deal = DEAL_STORE.get_deal(st.session_state.pop("load_deal_id"))
+    if saved_deal is not None:
+        for key, value in saved_deal["inputs"].items():
+            if key in basic_inputs + additional_inputs:
+                st.session_state[key] = value
+        st.session_state["deal_name"] = saved_deal["name"]
+        st.session_state["metrics"] = saved_deal["metrics"]
+        st.session_state["loaded_deal"] = saved_deal
+
+# Unit-level columns read from rent rolls in addition to the underwriting inputs
+RENT_ROLL_OPTIONAL_COLUMNS = ["Unit Type", "Rent", "Occupied", "Lease Start", "Lease End"]
+
+# Uploads larger than this are aggregated chunk by chunk instead of parsed into one DataFrame
+STREAMING_THRESHOLD_BYTES = 50 * 1024 * 1024
+
 # Streamlit app starts here
 st.title("UnderwritePro")
+
+# Debug timings: per-stage breakdown of each Analyze run, optionally with a cProfile or tracemalloc capture
+with st.sidebar:
+    debug_timings = st.checkbox("Debug timings", key="debug_timings")
+    capture_mode = st.selectbox(
+        "Profiling capture", ["none", "cprofile", "tracemalloc"], key="capture_mode", disabled=not debug_timings
+    )
 st.write("Provide detailed inputs for a comprehensive analysis and actionable insights.")
 
 # File Upload
 uploaded_file = st.file_uploader("Upload a file (Excel or CSV) (Optional)", type=["xlsx", "csv"])
+combine_sheets = st.checkbox(
+    "Workbook has one sheet per property or month (combine all sheets)", key="combine_sheets",
+    disabled=not (uploaded_file and uploaded_file.name.endswith(".xlsx")),
+)
+
+deal_name = st.text_input("Deal Name (Optional)", key="deal_name", help="Analyzed deals are saved under this name")
 
 # Inputs - Basic Metrics
 st.header("Basic Metrics")
@@ -102,6 +195,43 @@ with st.expander("Market Analysis (Optional)"):
     st.session_state["school_ratings"] = st.slider(
         "School Ratings (1-10) (Optional)", min_value=1, max_value=10, value=int(st.session_state["school_ratings"])
     )
+    st.session_state["market_rent"] = st.number_input(
+        "Market Rent ($/unit/month) (Optional)", min_value=0.0, value=float(st.session_state["market_rent"]), step=25.0
+    )
+
+    # Comparable properties: nearest past deals by location, vintage and size
+    st.session_state["latitude"] = st.number_input(
+        "Latitude (Optional)", min_value=-90.0, max_value=90.0, value=float(st.session_state["latitude"]), format="%.5f"
+    )
+    st.session_state["longitude"] = st.number_input(
+        "Longitude (Optional)", min_value=-180.0, max_value=180.0, value=float(st.session_state["longitude"]), format="%.5f"
+    )
+    comps_file = st.file_uploader("Comps dataset (Excel or CSV) (Optional)", type=["xlsx", "csv"],
+                                  help="Past deals with Latitude, Longitude, Year Built, Units, Price Per Unit, Cap Rate (%) and Market Rent.")
+    if comps_file and st.button("Build Comps Index"):
+        try:
+            CompsIndex.from_file(comps_file)
+            load_comps_index.clear()
+            st.success("Comps index built.")
+        except ValueError as e:
+            st.error(str(e))
+
+    comps_index = load_comps_index()
+    if comps_index is not None and st.button("Find Comps"):
+        comps = comps_index.query(
+            st.session_state["latitude"], st.session_state["longitude"],
+            st.session_state["year_built"], st.session_state["num_units"],
+        )
+        benchmarks = comp_benchmarks(comps)
+        st.session_state["comps"] = comps
+        st.session_state["comps_context"] = format_comps_context(comps, benchmarks)
+        # Pre-fill the market inputs from the comps, then rerun so the widgets show them
+        st.session_state["market_rent"] = benchmarks["Market Rent"]
+        st.session_state["benchmark_cap_rate"] = benchmarks["Benchmark Cap Rate (%)"]
+        st.rerun()
+    if st.session_state.get("comps") is not None:
+        st.write(f"Nearest comps (benchmark cap rate {st.session_state['benchmark_cap_rate']:.2f}%):")
+        st.dataframe(st.session_state["comps"])
 
 # Inputs - Financial Metrics
 with st.expander("Financial Metrics (Optional)"):
@@ -121,6 +251,86 @@ with st.expander("Financial Metrics (Optional)"):
         "Capital Expenditures (CapEx) ($) (Optional)", min_value=0.0, value=st.session_state["capex"], step=1000.0
     )
 
+# Inputs - Pro Forma
+with st.expander("Pro Forma (Optional)"):
+    st.session_state["holding_period"] = st.slider(
+        "Holding Period (Years)", min_value=1, max_value=30, value=int(st.session_state["holding_period"]) or 5
+    )
+    st.session_state["market_growth_rate"] = st.slider(
+        "Market Growth Rate (%)", min_value=-10.0, max_value=20.0, value=st.session_state["market_growth_rate"], step=0.5
+    )
+    st.session_state["interest_rate"] = st.number_input(
+        "Loan Interest Rate (%) (Optional)", min_value=0.0, max_value=30.0, value=st.session_state["interest_rate"], step=0.125,
+        help="Loan amount is the offer price plus renovation cost less equity."
+    )
+    st.session_state["amortization_years"] = st.slider(
+        "Amortization (Years)", min_value=0, max_value=40, value=int(st.session_state["amortization_years"]) or 30,
+        help="0 means interest only."
+    )
+    st.session_state["discount_rate"] = st.number_input(
+        "Discount Rate for NPV (%)", min_value=0.0, max_value=50.0, value=st.session_state["discount_rate"] or 8.0, step=0.5
+    )
+
+    # Debt sizing: solve for the maximum loan instead of typing debt service and equity by hand
+    st.session_state["min_dscr"] = st.number_input(
+        "Minimum DSCR", min_value=0.0, max_value=5.0, value=st.session_state["min_dscr"] or 1.25, step=0.05
+    )
+    st.session_state["max_ltv"] = st.number_input(
+        "Maximum LTV (%)", min_value=0.0, max_value=100.0, value=st.session_state["max_ltv"] or 75.0, step=2.5
+    )
+    st.session_state["min_debt_yield"] = st.number_input(
+        "Minimum Debt Yield (%)", min_value=0.0, max_value=30.0, value=st.session_state["min_debt_yield"] or 8.0, step=0.5
+    )
+    st.session_state["io_years"] = st.slider(
+        "Interest-Only Period (Years)", min_value=0, max_value=10, value=int(st.session_state["io_years"])
+    )
+    st.session_state["loan_term"] = st.slider(
+        "Loan Term (Years)", min_value=1, max_value=40, value=int(st.session_state["loan_term"]) or 10
+    )
+    if st.button("Size Max Loan"):
+        if st.session_state["data"] is not None:
+            loan_income = float(st.session_state["data"].get("Income", pd.Series(dtype="float64")).sum())
+            loan_expenses = float(st.session_state["data"].get("Expenses", pd.Series(dtype="float64")).sum())
+        else:
+            loan_income, loan_expenses = st.session_state["total_income"], st.session_state["total_expenses"]
+        loan_inputs = pd.DataFrame([{
+            "Offer Price": st.session_state["offer_price"],
+            "Income": loan_income,
+            "Expenses": loan_expenses,
+            "Renovation Cost": st.session_state["renovation_cost"],
+            "Interest Rate (%)": st.session_state["interest_rate"],
+            "Amortization (Years)": st.session_state["amortization_years"],
+            "Interest Only (Years)": st.session_state["io_years"],
+            "Loan Term (Years)": st.session_state["loan_term"],
+            "Min DSCR": st.session_state["min_dscr"],
+            "Max LTV (%)": st.session_state["max_ltv"],
+            "Min Debt Yield (%)": st.session_state["min_debt_yield"],
+        }])
+        loan_sizing = size_loans(loan_inputs)
+        # Stress test the sizing 1% either side of the quoted rate
+        rates = np.clip(st.session_state["interest_rate"] + np.array([-1.0, -0.5, 0.0, 0.5, 1.0]), 0, None)
+        st.session_state["loan_sizing"] = (
+            loan_sizing,
+            size_loans_grid(loan_inputs, np.unique(rates), [st.session_state["amortization_years"]]),
+        )
+        # Pre-fill the financing inputs the metrics and pro forma read
+        st.session_state["debt_service"] = float(loan_sizing["Annual Debt Service ($)"].iloc[0])
+        st.session_state["equity"] = float(loan_sizing["Equity Required ($)"].iloc[0])
+        st.rerun()
+    if st.session_state.get("loan_sizing") is not None:
+        loan_sizing, loan_grid = st.session_state["loan_sizing"]
+        sized_loan = loan_sizing.iloc[0]
+        st.write(f"Max loan ${sized_loan['Max Loan ($)']:,.0f} ({sized_loan['Binding Constraint']} constraint binds), "
+                 f"equity required ${sized_loan['Equity Required ($)']:,.0f}")
+        st.json(sized_loan.to_dict())
+        st.write("Amortization Schedule:")
+        st.dataframe(amortization_table(amortization_schedules(
+            sized_loan["Max Loan ($)"], st.session_state["interest_rate"], st.session_state["amortization_years"],
+            st.session_state["io_years"], st.session_state["loan_term"],
+        )))
+        st.write("Rate Stress Test:")
+        st.dataframe(loan_grid[["Max Loan ($)", "Binding Constraint", "Annual Debt Service ($)", "Equity Required ($)"]])
+
 # Inputs - Tenant and Revenue Analysis
 with st.expander("Tenant and Revenue Analysis (Optional)"):
     st.session_state["tenant_type"] = st.selectbox(
@@ -134,6 +344,20 @@ with st.expander("Tenant and Revenue Analysis (Optional)"):
         "Laundry Income ($) (Optional)", min_value=0.0, value=st.session_state["laundry_income"], step=50.0
     )
 
+@st.cache_data
+def cached_sensitivity_grid(income, expenses, offer_price, equity, debt_service,
+                            market_growth_rate, projected_cap_rate_at_sale, holding_period):
+    """Build the sensitivity grid once per set of base inputs."""
+    base_exit_cap = projected_cap_rate_at_sale if projected_cap_rate_at_sale > 0 else 6.0
+    return build_sensitivity_grid(
+        income, expenses, offer_price, equity, debt_service,
+        growth_rates=np.arange(-5.0, 5.5, 0.5),
+        exit_cap_rates=np.arange(max(base_exit_cap - 3.0, 0.5), base_exit_cap + 3.25, 0.25),
+        years=holding_period,
+        base_growth_rate=market_growth_rate,
+        base_exit_cap_rate=base_exit_cap,
+    )
+
 # Sensitivity Analysis
 with st.expander("Sensitivity Analysis (Optional)"):
     st.session_state["rent_variation"] = st.slider(
@@ -143,6 +367,83 @@ with st.expander("Sensitivity Analysis (Optional)"):
         "Expense Variation (%)", min_value=-50, max_value=50, value=0, step=5, help="Simulate changes in expense levels."
     )
 
+    # The full grid is computed once per set of base inputs; the sliders only index into it
+    if st.session_state["data"] is not None:
+        sensitivity_income = float(st.session_state["data"].get("Income", pd.Series(dtype="float64")).sum())
+        sensitivity_expenses = float(st.session_state["data"].get("Expenses", pd.Series(dtype="float64")).sum())
+    else:
+        sensitivity_income = st.session_state["total_income"]
+        sensitivity_expenses = st.session_state["total_expenses"]
+    sensitivity_grid = cached_sensitivity_grid(
+        sensitivity_income, sensitivity_expenses, st.session_state["offer_price"],
+        st.session_state["equity"], st.session_state["debt_service"],
+        st.session_state["market_growth_rate"], st.session_state["projected_cap_rate_at_sale"],
+        int(st.session_state["holding_period"]) or 1,
+    )
+    st.write("Metrics at Selected Variation:")
+    st.json(sensitivity_point(sensitivity_grid, {
+        RENT_AXIS: st.session_state["rent_variation"],
+        EXPENSE_AXIS: st.session_state["expense_variation"],
+    }))
+    sensitivity_metric = st.selectbox("Sensitivity Metric", list(sensitivity_grid["metrics"]), index=0)
+    st.plotly_chart(sensitivity_heatmap_figure(sensitivity_slice(sensitivity_grid, sensitivity_metric), metric=sensitivity_metric))
+    st.plotly_chart(tornado_figure(tornado_table(sensitivity_grid, sensitivity_metric), metric=sensitivity_metric))
+
+# Scenario Comparison: named what-if scenarios evaluated together, memoized per scenario
+SCENARIO_CHART_METRICS = ["NOI", "Cap Rate (%)", "Cash on Cash Return (%)", "DSCR", "IRR (%)", "Equity Multiple", "NPV ($)"]
+
+@st.fragment
+def scenario_comparison():
+    """Scenario edits rerun this fragment only, and only new or changed scenarios are computed."""
+    if st.session_state["data"] is not None:
+        scenario_income = float(st.session_state["data"].get("Income", pd.Series(dtype="float64")).sum())
+        scenario_expenses = float(st.session_state["data"].get("Expenses", pd.Series(dtype="float64")).sum())
+    else:
+        scenario_income, scenario_expenses = st.session_state["total_income"], st.session_state["total_expenses"]
+    base_inputs = {name: st.session_state[key] for name, key in METRIC_INPUT_KEYS.items()}
+    base_inputs.update({
+        "Offer Price": st.session_state["offer_price"],
+        "Income": scenario_income,
+        "Expenses": scenario_expenses,
+        "Interest Rate (%)": st.session_state["interest_rate"],
+        "Amortization (Years)": st.session_state["amortization_years"],
+        "Holding Period": st.session_state["holding_period"],
+        "Renovation Cost": st.session_state["renovation_cost"],
+        "CapEx": st.session_state["capex"],
+    })
+
+    # The presets follow the inputs above; edits are kept until those inputs change
+    if st.button("Reset Scenarios") or st.session_state.get("scenario_base") != base_inputs:
+        st.session_state["scenario_base"] = base_inputs
+        st.session_state["scenarios"] = default_scenarios(base_inputs).reset_index()
+        st.session_state.pop("scenario_editor", None)
+    st.caption("Edit any cell or add a row to compare another scenario; blank cells take the base value.")
+    edited = st.data_editor(st.session_state["scenarios"], num_rows="dynamic", key="scenario_editor", hide_index=True)
+
+    scenarios = edited.dropna(subset=["Scenario"]).drop_duplicates(subset="Scenario").set_index("Scenario")
+    if scenarios.empty:
+        st.warning("Add at least one named scenario.")
+        return
+    base = BASE_SCENARIO if BASE_SCENARIO in scenarios.index else scenarios.index[0]
+    scenarios = scenarios.fillna(scenarios.loc[base])
+
+    evaluator = st.session_state.setdefault("scenario_evaluator", ScenarioEvaluator())
+    evaluator.discount_rate = st.session_state["discount_rate"] or 8.0
+    try:
+        results, computed = evaluator.evaluate(scenarios)
+    except ValueError as e:
+        st.error(str(e))
+        return
+    st.caption(f"Computed {len(computed)} new or changed scenario(s), reused {len(results) - len(computed)}.")
+    st.dataframe(results.T)
+    if len(results) > 1:
+        st.write(f"Change vs {base}:")
+        st.dataframe(scenario_diff(results, base).T)
+        st.plotly_chart(scenario_figure(scenario_diff(results, base, relative=True), SCENARIO_CHART_METRICS))
+
+with st.expander("Scenario Comparison (Optional)"):
+    scenario_comparison()
+
 # Insights Type
 insight_type = st.selectbox(
     "Select Insight Type",
@@ -156,145 +457,269 @@ chart_type = st.selectbox(
     "Select Chart Type", ["bar", "pie", "line"], key="chart_type"
 )
 
-# Function to plot metrics and save the graph
-def plot_metrics(metrics, chart_type="bar", save_path="chart.png"):
-    if not metrics or all(value == 0 for value in metrics.values()):
-        st.warning("No meaningful data to plot.")
-        return
+# Charts are drawn interactively with Plotly; PNGs are only rendered for saved deals and the PDF
+SAVED_CHART_DPI = 100
+
+# Rows of the Saved Deals table; the scatter plots every match
+SAVED_DEALS_TABLE_LIMIT = 500
+
+@st.cache_data
+def cached_deals_scatter(deal_count, max_dscr, min_cap_rate):
+    """
+    Number of screened deals and their scatter spec (None for fewer than two deals). The full
+    screen is only queried again when a deal is added (deal_count) or the filters change.
+    """
+    deals = DEAL_STORE.screen(max_dscr=max_dscr, min_cap_rate=min_cap_rate)
+    if len(deals) < 2:
+        return len(deals), None
+    return len(deals), scatter_figure(
+        deals["cap_rate"], deals["dscr"], "Saved Deals: Cap Rate vs DSCR", "Cap Rate (%)", "DSCR", text=deals["name"]
+    )
 
-    try:
-        fig, ax = plt.subplots(figsize=(10, 6))  # Adjust figure size for better readability
-
-        if chart_type == "bar":
-            ax.bar(metrics.keys(), metrics.values(), color='skyblue', edgecolor='black')
-            ax.set_title("Financial Metrics", fontsize=16, fontweight='bold')
-            ax.set_ylabel("Value ($)", fontsize=12)
-            ax.set_xlabel("Metrics", fontsize=12)
-            ax.set_xticks(range(len(metrics.keys())))
-            ax.set_xticklabels(metrics.keys(), rotation=45, ha="right", fontsize=10)
-            ax.grid(axis='y', linestyle='--', alpha=0.7)
-
-        elif chart_type == "pie":
-            if len(metrics) > 10:
-                st.warning("Too many metrics for a pie chart. Consider using a bar or line chart.")
-                return
-            ax.pie(metrics.values(), labels=metrics.keys(), autopct='%1.1f%%', startangle=90)
-            ax.set_title("Financial Metrics Distribution", fontsize=16, fontweight='bold')
-
-        elif chart_type == "line":
-            ax.plot(list(metrics.keys()), list(metrics.values()), marker='o', linestyle='-', linewidth=2)
-            ax.set_title("Financial Metrics Over Time", fontsize=16, fontweight='bold')
-            ax.set_ylabel("Value ($)", fontsize=12)
-            ax.set_xlabel("Metrics", fontsize=12)
-            ax.set_xticks(range(len(metrics.keys())))
-            ax.set_xticklabels(metrics.keys(), rotation=45, ha="right", fontsize=10)
-            ax.grid(axis='both', linestyle='--', alpha=0.7)
-
-        fig.tight_layout()  # Adjust layout to prevent label clipping
-        fig.savefig(save_path, format="png", dpi=300, bbox_inches="tight")
-        plt.close(fig)
-        st.image(save_path, caption="Generated Chart")
-    except Exception as e:
-        st.error(f"Error generating chart: {e}")
-
-# Function to generate PDF with graph
-def save_to_pdf_with_graph(metrics, insights, chart_image_path, file_name="UnderwritePro_Output.pdf"):
-    pdf = FPDF()
-    pdf.set_auto_page_break(auto=True, margin=15)
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-
-    # Title
-    pdf.set_font("Arial", style="B", size=16)
-    pdf.cell(200, 10, txt="UnderwritePro Output Report", ln=True, align="C")
-    pdf.ln(10)  # Add space
-
-    # Metrics Section
-    pdf.set_font("Arial", style="B", size=14)
-    pdf.cell(200, 10, txt="Calculated Metrics:", ln=True)
-    pdf.set_font("Arial", size=12)
-    for key, value in metrics.items():
-        pdf.cell(0, 10, txt=f"{key}: {value}", ln=True)
-
-    # Insights Section
-    if insights:
-        pdf.ln(10)
-        pdf.set_font("Arial", style="B", size=14)
-        pdf.cell(200, 10, txt="Generated Insights:", ln=True)
-        pdf.set_font("Arial", size=12)
-        pdf.multi_cell(0, 10, txt=insights)
-
-    # Add Graph
-    if chart_image_path:
-        with Image.open(chart_image_path) as img:
-            width, height = img.size
-            aspect_ratio = height / width
-
-        max_width = 180
-        img_width = max_width
-        img_height = max_width * aspect_ratio
-
-        max_height = 200
-        if img_height > max_height:
-            img_height = max_height
-            img_width = max_height / aspect_ratio
-
-        pdf.ln(10)
-        pdf.set_font("Arial", style="B", size=14)
-        pdf.cell(200, 10, txt="Visualization:", ln=True)
-        pdf.image(chart_image_path, x=10, y=None, w=img_width, h=img_height)
-
-    pdf.output(file_name)
-    return file_name
+@st.cache_data
+def cached_risk_simulation(income, expenses, debt_service, equity, holding_period):
+    """Run the seeded Monte Carlo simulation once per set of inputs."""
+    return simulate_risk(income, expenses, debt_service=debt_service, equity=equity, holding_period=holding_period)
 
 # Analyze button
 if st.button("Analyze"):
+    profiling_run = ProfilingRun("analyze", capture=capture_mode if capture_mode != "none" else None) if debug_timings else None
     try:
+        if profiling_run:
+            profiling_run.start()
+        data_ref = None
         if uploaded_file:
+            data_ref = f"{uploaded_file.name}:{file_cache_key(uploaded_file.getvalue())}"
             required_columns = ["Income", "Expenses"]
             optional_columns = ["Equity", "Debt Service", "Occupancy Rate", "Market Rent", "CapEx", "Year Built", "Units"]
-            result = parse_file(uploaded_file, required_columns, optional_columns)
-            st.session_state["data"] = result["data"]
-            st.write("Uploaded Data Preview:")
-            st.dataframe(st.session_state["data"].head())
+            # Reuse the previous parse while the same upload is analyzed again
+            combine_sheets = combine_sheets and uploaded_file.name.endswith(".xlsx")
+            upload_key = (getattr(uploaded_file, "file_id", uploaded_file.name), uploaded_file.size, combine_sheets)
+            if st.session_state.get("parsed_upload", (None, None))[0] == upload_key:
+                result = st.session_state["parsed_upload"][1]
+            elif combine_sheets:
+                result = parse_workbook(
+                    uploaded_file, None, required_columns, optional_columns + RENT_ROLL_OPTIONAL_COLUMNS,
+                    cache=PARSE_CACHE, listed_only=True, executor=workbook_executor(),
+                )
+            elif uploaded_file.size > STREAMING_THRESHOLD_BYTES:
+                result = summarize_file_streaming(uploaded_file, required_columns, optional_columns)
+            else:
+                result = parse_file(
+                    uploaded_file, required_columns, optional_columns + RENT_ROLL_OPTIONAL_COLUMNS,
+                    cache=PARSE_CACHE, listed_only=True,
+                )
+            st.session_state["parsed_upload"] = (upload_key, result)
+
+            if "rows" in result:
+                st.session_state["data"] = result["data"]
+                st.write(f"Large upload aggregated in chunks ({result['rows']:,} rows):")
+                st.dataframe(st.session_state["data"])
+                if result["invalid_values"]:
+                    st.warning(f"Non-numeric values treated as 0: {result['invalid_values']}")
+            else:
+                st.session_state["data"] = result["data"]
+                st.write("Uploaded Data Preview:")
+                st.dataframe(st.session_state["data"].head())
+                footprint = result["memory_footprint"]
+                st.caption(f"{len(st.session_state['data']):,} rows, {footprint['total_bytes'] / 1024 / 1024:.2f} MB in memory")
+
+                if "sheets" in result:
+                    # One property per sheet: underwrite every sheet in one vectorized batch
+                    st.write(f"Combined {len(result['sheets'])} sheets. Metrics per sheet:")
+                    st.dataframe(calculate_batch_metrics(sheets_to_portfolio(result["data"])))
+
+                if "Unit Type" in result["detected_columns"]:
+                    rent_roll = analyze_rent_roll(st.session_state["data"], market_rent=st.session_state["market_rent"])
+                    st.write("Rent Roll by Unit Type:")
+                    st.dataframe(rent_roll["summary"])
+                    st.write(f"Loss to Lease: ${rent_roll['loss_to_lease']['Loss to Lease ($/yr)']:,.2f}/yr "
+                             f"({rent_roll['loss_to_lease']['Loss to Lease (%)']}% of market rent)")
+                    st.write("Lease Expiration Ladder:")
+                    st.dataframe(rent_roll["lease_ladder"])
         else:
             st.session_state["data"] = pd.DataFrame({
                 "Income": [st.session_state["total_income"]],
                 "Expenses": [st.session_state["total_expenses"]]
             })
 
+        if st.session_state["unit_mix"]:
+            try:
+                unit_mix = parse_unit_mix(st.session_state["unit_mix"])
+                st.write("Unit Mix:")
+                st.dataframe(pd.DataFrame({"Unit Type": list(unit_mix), "Units": list(unit_mix.values())}))
+            except ValueError as e:
+                st.warning(str(e))
+
         additional_inputs_dict = {key: st.session_state[key] for key in additional_inputs}
-        st.session_state["metrics"] = calculate_metrics(st.session_state["data"], st.session_state["offer_price"], additional_inputs_dict)
+        additional_inputs_dict.update({name: st.session_state[key] for name, key in METRIC_INPUT_KEYS.items()})
+        st.session_state["metrics"] = calculate_metrics(
+            st.session_state["data"], st.session_state["offer_price"], additional_inputs_dict,
+            graph=st.session_state["metrics_graph"],
+        )
 
         st.write("Calculated Metrics:")
         st.json(st.session_state["metrics"])
 
-        if OPENAI_API_KEY:
-            insights = generate_insights(st.session_state["metrics"], model="gpt-4", insight_type=insight_type)
+        deal_inputs = {key: st.session_state[key] for key in basic_inputs + additional_inputs}
+        deal_inputs.update({"data_ref": data_ref, "comps_context": st.session_state.get("comps_context")})
+        saved_deal = DEAL_STORE.find_by_inputs(deal_inputs)
+        saved_name = deal_name or (uploaded_file.name if uploaded_file else f"Deal at ${st.session_state['offer_price']:,.0f}")
+
+        pro_forma_inputs = pd.DataFrame([{
+            "Offer Price": st.session_state["offer_price"],
+            "Income": st.session_state["data"]["Income"].sum(),
+            "Expenses": st.session_state["data"]["Expenses"].sum(),
+            "Equity": st.session_state["equity"],
+            "Debt Service": st.session_state["debt_service"],
+            "Interest Rate (%)": st.session_state["interest_rate"],
+            "Amortization (Years)": st.session_state["amortization_years"],
+            "Holding Period": st.session_state["holding_period"],
+            "Market Growth Rate": st.session_state["market_growth_rate"],
+            "Projected Cap Rate at Sale": st.session_state["projected_cap_rate_at_sale"],
+            "Renovation Cost": st.session_state["renovation_cost"],
+            "CapEx": st.session_state["capex"],
+        }])
+        st.write("Pro Forma Returns:")
+        st.json(run_pro_forma(pro_forma_inputs, discount_rate=st.session_state["discount_rate"]).iloc[0].to_dict())
+        projection = project_cash_flows(pro_forma_inputs)
+        st.dataframe(pro_forma_table(projection))
+        holding_years = int(projection["Holding Period"][0])
+        st.plotly_chart(series_figure(
+            np.arange(holding_years + 1),
+            {name: projection[name][0, :holding_years + 1] for name in ["NOI", "Debt Service", "Cash Flow"]},
+            "Pro Forma Cash Flows", "Year", "$",
+        ))
+
+        risk_summary = cached_risk_simulation(
+            float(st.session_state["data"]["Income"].sum()), float(st.session_state["data"]["Expenses"].sum()),
+            st.session_state["debt_service"], st.session_state["equity"], int(st.session_state["holding_period"]) or 5,
+        )
+        st.session_state["insight_contexts"] = {"risk analysis": format_simulation_summary(risk_summary)}
+        if st.session_state.get("comps_context"):
+            # Comps ground every insight type
+            st.session_state["insight_contexts"] = {
+                kind: "\n\n".join(filter(None, [st.session_state["insight_contexts"].get(kind), st.session_state["comps_context"]]))
+                for kind in INSIGHT_TYPES
+            }
+        if insight_type == "risk analysis":
+            st.write("Monte Carlo Risk Simulation:")
+            st.text(st.session_state["insight_contexts"]["risk analysis"])
+
+        # The LLM is only queried again when the metrics or the insight contexts changed
+        insights_key = InsightCache.key("gpt-4", "all", st.session_state["metrics"], st.session_state["insight_contexts"])
+        insights_future = st.session_state.get("insights_future")
+        if insights_future is not None and insights_future.done() and st.session_state.get("insights_future_key") == insights_key:
+            # The background generation of a previous run has finished
+            try:
+                st.session_state["insights"] = insights_future.result()
+                st.session_state["insights_key"] = insights_key
+            except Exception as e:
+                st.warning(f"Insights could not be generated: {e}")
+            st.session_state.pop("insights_future")
+            st.session_state.pop("insights_future_key")
+        if saved_deal and all(kind in saved_deal["insights"] for kind in INSIGHT_TYPES):
+            # A deal saved with the same inputs already has every insight
+            st.session_state["insights"] = saved_deal["insights"]
+            st.session_state["insights_key"] = insights_key
+        if OPENAI_API_KEY and st.session_state.get("insights_key") == insights_key:
+            st.write("LLM-Generated Insights:")
+            st.write(st.session_state["insights"][insight_type])
+        elif OPENAI_API_KEY:
+            # The selected insight streams in as it is generated; the rest are fetched in the background,
+            # saved with the deal when they arrive and shown from the insight cache on later runs
             st.write("LLM-Generated Insights:")
-            st.text(insights)
+            with timed_stage("stream_insights"):
+                st.write_stream(stream_insights(
+                    st.session_state["metrics"], model="gpt-4", insight_type=insight_type,
+                    context=st.session_state["insight_contexts"].get(insight_type),
+                    api_key=OPENAI_API_KEY, cache=INSIGHT_CACHE,
+                ))
+            if st.session_state.get("insights_future_key") != insights_key:
+                st.session_state["insights_future"] = insights_executor().submit(
+                    generate_and_save_insights, saved_name, deal_inputs, st.session_state["metrics"], data_ref,
+                    st.session_state["insight_contexts"],
+                )
+                st.session_state["insights_future_key"] = insights_key
         else:
             st.error("OpenAI API key not set. Please check your configuration.")
 
-        plot_metrics(st.session_state["metrics"], chart_type=chart_type)
+        try:
+            st.plotly_chart(metrics_figure(st.session_state["metrics"], chart_type=chart_type))
+            chart_png = render_chart(st.session_state["metrics"], chart_type=chart_type, dpi=SAVED_CHART_DPI)
+        except ValueError as e:
+            st.warning(str(e))
+            chart_png = None
+
+        DEAL_STORE.save_deal(
+            saved_name, deal_inputs, st.session_state["metrics"], data_ref=data_ref,
+            insights=st.session_state.get("insights") if st.session_state.get("insights_key") == insights_key else None,
+            charts={chart_type: chart_png} if chart_png else None,
+        )
 
     except Exception as e:
         st.error(f"Error during analysis: {e}")
 
+    if profiling_run:
+        profiling_run.stop()
+    if profiling_run and profiling_run.total_seconds is not None:
+        with st.expander(f"Debug timings ({profiling_run.total_seconds:.2f}s total)"):
+            if profiling_run.capture_skipped:
+                st.caption(f"Another session is already capturing, so no {profiling_run.capture} data for this run.")
+            st.dataframe(pd.DataFrame(profiling_run.breakdown()))
+            if profiling_run.profile_text:
+                st.text(profiling_run.profile_text)
+            if profiling_run.peak_memory_mb is not None:
+                st.write(f"Peak traced memory: {profiling_run.peak_memory_mb} MB")
+
 # Export to PDF
 if st.button("Export to PDF"):
     try:
         if st.session_state["metrics"]:
-            chart_path = "chart.png"
-            plot_metrics(st.session_state["metrics"], chart_type=st.session_state["chart_type"], save_path=chart_path)
-
-            insights_text = generate_insights(st.session_state["metrics"], model="gpt-4", insight_type=insight_type) if OPENAI_API_KEY else "Insights require a valid OpenAI API key."
-            pdf_file = save_to_pdf_with_graph(st.session_state["metrics"], insights_text, chart_path)
-
-            st.success(f"PDF generated successfully: {pdf_file}")
-            with open(pdf_file, "rb") as f:
-                st.download_button("Download PDF", f, file_name=pdf_file)
+            try:
+                chart_png = render_chart(st.session_state["metrics"], chart_type=st.session_state["chart_type"])
+            except ValueError:
+                chart_png = None  # Nothing meaningful to plot; the report is generated without a chart
+
+            insights_text = generate_insights(
+                st.session_state["metrics"], model="gpt-4", insight_type=insight_type,
+                context=st.session_state.get("insight_contexts", {}).get(insight_type), cache=INSIGHT_CACHE,
+            ) if OPENAI_API_KEY else "Insights require a valid OpenAI API key."
+            pdf_bytes = build_pdf_report(st.session_state["metrics"], insights_text, chart_png)
+
+            st.success("PDF generated successfully.")
+            st.download_button("Download PDF", pdf_bytes, file_name="UnderwritePro_Output.pdf", mime="application/pdf")
         else:
             st.error("No metrics to export. Perform analysis first.")
     except Exception as e:
         st.error(f"Failed to generate PDF: {e}")
+
+
+# Saved Deals: screen every analyzed deal on its indexed metrics and reload one without rerunning it
+with st.expander("Saved Deals"):
+    max_dscr = st.number_input("DSCR below (0 = any)", min_value=0.0, value=0.0, step=0.05, key="screen_max_dscr")
+    min_cap_rate = st.number_input("Cap Rate at least (%) (0 = any)", min_value=0.0, value=0.0, step=0.25, key="screen_min_cap_rate")
+    deal_count = DEAL_STORE.count()
+    match_count, deals_scatter = cached_deals_scatter(deal_count, max_dscr or None, min_cap_rate or None)
+    st.caption(f"{match_count:,} of {deal_count:,} saved deals match")
+    if deals_scatter is not None:
+        st.plotly_chart(deals_scatter)
+    saved_deals = DEAL_STORE.screen(max_dscr=max_dscr or None, min_cap_rate=min_cap_rate or None, limit=SAVED_DEALS_TABLE_LIMIT)
+    st.dataframe(saved_deals)
+    if not saved_deals.empty:
+        deal_names = dict(zip(saved_deals["id"], saved_deals["name"]))
+        selected_deal = st.selectbox("Deal", list(deal_names), format_func=lambda deal_id: f"{deal_names[deal_id]} (#{deal_id})")
+        if st.button("Load Deal"):
+            st.session_state["load_deal_id"] = int(selected_deal)
+            st.rerun()
+
+    loaded_deal = st.session_state.get("loaded_deal")
+    if loaded_deal is not None:
+        st.write(f"Loaded: {loaded_deal['name']} (saved {loaded_deal['updated_at']})")
+        if loaded_deal["data_ref"]:
+            st.caption(f"Analyzed with upload {loaded_deal['data_ref']}")
+        st.json(loaded_deal["metrics"])
+        if loaded_deal["insights"].get(insight_type):
+            st.write(loaded_deal["insights"][insight_type])
+        for chart_png in loaded_deal["charts"].values():
+            st.image(chart_png, caption="Saved Chart")
@@ -0,0 +1,259 @@
+"""
+Reproducible benchmarks for parsing, metrics, charting and PDF export.
+
+    python benchmark.py --sizes 1000 100000 1000000 --formats csv xlsx -o bench_results/current.json
+    python benchmark.py --sizes 1000 --compare bench_results/previous.json
+
+Every stage is timed on its own run and measured for peak traced memory on a second run, so
+tracemalloc overhead never leaks into the timings. Results are saved as JSON for comparison
+between versions.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from utils.calculations import calculate_batch_metrics, calculate_metrics
+from utils.data_processing import parse_file, summarize_file_streaming
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+EXCEL_MAX_ROWS = 1_048_575  # Sheet limit minus the header row
+UNIT_TYPES = ["Studio", "1B1B", "2B1B", "2B2B", "3B2B"]
+
+
+def generate_rent_roll(n_rows, seed=0):
+    """
+    Build a synthetic rent roll with one row per unit.
+
+    Args:
+        n_rows: Number of units.
+        seed: Random seed, so the same size always yields the same data.
+
+    Returns:
+        DataFrame: Unit, Unit Type, Tenant, Income, Expenses, Market Rent, Occupied,
+                   Lease Start and Lease End columns.
+    """
+    rng = np.random.default_rng(seed)
+    unit_type = rng.choice(UNIT_TYPES, n_rows)
+    base_rent = pd.Series(unit_type).map(dict(zip(UNIT_TYPES, [1_100, 1_400, 1_700, 1_950, 2_400]))).to_numpy()
+    rent = np.round(base_rent * rng.normal(1.0, 0.08, n_rows), 2)
+    lease_start = pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 730, n_rows), unit="D")
+    return pd.DataFrame({
+        "Unit": np.arange(1, n_rows + 1),
+        "Unit Type": unit_type,
+        "Tenant": [f"Tenant {i}" for i in range(n_rows)],
+        "Income": rent * 12,
+        "Expenses": np.round(rent * 12 * rng.uniform(0.3, 0.5, n_rows), 2),
+        "Market Rent": np.round(base_rent * 1.05, 2),
+        "Occupied": rng.random(n_rows) < 0.94,
+        "Lease Start": lease_start,
+        "Lease End": lease_start + pd.DateOffset(years=1),
+    })
+
+
+class _NamedBytes(io.BytesIO):
+    """In-memory upload with the `name` attribute parse_file expects."""
+
+    def __init__(self, payload, name):
+        super().__init__(payload)
+        self.name = name
+
+
+def write_rent_roll(frame, file_format):
+    """Serialise a rent roll to CSV or XLSX bytes."""
+    if file_format == "csv":
+        return frame.to_csv(index=False).encode("utf-8")
+    buffer = io.BytesIO()
+    frame.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def measure(fn, repeat=1):
+    """
+    Time `fn` (best of `repeat` runs), then run it once more under tracemalloc for peak memory.
+
+    Returns:
+        dict: 'seconds' and 'peak_mb'.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": min(timings), "peak_mb": peak / 1024 / 1024}
+
+
+def _result(stage, file_format, rows, measurement):
+    seconds = measurement["seconds"]
+    return {
+        "stage": stage,
+        "format": file_format,
+        "rows": rows,
+        "seconds": round(seconds, 6),
+        "peak_mb": round(measurement["peak_mb"], 3),
+        "rows_per_second": round(rows / seconds, 1) if seconds > 0 else None,
+    }
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, formats=("csv", "xlsx"), repeat=1, include_render=True, seed=0):
+    """
+    Benchmark every pipeline stage over the given rent roll sizes and file formats.
+
+    Returns:
+        list: One result dictionary per (stage, format, rows).
+    """
+    results = []
+    for rows in sizes:
+        frame = generate_rent_roll(rows, seed)
+        for file_format in formats:
+            if file_format == "xlsx" and rows > EXCEL_MAX_ROWS:
+                print(f"Skipping xlsx with {rows:,} rows: above Excel's sheet limit.")
+                continue
+            payload = write_rent_roll(frame, file_format)
+            name = f"rent_roll.{file_format}"
+
+            measurement = measure(lambda: parse_file(_NamedBytes(payload, name), ["Income", "Expenses"]), repeat)
+            results.append(_result("parse_file", file_format, rows, measurement))
+            print(_summary_line(results[-1]))
+
+            measurement = measure(lambda: summarize_file_streaming(_NamedBytes(payload, name), ["Income", "Expenses"]), repeat)
+            results.append(_result("summarize_file_streaming", file_format, rows, measurement))
+            print(_summary_line(results[-1]))
+
+        # Metric stages work on in-memory frames, independent of the file format
+        data = frame[["Income", "Expenses"]]
+        measurement = measure(lambda: calculate_metrics(data, 5_000_000, {"Number of Units": rows}), repeat)
+        results.append(_result("calculate_metrics", "memory", rows, measurement))
+        print(_summary_line(results[-1]))
+
+        portfolio = pd.DataFrame({
+            "Offer Price": frame["Income"] * 12,
+            "Income": frame["Income"],
+            "Expenses": frame["Expenses"],
+            "Number of Units": 1,
+            "Market Rent": frame["Market Rent"],
+        })
+        measurement = measure(lambda: calculate_batch_metrics(portfolio), repeat)
+        results.append(_result("calculate_batch_metrics", "memory", rows, measurement))
+        print(_summary_line(results[-1]))
+
+    if include_render:
+        results.extend(_benchmark_rendering(repeat))
+    return results
+
+
+def _benchmark_rendering(repeat):
+    """Chart and PDF stages depend on the number of metrics, not rows; benchmark them once."""
+    from utils.reporting import build_pdf_report
+    from utils.visualization import _render_chart_cached, render_chart
+
+    metrics = calculate_metrics(pd.DataFrame({"Income": [480_000.0], "Expenses": [210_000.0]}), 4_000_000, {
+        "Equity": 1_000_000, "Debt Service": 150_000, "Number of Units": 24, "Market Rent": 1_900,
+    })
+    results = []
+    for chart_type in ["bar", "pie", "line"]:
+        chart_metrics = dict(list(metrics.items())[:8]) if chart_type == "pie" else metrics
+
+        def render_uncached():
+            _render_chart_cached.cache_clear()
+            render_chart(chart_metrics, chart_type=chart_type, dpi=300)
+
+        results.append(_result(f"render_chart[{chart_type}]", "png", 1, measure(render_uncached, repeat)))
+        print(_summary_line(results[-1]))
+
+    chart_png = render_chart(metrics, chart_type="bar", dpi=300)
+    insights = "Stable NOI with moderate leverage. " * 40
+    results.append(_result("build_pdf_report", "pdf", 1, measure(lambda: build_pdf_report(metrics, insights, chart_png), repeat)))
+    print(_summary_line(results[-1]))
+    return results
+
+
+def _summary_line(result):
+    return (f"{result['stage']:<28} {result['format']:<7} {result['rows']:>11,} rows "
+            f"{result['seconds']:>10.4f}s {result['peak_mb']:>10.2f} MB")
+
+
+def environment():
+    """Versions and machine details stored with every result file."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(current, previous):
+    """
+    Compare two benchmark result lists on matching (stage, format, rows).
+
+    Returns:
+        list: One dictionary per matching entry with both timings and the ratio current/previous.
+    """
+    previous_by_key = {(r["stage"], r["format"], r["rows"]): r for r in previous}
+    comparison = []
+    for result in current:
+        old = previous_by_key.get((result["stage"], result["format"], result["rows"]))
+        if old and old["seconds"] > 0:
+            comparison.append({
+                "stage": result["stage"], "format": result["format"], "rows": result["rows"],
+                "previous_seconds": old["seconds"], "seconds": result["seconds"],
+                "ratio": round(result["seconds"] / old["seconds"], 3),
+            })
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark parsing, metrics, charting and PDF export.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Rent roll sizes in rows (up to 10M).")
+    parser.add_argument("--formats", nargs="+", choices=["csv", "xlsx"], default=["csv", "xlsx"])
+    parser.add_argument("--repeat", type=int, default=1, help="Timed runs per stage (best is kept).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-render", action="store_true", help="Skip the chart and PDF stages.")
+    parser.add_argument("-o", "--output", default=os.path.join("bench_results", "results.json"))
+    parser.add_argument("--compare", default=None, help="Earlier results JSON to compare against.")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes, args.formats, args.repeat, not args.skip_render, args.seed)
+    report = {"environment": environment(), "results": results}
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            report["comparison"] = compare(results, json.load(f)["results"])
+        for entry in report["comparison"]:
+            print(f"{entry['stage']:<28} {entry['format']:<7} {entry['rows']:>11,} rows  x{entry['ratio']:.3f}")
+
+    output_dir = os.path.dirname(args.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {len(results)} results to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Headless batch underwriting.
+
+Underwrites a CSV/XLSX portfolio with one row per deal and writes the metrics to Parquet or CSV,
+without importing Streamlit, matplotlib, OpenAI or FPDF:
+
+    python cli.py portfolio.csv -o results.parquet
+    python cli.py portfolio.xlsx -o results.csv --pro-forma --discount-rate 9
+    python cli.py properties.xlsx -o results.csv --sheets          # one property per sheet
+    python cli.py properties.xlsx -o results.csv --sheets "Elm St" "Oak Ave"
+"""
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+from utils.calculations import calculate_batch_metrics
+from utils.data_processing import parse_file, parse_workbook, sheets_to_portfolio
+from utils.parse_cache import ParseCache
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Underwrite a portfolio file (one row per deal) without the Streamlit UI.")
+    parser.add_argument("input", help="Portfolio file (.csv or .xlsx), one row per deal.")
+    parser.add_argument("-o", "--output", required=True, help="Output file (.parquet or .csv).")
+    parser.add_argument("--pro-forma", action="store_true", help="Also project cash flows and add IRR, equity multiple and NPV.")
+    parser.add_argument("--discount-rate", type=float, default=8.0, help="Discount rate in %% for NPV (default: 8).")
+    parser.add_argument("--cache-dir", default=None, help="Reuse parsed inputs from this parse cache directory.")
+    parser.add_argument("--sheets", nargs="*", default=None,
+                        help="Treat each workbook sheet as one property, summing its rows (all sheets when no names are given).")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes for parsing sheets (default: CPU count for large workbooks, 1 otherwise).")
+    return parser
+
+
+def underwrite_file(input_path, pro_forma=False, discount_rate=8.0, cache_dir=None, sheets=None, max_workers=None):
+    """
+    Underwrite every deal of a portfolio file.
+
+    Args:
+        input_path: Path to a .csv or .xlsx file with one row per deal.
+        pro_forma: Whether to add the pro forma return columns.
+        discount_rate: Discount rate in % used for NPV.
+        cache_dir: Parse cache directory (optional).
+        sheets: Workbook sheets to underwrite as one property each; an empty list means all sheets.
+                When None, the first sheet is read with one row per deal.
+        max_workers: Worker processes used to parse the sheets.
+
+    Returns:
+        DataFrame: The input columns followed by the calculated metrics; input columns that share
+                   a metric's name are suffixed with " (input)".
+    """
+    cache = ParseCache(cache_dir=cache_dir) if cache_dir else None
+    with open(input_path, "rb") as f:
+        if sheets is None:
+            portfolio = parse_file(f, required_columns=["Income", "Expenses"], cache=cache)["data"]
+        else:
+            workbook = parse_workbook(f, sheets or None, required_columns=["Income", "Expenses"], cache=cache,
+                                      max_workers=max_workers)
+            portfolio = sheets_to_portfolio(workbook["data"]).reset_index()
+
+    results = [calculate_batch_metrics(portfolio)]
+    if pro_forma:
+        from utils.proforma import run_pro_forma
+
+        results.append(run_pro_forma(portfolio, discount_rate=discount_rate))
+    computed = pd.concat(results, axis=1)
+    # An input column named like a metric (e.g. a precomputed "Cap Rate (%)") is kept as "<name> (input)",
+    # so the output has unique column names (Parquet requires them)
+    overlap = portfolio.columns.intersection(computed.columns)
+    portfolio = portfolio.rename(columns={col: f"{col} (input)" for col in overlap})
+    return pd.concat([portfolio, computed], axis=1)
+
+
+def write_results(results, output_path):
+    """Write results as Parquet or CSV depending on the output file extension."""
+    extension = os.path.splitext(output_path)[1].lower()
+    if extension == ".parquet":
+        results.to_parquet(output_path, index=False)
+    elif extension == ".csv":
+        results.to_csv(output_path, index=False)
+    else:
+        raise ValueError("Unsupported output format. Please use .parquet or .csv.")
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    start = time.perf_counter()
+    try:
+        results = underwrite_file(args.input, args.pro_forma, args.discount_rate, args.cache_dir, args.sheets, args.workers)
+        write_results(results, args.output)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print(f"Underwrote {len(results):,} deals in {time.perf_counter() - start:.2f}s -> {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,362 @@
+"""
+Local HTTP underwriting service.
+
+    python server.py --port 8000 --workers 4
+
+Endpoints:
+    POST /underwrite  One deal (flat JSON object) or {"deals": [...]}, using the calculate_batch_metrics
+                      column names ("Offer Price", "Income", "Expenses", "Equity", ...); Income and Expenses
+                      are required and every field must be a number.
+    POST /insights    {"metrics": {...}, "insight_type": "general", "model": "gpt-4"}, or
+                      {"properties": {"name": {...}, ...}, ...} to analyze many properties per request;
+                      needs an API key, and --llm-base-url can point at a local stub.
+    GET  /metrics     Request counts, p50/p99 latency per route and micro-batch sizes.
+    GET  /health      Liveness check.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+
+import numpy as np
+
+LATENCY_WINDOW = 10_000  # Most recent requests kept per route for percentile stats
+MAX_BODY_BYTES = 10 * 1024 * 1024
+REQUIRED_DEAL_FIELDS = ["Income", "Expenses"]
+ROUTES = {("GET", "/health"), ("GET", "/metrics"), ("POST", "/underwrite"), ("POST", "/insights")}
+UNMATCHED_ROUTE = "unmatched"  # Stats key of every other path, so arbitrary URLs do not grow the stats
+
+
+def _underwrite_rows(rows):
+    """Worker entry point: underwrite a micro-batch of deals in one vectorized call."""
+    import pandas as pd
+
+    from utils.calculations import calculate_batch_metrics
+
+    metrics = calculate_batch_metrics(pd.DataFrame(rows))
+    return metrics.to_dict("records")
+
+
+def _coerce_deal(deal, fields):
+    """
+    Numeric inputs of one deal, keeping only `fields` (null fields are left to their defaults).
+
+    Raises:
+        ValueError: A required field is missing or a field is not a finite number.
+    """
+    missing = [field for field in REQUIRED_DEAL_FIELDS if field not in deal]
+    if missing:
+        raise ValueError(f"Missing required field(s): {', '.join(missing)}.")
+    row = {}
+    for field in fields:
+        value = deal.get(field)
+        if value is None:
+            continue
+        try:
+            if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+                raise ValueError
+            number = float(value)
+            if not math.isfinite(number):
+                raise ValueError
+        except ValueError:
+            raise ValueError(f"Field '{field}' must be a finite number, got {json.dumps(value)}.")
+        row[field] = number
+    return row
+
+
+class MicroBatcher:
+    """
+    Collects deals from concurrent requests and underwrites them together.
+
+    The first deal to arrive opens a batch; the batch is flushed when it reaches
+    `max_batch_rows` deals or `max_wait_ms` has passed, and runs on `executor`.
+    """
+
+    def __init__(self, executor, max_batch_rows=512, max_wait_ms=5.0):
+        self.executor = executor
+        self.max_batch_rows = max_batch_rows
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+        self.batch_sizes = deque(maxlen=LATENCY_WINDOW)
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def submit(self, rows):
+        """Underwrite `rows` as part of the next micro-batch and return their metrics."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((rows, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self.queue.get()]
+            size = len(pending[0][0])
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch_rows:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                pending.append(item)
+                size += len(item[0])
+            loop.create_task(self._flush(pending))
+
+    async def _flush(self, pending):
+        rows = [row for request_rows, _ in pending for row in request_rows]
+        self.batch_sizes.append(len(rows))
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self.executor, _underwrite_rows, rows)
+        except Exception as e:
+            if len(pending) > 1:
+                # A request that fails must not fail the others sharing its batch: evaluate each alone
+                await asyncio.gather(*[self._flush_request(request_rows, future) for request_rows, future in pending])
+                return
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        start = 0
+        for request_rows, future in pending:
+            if not future.done():
+                future.set_result(results[start:start + len(request_rows)])
+            start += len(request_rows)
+
+    async def _flush_request(self, rows, future):
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self.executor, _underwrite_rows, rows)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(results)
+
+
+class UnderwritingService:
+    """asyncio HTTP/1.1 server exposing the underwriting logic as JSON endpoints."""
+
+    def __init__(self, host="127.0.0.1", port=8000, max_workers=None, max_batch_rows=512, max_wait_ms=5.0,
+                 llm_options=None):
+        self.host = host
+        self.port = port
+        # max_workers=0 runs the numeric work on the event loop's default thread pool instead of processes
+        self.max_workers = (os.cpu_count() or 1) if max_workers is None else max_workers
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers) if self.max_workers != 0 else None
+        self.batcher = MicroBatcher(self.executor, max_batch_rows, max_wait_ms)
+        self.llm_options = llm_options or {}
+        self.latencies = {}
+        self.counts = {}
+        self.server = None
+
+    async def start(self):
+        if self.executor:
+            # Import pandas/NumPy in every worker up front so the first requests do not pay for it
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*[
+                loop.run_in_executor(self.executor, _underwrite_rows, [{}])
+                for _ in range(self.max_workers)
+            ])
+        self.batcher.start()
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        await self.batcher.stop()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.executor:
+            self.executor.shutdown(cancel_futures=True)
+
+    async def serve_forever(self):
+        await self.start()
+        print(f"Underwriting service listening on http://{self.host}:{self.port}")
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+    def _record(self, route, status, seconds):
+        key = f"{route} {int(status)}"
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.latencies.setdefault(route, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+    def stats(self):
+        """Request counts, latency percentiles (ms) per route and micro-batch sizes."""
+        routes = {}
+        for route, samples in self.latencies.items():
+            values = np.fromiter(samples, dtype="float64") * 1000
+            routes[route] = {
+                "requests": len(values),
+                "p50_ms": round(float(np.percentile(values, 50)), 3),
+                "p99_ms": round(float(np.percentile(values, 99)), 3),
+                "max_ms": round(float(values.max()), 3),
+            }
+        batch_sizes = list(self.batcher.batch_sizes)
+        return {
+            "routes": routes,
+            "responses": self.counts,
+            "batches": {
+                "count": len(batch_sizes),
+                "mean_rows": round(float(np.mean(batch_sizes)), 2) if batch_sizes else 0,
+                "max_rows": max(batch_sizes, default=0),
+            },
+        }
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                except ValueError:
+                    await self._send(writer, HTTPStatus.BAD_REQUEST, {"error": "Malformed request line."}, keep_alive=False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get("content-length", 0) or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self._send(writer, HTTPStatus.BAD_REQUEST, {"error": "Invalid Content-Length."}, keep_alive=False)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self._send(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "Request body too large."}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                keep_alive = headers.get("connection", "").lower() != "close"
+
+                start = time.perf_counter()
+                path = path.split("?", 1)[0]
+                status, payload = await self._dispatch(method, path, body)
+                await self._send(writer, status, payload, keep_alive)
+                route = f"{method} {path}" if (method, path) in ROUTES else UNMATCHED_ROUTE
+                self._record(route, status, time.perf_counter() - start)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _send(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload).encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def _dispatch(self, method, path, body):
+        try:
+            if method == "GET" and path == "/health":
+                return HTTPStatus.OK, {"status": "ok"}
+            if method == "GET" and path == "/metrics":
+                return HTTPStatus.OK, self.stats()
+            if method == "POST" and path == "/underwrite":
+                return await self._underwrite(json.loads(body or b"{}"))
+            if method == "POST" and path == "/insights":
+                return await self._insights(json.loads(body or b"{}"))
+            return HTTPStatus.NOT_FOUND, {"error": f"No route for {method} {path}."}
+        except json.JSONDecodeError as e:
+            return HTTPStatus.BAD_REQUEST, {"error": f"Invalid JSON: {e}"}
+        except ValueError as e:
+            return HTTPStatus.UNPROCESSABLE_ENTITY, {"error": str(e)}
+        except Exception as e:
+            # One bad request must not take down the connection handler
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"Internal error: {e}"}
+
+    async def _underwrite(self, payload):
+        from utils.calculations import BATCH_INPUT_COLUMNS
+
+        deals = payload.get("deals") if isinstance(payload, dict) and "deals" in payload else [payload]
+        if not isinstance(deals, list) or not deals or not all(isinstance(deal, dict) for deal in deals):
+            return HTTPStatus.BAD_REQUEST, {"error": "Expected a deal object or {\"deals\": [...]}."}
+        # Validated before queueing, so a malformed deal is rejected on its own instead of in its batch
+        rows = []
+        for position, deal in enumerate(deals):
+            try:
+                rows.append(_coerce_deal(deal, BATCH_INPUT_COLUMNS))
+            except ValueError as e:
+                prefix = f"Deal {position}: " if len(deals) > 1 else ""
+                return HTTPStatus.BAD_REQUEST, {"error": f"{prefix}{e}"}
+        results = await self.batcher.submit(rows)
+        if isinstance(payload, dict) and "deals" in payload:
+            return HTTPStatus.OK, {"metrics": results}
+        return HTTPStatus.OK, {"metrics": results[0]}
+
+    async def _insights(self, payload):
+        from utils.async_insights import AsyncInsightsClient
+        from utils.llm_analysis import INSIGHT_TYPES
+
+        if not isinstance(payload, dict):
+            return HTTPStatus.BAD_REQUEST, {"error": "Expected a JSON object."}
+        metrics = payload.get("metrics")
+        properties = payload.get("properties")
+        insight_type = payload.get("insight_type", "general")
+        if insight_type not in INSIGHT_TYPES or not (isinstance(metrics, dict) or isinstance(properties, dict)):
+            return HTTPStatus.BAD_REQUEST, {"error": f"Expected metrics or properties and an insight_type in {INSIGHT_TYPES}."}
+        if isinstance(properties, dict) and not all(isinstance(value, dict) for value in properties.values()):
+            return HTTPStatus.BAD_REQUEST, {"error": "Expected properties to map each property name to a metrics object."}
+        client = AsyncInsightsClient(**self.llm_options)
+        if isinstance(properties, dict):
+            insights = await client.generate_batch(properties, payload.get("model", "gpt-4"), insight_type)
+            return HTTPStatus.OK, {"insight_type": insight_type, "insights": insights}
+        insights = await client.generate_many(metrics, payload.get("model", "gpt-4"), [insight_type], payload.get("contexts"))
+        return HTTPStatus.OK, {"insight_type": insight_type, "insights": insights[insight_type]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the local underwriting HTTP service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count; 0 uses threads).")
+    parser.add_argument("--max-batch", type=int, default=512, help="Maximum deals per micro-batch.")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0, help="Longest a deal waits for its batch to fill.")
+    parser.add_argument("--llm-base-url", default=None, help="OpenAI-compatible base URL, e.g. a local stub.")
+    args = parser.parse_args(argv)
+
+    llm_options = {"base_url": args.llm_base_url} if args.llm_base_url else {}
+    service = UnderwritingService(args.host, args.port, args.workers, args.max_batch, args.max_wait_ms, llm_options)
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.calculations import calculate_batch_metrics, calculate_metrics
+
+
+def _portfolio(n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "Offer Price": rng.uniform(0, 5_000_000, n),
+        "Income": rng.uniform(0, 600_000, n),
+        "Expenses": rng.uniform(0, 400_000, n),
+        "Equity": rng.choice([0, 250_000, 1_000_000], n),
+        "Debt Service": rng.choice([0, 120_000, 300_000], n),
+        "Market Rent": rng.choice([0, 1_500, 2_200], n),
+        "Number of Units": rng.integers(0, 80, n),
+        "Parking Income": rng.uniform(0, 5_000, n),
+        "Laundry Income": rng.uniform(0, 3_000, n),
+        "Rent Variation": rng.integers(-50, 50, n),
+        "Expense Variation": rng.integers(-50, 50, n),
+        "Benchmark Cap Rate (%)": rng.choice([0, 5.5, 7.25], n),
+    })
+
+
+def test_batch_metrics_match_scalar():
+    portfolio = _portfolio()
+    batch = calculate_batch_metrics(portfolio)
+
+    for idx, row in portfolio.iterrows():
+        data = pd.DataFrame({"Income": [row["Income"]], "Expenses": [row["Expenses"]]})
+        additional_inputs = row.drop(["Offer Price", "Income", "Expenses"]).to_dict()
+        expected = calculate_metrics(data, row["Offer Price"], additional_inputs)
+        assert list(batch.columns) == list(expected)
+        np.testing.assert_allclose(batch.loc[idx].to_numpy(), list(expected.values()), atol=0.011)
+
+
+def test_batch_metrics_defaults_missing_columns():
+    batch = calculate_batch_metrics(pd.DataFrame({"Income": [100.0], "Expenses": [40.0]}))
+    assert batch.loc[0, "NOI"] == 60.0
+    assert batch.loc[0, "Cap Rate (%)"] == 0.0
+
+
+def test_sensitivity_grid_matches_adjusted_noi():
+    from utils.sensitivity import RENT_AXIS, EXPENSE_AXIS, GROWTH_AXIS, build_sensitivity_grid, sensitivity_point
+
+    data = pd.DataFrame({"Income": [480_000.0], "Expenses": [210_000.0]})
+    grid = build_sensitivity_grid(480_000.0, 210_000.0, 4_000_000.0, equity=1_000_000.0, debt_service=150_000.0)
+    for rent_variation, expense_variation in [(-20, 10), (15, -5), (0, 0)]:
+        expected = calculate_metrics(data, 4_000_000.0, {
+            "Rent Variation": rent_variation, "Expense Variation": expense_variation,
+        })
+        point = sensitivity_point(grid, {RENT_AXIS: rent_variation, EXPENSE_AXIS: expense_variation})
+        assert round(point["NOI"], 2) == expected["Adjusted NOI ($)"]
+
+    # Market growth compounds income and expenses alike
+    grown = build_sensitivity_grid(480_000.0, 210_000.0, 4_000_000.0, growth_rates=[0.0, 3.0], years=5)
+    point = sensitivity_point(grown, {GROWTH_AXIS: 3.0})
+    assert round(point["NOI"], 2) == round((480_000.0 - 210_000.0) * 1.03 ** 5, 2)
+
+
+def test_risk_simulation_is_reproducible():
+    from utils.simulation import simulate_portfolio_risk, simulate_risk
+
+    first = simulate_risk(500_000, 250_000, debt_service=180_000, equity=1_000_000, n_scenarios=20_000, seed=7, chunk_size=3_000)
+    second = simulate_risk(500_000, 250_000, debt_service=180_000, equity=1_000_000, n_scenarios=20_000, seed=7, chunk_size=3_000)
+    assert first == second
+    assert 0 <= first["Probability DSCR < 1.0"] <= 1
+
+    portfolio = pd.DataFrame({"Income": [500_000, 800_000], "Expenses": [250_000, 300_000], "Debt Service": [180_000, 0]})
+    serial = simulate_portfolio_risk(portfolio, seed=7, n_scenarios=5_000)
+    pooled = simulate_portfolio_risk(portfolio, seed=7, n_scenarios=5_000, max_workers=2)
+    pd.testing.assert_frame_equal(serial, pooled)
+
+
+def test_profiling_run_collects_stage_breakdown():
+    from utils import profiling
+
+    data = pd.DataFrame({"Income": [480_000.0], "Expenses": [210_000.0]})
+    calculate_metrics(data, 4_000_000, {})  # No run active: nothing is recorded
+
+    with profiling.ProfilingRun("test") as run:
+        calculate_metrics(data, 4_000_000, {})
+        calculate_metrics(data, 4_000_000, {})
+        with profiling.timed_stage("custom"):
+            pass
+
+    stages = {row["stage"]: row for row in run.breakdown()}
+    assert stages["calculate_metrics"]["calls"] == 2
+    assert set(stages) == {"calculate_metrics", "custom"}
+    assert run.total_seconds >= stages["calculate_metrics"]["seconds"]
+
+
+def test_only_one_profiling_run_captures_at_a_time(monkeypatch):
+    from utils import profiling
+
+    with profiling.ProfilingRun("first", capture="tracemalloc") as first:
+        # cProfile and tracemalloc are process-wide: a concurrent run keeps its timings but skips the capture
+        with profiling.ProfilingRun("second", capture="cprofile") as second:
+            with profiling.timed_stage("inner"):
+                pass
+    assert first.peak_memory_mb is not None and not first.capture_skipped
+    assert second.capture_skipped and second.profile_text is None
+    assert [row["stage"] for row in second.breakdown()] == ["inner"]
+
+    # A capture that fails to start releases the lock and leaves nothing for stop() to undo
+    def fail(self):
+        raise ValueError("Another profiling tool is already active")
+    monkeypatch.setattr(profiling.cProfile.Profile, "enable", fail)
+    broken = profiling.ProfilingRun("broken", capture="cprofile")
+    with pytest.raises(ValueError):
+        broken.start()
+    assert broken.stop().total_seconds is None
+    monkeypatch.undo()
+    with profiling.ProfilingRun("third", capture="cprofile") as third:
+        pass
+    assert not third.capture_skipped and third.profile_text
+
+
+def test_metric_graph_recomputes_only_affected_nodes():
+    from utils.calculations import METRICS_GRAPH
+
+    graph = METRICS_GRAPH.copy()
+    inputs = {name: 0 for name in graph.inputs}
+    inputs.update({"Income": 480_000.0, "Expenses": 210_000.0, "Offer Price": 4_000_000, "Laundry Income": 1_000})
+
+    _, recomputed = graph.evaluate(inputs)
+    assert recomputed == list(graph.nodes)
+    _, recomputed = graph.evaluate(inputs)
+    assert recomputed == []
+
+    inputs["Laundry Income"] = 2_500
+    values, recomputed = graph.evaluate(inputs)
+    assert recomputed == ["Laundry Income ($)", "Other Income ($)"]
+    assert values["Other Income ($)"] == 2_500
+
+    data = pd.DataFrame({"Income": [480_000.0], "Expenses": [210_000.0]})
+    assert calculate_metrics(data, 4_000_000, {"Laundry Income": 2_500}, graph=graph)["Cap Rate (%)"] == 6.75
+
+    # Another session's graph keeps its own memo, so interleaved sessions do not evict each other
+    other = METRICS_GRAPH.copy()
+    other_inputs = {**inputs, "Income": 900_000.0}
+    other.evaluate(other_inputs)
+    assert graph.evaluate(inputs)[1] == [] and other.evaluate(other_inputs)[1] == []
+
+
+def test_comps_index_nearest_and_persisted(tmp_path):
+    from utils.comps import CompsIndex, comp_benchmarks
+
+    comps = pd.DataFrame({
+        "Property": ["Near", "Far", "Old", "Huge"],
+        "Latitude": [40.71, 34.05, 40.71, 40.72],
+        "Longitude": [-74.00, -118.24, -74.01, -74.00],
+        "Year Built": [1990, 1990, 1900, 1991],
+        "Units": [100, 100, 100, 3_000],
+        "Price Per Unit": [250_000, 300_000, 150_000, 400_000],
+        "Cap Rate (%)": [5.0, 4.5, 7.0, 4.0],
+        "Market Rent": [2_400, 2_800, 1_700, 3_100],
+    })
+    index = CompsIndex(comps)
+    nearest = index.query(40.7128, -74.006, 1992, 110, k=3)
+    assert nearest["Property"].tolist() == ["Near", "Huge", "Old"]
+    assert nearest["Distance"].is_monotonic_increasing
+
+    benchmarks = comp_benchmarks(nearest.head(1))
+    assert benchmarks["Benchmark Cap Rate (%)"] == 5.0 and benchmarks["Market Rent"] == 2_400
+
+    index.save(str(tmp_path))
+    loaded = CompsIndex.load(str(tmp_path))
+    pd.testing.assert_frame_equal(loaded.query(40.7128, -74.006, 1992, 110, k=3), nearest)
+    assert CompsIndex.load(str(tmp_path / "missing")) is None
+
+
+def test_comps_kdtree_matches_exact_search(tmp_path, monkeypatch):
+    pytest.importorskip("scipy")
+    from utils.comps import CompsIndex
+
+    rng = np.random.default_rng(0)
+    n = 5_000
+    comps = pd.DataFrame({
+        "Property": [f"Comp {i}" for i in range(n)],
+        "Latitude": rng.uniform(40.5, 41.0, n),
+        "Longitude": rng.uniform(-74.3, -73.7, n),
+        "Year Built": rng.integers(1900, 2024, n).astype("float64"),
+        "Units": rng.integers(4, 400, n).astype("float64"),
+        "Price Per Unit": rng.uniform(100_000, 500_000, n),
+        "Cap Rate (%)": rng.uniform(4, 8, n),
+        "Market Rent": rng.uniform(1_500, 3_500, n),
+    })
+    tree_index = CompsIndex(comps)
+    assert tree_index.tree is not None
+    tree_index.save(str(tmp_path))
+    loaded = CompsIndex.load(str(tmp_path))
+    assert loaded.tree is not None
+
+    monkeypatch.setattr(CompsIndex, "_build_tree", staticmethod(lambda features: None))
+    exact_index = CompsIndex(comps)
+    assert exact_index.tree is None
+    for subject in [(40.75, -74.0, 1985, 120), (40.6, -73.8, 2010, 12)]:
+        expected = exact_index.query(*subject, k=10)
+        pd.testing.assert_frame_equal(tree_index.query(*subject, k=10), expected)
+        pd.testing.assert_frame_equal(loaded.query(*subject, k=10), expected)
+
+
+def test_rent_gap_compares_monthly_market_rent():
+    data = pd.DataFrame({"Income": [480_000.0], "Expenses": [200_000.0]})
+    metrics = calculate_metrics(data, 4_000_000, {"Number of Units": 20, "Market Rent": 2_200})
+    assert metrics["Rent Gap ($)"] == 200  # $2,200 market vs $2,000 in-place per unit per month
+    assert metrics["Rent Gap (%)"] == 9.09
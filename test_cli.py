@@ -0,0 +1,22 @@
+import pandas as pd
+
+from cli import main, underwrite_file
+
+
+def test_input_columns_named_like_metrics_are_kept_apart(tmp_path):
+    portfolio = pd.DataFrame({
+        "Offer Price": [1_000_000.0, 2_000_000.0], "Income": [120_000.0, 200_000.0], "Expenses": [50_000.0, 80_000.0],
+        "Cap Rate (%)": [6.5, 5.0], "Benchmark Cap Rate (%)": [6.0, 6.0],
+    })
+    input_path = tmp_path / "portfolio.csv"
+    portfolio.to_csv(input_path, index=False)
+
+    results = underwrite_file(str(input_path), pro_forma=True)
+    assert results.columns.is_unique
+    assert results["Cap Rate (%) (input)"].tolist() == [6.5, 5.0]
+    assert results["Cap Rate (%)"].tolist() == [7.0, 6.0]
+    assert results["Benchmark Cap Rate (%) (input)"].tolist() == [6.0, 6.0]
+
+    output_path = tmp_path / "results.parquet"
+    assert main([str(input_path), "-o", str(output_path)]) == 0
+    assert list(pd.read_parquet(output_path).columns) == list(underwrite_file(str(input_path)).columns)
@@ -0,0 +1,196 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utils.data_processing import parse_file
+from utils.parse_cache import ParseCache
+
+
+class _Upload(io.BytesIO):
+    """Minimal stand-in for Streamlit's UploadedFile."""
+
+    def __init__(self, payload, name):
+        super().__init__(payload)
+        self.name = name
+
+
+def _csv_upload(rows=100, name="rent_roll.csv", seed=0):
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({"Income": rng.uniform(0, 5_000, rows), "Expenses": rng.uniform(0, 2_000, rows)})
+    return _Upload(frame.to_csv(index=False).encode("utf-8"), name)
+
+
+def test_parse_cache_hits_and_evicts(tmp_path):
+    cache = ParseCache(cache_dir=str(tmp_path), max_bytes=10 * 1024 * 1024)
+    first = parse_file(_csv_upload(), ["Income", "Expenses"], ["Equity"], cache=cache)
+    second = parse_file(_csv_upload(), ["Income", "Expenses"], ["Equity"], cache=cache)
+    pd.testing.assert_frame_equal(first["data"], second["data"])
+    assert second["detected_columns"] == first["detected_columns"]
+    assert len(list(tmp_path.iterdir())) == 2
+
+    tiny = ParseCache(cache_dir=str(tmp_path / "tiny"), max_bytes=1)
+    parse_file(_csv_upload(seed=1), ["Income"], cache=tiny)
+    assert list((tmp_path / "tiny").iterdir()) == []
+
+
+def test_streaming_summary_matches_full_parse():
+    from utils.data_processing import summarize_file_streaming
+
+    frame = pd.DataFrame({
+        "Income": [1_000.0, "pending", 2_500.5, None, 3_000.0],
+        "Expenses": [400.0, 300.0, 250.0, 125.0, 100.0],
+        "Tenant": ["A", "B", "C", "D", "E"],
+    })
+    xlsx = io.BytesIO()
+    frame.to_excel(xlsx, index=False)
+    uploads = [
+        lambda: _Upload(frame.to_csv(index=False).encode("utf-8"), "rent_roll.csv"),
+        lambda: _Upload(xlsx.getvalue(), "rent_roll.xlsx"),
+    ]
+    for make_upload in uploads:
+        summary = summarize_file_streaming(make_upload(), ["Income", "Expenses"], ["Equity"], chunksize=2)
+        assert summary["rows"] == 5
+        assert summary["data"].loc[0, "Income"] == 6_500.5
+        assert summary["data"].loc[0, "Expenses"] == 1_175.0
+        assert summary["invalid_values"] == {"Income": 1}
+        assert summary["detected_columns"] == []
+
+    # Without column lists every column is aggregated; attributes keep their value instead of being summed
+    t12 = pd.DataFrame({"Income": [40_000.0] * 12, "Expenses": [15_000.0] * 12, "Offer Price": [4_000_000.0] * 12})
+    summary = summarize_file_streaming(_Upload(t12.to_csv(index=False).encode("utf-8"), "t12.csv"), chunksize=5)
+    assert summary["data"].loc[0, "Income"] == 480_000
+    assert summary["data"].loc[0, "Offer Price"] == 4_000_000
+
+
+def test_parse_file_coerces_declared_columns_only():
+    frame = pd.DataFrame({
+        "Income": ["1200.5", "pending", None],
+        "Expenses": [400, 300, 250],
+        "Units": [1.0, None, 3.0],
+        "Unit Type": ["1B1B", "2B2B", "1B1B"],
+        "Tenant": ["Ann", None, "Cho"],
+        "Notes": ["late", "", None],
+    })
+    upload = _Upload(frame.to_csv(index=False).encode("utf-8"), "rent_roll.csv")
+    result = parse_file(upload, ["Income", "Expenses"], ["Units", "Unit Type", "Equity"])
+    data = result["data"]
+
+    assert data["Income"].tolist() == [1200.5, 0.0, 0.0]
+    assert data["Units"].dtype == "int32" and data["Units"].tolist() == [1, 0, 3]
+    assert data["Unit Type"].dtype == "category"
+    assert data["Tenant"].iloc[2] == "Cho" and data["Notes"].iloc[0] == "late"  # Unlisted text is not zeroed
+    assert data["Equity"].tolist() == [0.0, 0.0, 0.0]
+    assert result["memory_footprint"]["total_bytes"] == int(data.memory_usage(deep=True).sum())
+
+    upload.seek(0)
+    listed = parse_file(upload, ["Income", "Expenses"], ["Unit Type"], listed_only=True)["data"]
+    assert list(listed.columns) == ["Income", "Expenses", "Unit Type"]
+
+
+def test_parse_file_keeps_fractional_counts_and_exact_rates():
+    frame = pd.DataFrame({"Income": [1_000.0, 2_000.0], "Expenses": [400.0, 500.0], "Units": [12.5, 8.0],
+                          "Year Built": [1985, 2001], "Interest Rate (%)": [6.1, 6.35]})
+    upload = _Upload(frame.to_csv(index=False).encode("utf-8"), "deals.csv")
+    data = parse_file(upload, ["Income", "Expenses"], ["Units", "Year Built", "Interest Rate (%)"])["data"]
+
+    assert data["Units"].dtype == "float64" and data["Units"].tolist() == [12.5, 8.0]
+    assert data["Year Built"].dtype == "int32"
+    assert data["Interest Rate (%)"].dtype == "float64" and data["Interest Rate (%)"].tolist() == [6.1, 6.35]
+
+
+def test_rent_roll_analytics_by_unit_type():
+    from utils.rent_roll import analyze_rent_roll, parse_unit_mix
+
+    assert parse_unit_mix("1B1B: 10 units, 2B2B: 5 units; Studio:3") == {"1B1B": 10, "2B2B": 5, "Studio": 3}
+
+    frame = pd.DataFrame({
+        "Unit Type": ["1B1B", "1B1B", "1B1B", "2B2B"],
+        "Income": [12_000.0, 13_200.0, 0.0, 24_000.0],
+        "Occupied": ["Yes", "yes", "No", "Y"],
+        "Lease End": ["2024-12-31", "2025-02-15", None, "2025-08-01"],
+    })
+    upload = _Upload(frame.to_csv(index=False).encode("utf-8"), "rent_roll.csv")
+    data = parse_file(upload, ["Income"], ["Unit Type", "Occupied", "Lease End"], listed_only=True)["data"]
+    result = analyze_rent_roll(data, market_rent={"1B1B": 1_200, "2B2B": 1_900}, as_of="2025-01-01")
+
+    summary = result["summary"].set_index("Unit Type")
+    assert summary.loc["1B1B", "Occupied Units"] == 2
+    assert summary.loc["1B1B", "Avg Rent ($)"] == 1_050
+    assert summary.loc["1B1B", "Loss to Lease ($/yr)"] == 1_200 * 12 * 2 - 25_200
+    assert summary.loc["2B2B", "Rent Gap ($)"] == -100  # Leased above market
+
+    ladder = result["lease_ladder"].set_index("Period")["Expiring Units"].to_dict()
+    assert ladder == {"Expired / MTM": 1, "2025Q1": 1, "2025Q3": 1}
+
+    # A roll with only monthly Rent, parsed with the app's column lists (Rent is listed, not dropped)
+    frame = pd.DataFrame({"Unit Type": ["1B1B", "1B1B", "2B2B"], "Rent": [1_000.0, 1_100.0, 1_500.0], "Occupied": ["Y", "Y", "N"]})
+    upload = _Upload(frame.to_csv(index=False).encode("utf-8"), "rent_only.csv")
+    data = parse_file(upload, ["Income", "Expenses"], ["Equity", "Unit Type", "Rent", "Occupied", "Lease Start", "Lease End"],
+                      listed_only=True)["data"]
+    summary = analyze_rent_roll(data, market_rent=1_200, as_of="2025-01-01")["summary"].set_index("Unit Type")
+    assert summary.loc["1B1B", "Avg Rent ($)"] == 1_050 and summary.loc["2B2B", "Occupied Units"] == 0
+
+    # An Income-only roll parsed the same way gets no zero Rent placeholder and reads Income / 12
+    frame = pd.DataFrame({"Unit Type": ["1B1B", "1B1B"], "Income": [12_000.0, 13_200.0], "Expenses": [0.0, 0.0],
+                          "Occupied": ["Y", "Y"]})
+    upload = _Upload(frame.to_csv(index=False).encode("utf-8"), "income_only.csv")
+    app_optional = ["Equity", "Debt Service", "Occupancy Rate", "Market Rent", "CapEx", "Year Built", "Units"]
+    data = parse_file(upload, ["Income", "Expenses"], app_optional + ["Unit Type", "Rent", "Occupied", "Lease Start", "Lease End"],
+                      listed_only=True)["data"]
+    assert "Rent" not in data.columns
+    result = analyze_rent_roll(data, market_rent=1_200, as_of="2025-01-01")
+    assert result["summary"].set_index("Unit Type").loc["1B1B", "Avg Rent ($)"] == 1_050
+    assert result["loss_to_lease"]["Loss to Lease ($/yr)"] == 1_200 * 12 * 2 - 25_200
+
+
+def test_parse_workbook_combines_sheets(tmp_path, monkeypatch):
+    from utils.calculations import calculate_batch_metrics
+    from utils.data_processing import parse_workbook, sheets_to_portfolio
+
+    xlsx = io.BytesIO()
+    with pd.ExcelWriter(xlsx) as writer:
+        pd.DataFrame({"Income": [1_000.0, 2_000.0], "Expenses": [400.0, "n/a"], "Notes": ["a", "b"]}).to_excel(writer, sheet_name="Elm St", index=False)
+        pd.DataFrame({"Income": [5_000.0], "Expenses": [1_000.0], "Offer Price": [50_000]}).to_excel(writer, sheet_name="Oak Ave", index=False)
+        pd.DataFrame({"Expenses": [10.0]}).to_excel(writer, sheet_name="Pine Rd", index=False)
+
+    serial = parse_workbook(_Upload(xlsx.getvalue(), "t12.xlsx"), None, ["Income", "Expenses"], ["Offer Price"], max_workers=1)
+    parallel = parse_workbook(_Upload(xlsx.getvalue(), "t12.xlsx"), None, ["Income", "Expenses"], ["Offer Price"], max_workers=2)
+    pd.testing.assert_frame_equal(serial["data"], parallel["data"])
+    with ThreadPoolExecutor(max_workers=2) as executor:  # A shared pool passed in by the caller
+        shared = parse_workbook(_Upload(xlsx.getvalue(), "t12.xlsx"), None, ["Income", "Expenses"], ["Offer Price"],
+                                max_workers=2, executor=executor)
+    pd.testing.assert_frame_equal(serial["data"], shared["data"])
+
+    # By default a small workbook is parsed serially, without starting worker processes
+    import utils.data_processing as data_processing
+    monkeypatch.setattr(data_processing, "ProcessPoolExecutor", None)
+    default = parse_workbook(_Upload(xlsx.getvalue(), "t12.xlsx"), None, ["Income", "Expenses"], ["Offer Price"])
+    pd.testing.assert_frame_equal(serial["data"], default["data"])
+    monkeypatch.undo()
+    assert serial["sheets"] == ["Elm St", "Oak Ave", "Pine Rd"]
+    assert serial["missing_columns"] == {"Pine Rd": ["Income"]}
+    assert serial["data"]["Notes"].iloc[1] == "b"
+
+    cache = ParseCache(cache_dir=str(tmp_path))
+    selected = parse_workbook(_Upload(xlsx.getvalue(), "t12.xlsx"), ["Oak Ave", "Elm St"], ["Income", "Expenses"], cache=cache, listed_only=True)
+    cached = parse_workbook(_Upload(xlsx.getvalue(), "t12.xlsx"), ["Oak Ave", "Elm St"], ["Income", "Expenses"], cache=cache, listed_only=True)
+    assert cached["sheets"] == selected["sheets"] == ["Elm St", "Oak Ave"]
+    pd.testing.assert_frame_equal(cached["data"], selected["data"])
+
+    portfolio = sheets_to_portfolio(serial["data"])
+    assert portfolio.loc["Elm St", "Income"] == 3_000 and portfolio.loc["Elm St", "Expenses"] == 400
+    metrics = calculate_batch_metrics(portfolio)
+    assert metrics.loc["Oak Ave", "Cap Rate (%)"] == 8.0
+
+    # A T-12 repeats the property's attributes on every monthly row; only the flows are summed
+    t12 = pd.DataFrame({
+        "Sheet": pd.Categorical(["Maple"] * 12),
+        "Income": [40_000.0] * 12, "Expenses": [15_000.0] * 12,
+        "Offer Price": [4_000_000.0] * 12, "Equity": [1_000_000.0] * 12, "Units": [40] * 12,
+    })
+    portfolio = sheets_to_portfolio(t12)
+    assert portfolio.loc["Maple"].to_dict() == {
+        "Income": 480_000, "Expenses": 180_000, "Offer Price": 4_000_000, "Equity": 1_000_000, "Units": 40,
+    }
@@ -0,0 +1,33 @@
+from utils.deal_store import DealStore
+
+
+def test_deal_store_screens_and_reloads_deals(tmp_path):
+    store = DealStore(str(tmp_path / "deals.sqlite"))
+    deals = [
+        {"name": f"Deal {i}", "inputs": {"offer_price": 1_000_000.0 * (i + 1)},
+         "metrics": {"NOI": 50_000.0 * i, "Cap Rate (%)": 4.0 + i, "DSCR": 0.9 + 0.1 * i}}
+        for i in range(6)
+    ]
+    store.save_deals(deals)
+    screened = store.screen(max_dscr=1.25, min_cap_rate=6, order_by="cap_rate", descending=False)
+    assert screened["name"].tolist() == ["Deal 2", "Deal 3"]
+
+    # Saving the same inputs again updates the deal instead of adding one
+    deal_id = store.save_deal("Renamed", {"offer_price": 3_000_000.0}, deals[2]["metrics"],
+                              insights={"general": "Solid deal."}, charts={"bar": b"png"})
+    assert store.count() == 6
+    saved = store.find_by_inputs({"offer_price": 3_000_000.0})
+    assert saved["id"] == deal_id and saved["name"] == "Renamed"
+    assert saved["insights"] == {"general": "Solid deal."} and saved["charts"] == {"bar": b"png"}
+
+
+def test_saving_a_deal_replaces_its_charts(tmp_path):
+    store = DealStore(str(tmp_path / "deals.sqlite"))
+    inputs = {"offer_price": 1_000_000.0}
+    deal_id = store.save_deal("Deal", inputs, {"NOI": 60_000.0}, charts={"bar": b"bar", "pie": b"pie"})
+
+    # A save with charts replaces the chart set; a save without charts keeps it
+    store.save_deal("Deal", inputs, {"NOI": 60_000.0}, charts={"line": b"line"})
+    assert store.get_deal(deal_id)["charts"] == {"line": b"line"}
+    store.save_deal("Deal", inputs, {"NOI": 60_000.0})
+    assert store.get_deal(deal_id)["charts"] == {"line": b"line"}
@@ -0,0 +1,183 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils.async_insights import generate_all_insights
+from utils.llm_analysis import INSIGHT_TYPES, InsightCache
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """OpenAI-compatible chat completions stub; the first request fails with 503 to exercise retries."""
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        with server.lock:
+            server.requests.append(payload)
+            fail = len(server.requests) == 1
+
+        if fail:
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        prompt = payload["messages"][-1]["content"]
+        body = json.dumps({"choices": [{"message": {"content": f" echo: {prompt[-40:]} "}}]}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.lock = threading.Lock()
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+
+
+def test_all_insights_are_fetched_concurrently_and_cached(stub_server, tmp_path):
+    base_url = f"http://127.0.0.1:{stub_server.server_address[1]}/v1"
+    cache = InsightCache(cache_dir=str(tmp_path))
+    metrics = {"NOI": 300000.0, "DSCR": 1.42, "Cap Rate (%)": 7.5}
+    options = dict(api_key="test", base_url=base_url, cache=cache, backoff=0.01)
+
+    insights = generate_all_insights(metrics, contexts={"risk analysis": "P(DSCR < 1.0) = 1.35%"}, **options)
+    assert list(insights) == INSIGHT_TYPES
+    assert all(text.startswith("echo:") for text in insights.values())
+    assert len(stub_server.requests) == len(INSIGHT_TYPES) + 1  # One retried 503
+
+    # Same inputs in a different key order hit the disk cache instead of the server
+    again = generate_all_insights(dict(reversed(metrics.items())), contexts={"risk analysis": "P(DSCR < 1.0) = 1.35%"}, **options)
+    assert again == insights
+    assert len(stub_server.requests) == len(INSIGHT_TYPES) + 1
+
+
+class _StreamingHandler(BaseHTTPRequestHandler):
+    """Chat completions stub that answers with server-sent events, one word per event."""
+
+    complete = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for word in ["Strong ", "DSCR ", "and ", "stable ", "NOI."]:
+            event = {"choices": [{"delta": {"content": word}}]}
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        if self.complete:
+            self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, *args):
+        pass
+
+
+def test_stream_insights_yields_chunks_and_caches_complete_text(tmp_path):
+    from utils.async_insights import stream_insights
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StreamingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        cache = InsightCache(cache_dir=str(tmp_path))
+        options = dict(api_key="test", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1", cache=cache)
+        metrics = {"NOI": 300000.0}
+
+        # Stopping early leaves valid partial text and nothing in the cache
+        stream = stream_insights(metrics, **options)
+        assert next(stream) == "Strong "
+        stream.close()
+        assert cache.get(InsightCache.key("gpt-4", "general", metrics)) is None
+
+        chunks = list(stream_insights(metrics, **options))
+        assert "".join(chunks) == "Strong DSCR and stable NOI."
+        assert list(stream_insights(metrics, **options)) == ["Strong DSCR and stable NOI."]
+    finally:
+        server.shutdown()
+
+
+class _TruncatedStreamingHandler(_StreamingHandler):
+    """Streaming stub whose connection ends before the terminating [DONE] event."""
+
+    complete = False
+
+
+def test_stream_insights_does_not_cache_a_truncated_stream(tmp_path):
+    from utils.async_insights import stream_insights
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _TruncatedStreamingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        cache = InsightCache(cache_dir=str(tmp_path))
+        options = dict(api_key="test", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1", cache=cache)
+        metrics = {"NOI": 300000.0}
+
+        assert "".join(stream_insights(metrics, **options)) == "Strong DSCR and stable NOI."
+        assert cache.get(InsightCache.key("gpt-4", "general", metrics)) is None
+    finally:
+        server.shutdown()
+
+
+class _BatchHandler(BaseHTTPRequestHandler):
+    """Chat completions stub answering every '### <name>' block of a batch prompt under its heading."""
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append(payload)
+        names = [line[4:] for line in payload["messages"][-1]["content"].splitlines() if line.startswith("### ")]
+        answer = "\n\n".join(f"## **{name}**\nAnalysis of {name}." for name in names)
+        body = json.dumps({"choices": [{"message": {"content": answer}}]}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_batch_insights_are_split_per_property_and_cached(tmp_path):
+    from utils.async_insights import generate_batch_insights
+    from utils.llm_analysis import BATCH_MAX_PROPERTIES
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _BatchHandler)
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        cache = InsightCache(cache_dir=str(tmp_path))
+        options = dict(api_key="test", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1", cache=cache)
+        properties = {f"Property {i}": {"NOI": 100_000.0 + i, "Cap Rate (%)": 6.5} for i in range(BATCH_MAX_PROPERTIES + 3)}
+
+        insights = generate_batch_insights(properties, **options)
+        assert insights == {name: f"Analysis of {name}." for name in properties}
+        assert len(server.requests) == 2
+
+        generate_batch_insights(properties, **options)
+        assert len(server.requests) == 2  # Every property answered from the cache
+    finally:
+        server.shutdown()
+
+
+def test_prompt_drops_zero_metrics_and_fits_budget():
+    from utils.llm_analysis import build_messages, estimate_tokens, format_metrics
+
+    metrics = {"NOI": 480_000.0, "Cap Rate (%)": 6.75, "DSCR": 1.4, "Rent Gap ($)": 0, "Year Built": "n/a"}
+    assert format_metrics(metrics) == "NOI: $480k\nCap Rate: 6.75%\nDSCR: 1.40x"
+
+    context = "\n".join(f"Comp {i}: cap rate 5.{i}%, rent $2,{i}00" for i in range(400))
+    messages, max_tokens = build_messages(metrics, "general", context, token_budget=1000)
+    prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+    assert prompt_tokens + max_tokens <= 1000 and max_tokens >= 150
+    assert "Comp 0:" in messages[-1]["content"] and "Comp 399:" not in messages[-1]["content"]
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+from utils.proforma import irr, loan_payment, npv, remaining_balance, run_pro_forma
+
+
+def test_irr_solves_rows_together():
+    cash_flows = np.array([
+        [-100.0, 10.0, 10.0, 110.0],
+        [-50.0, 60.0, 0.0, 0.0],
+        [-1000.0, 100.0, 100.0, 1500.0],
+        [-100.0, 0.0, 0.0, 0.0],
+    ])
+    rates = irr(cash_flows)
+    np.testing.assert_allclose(rates[:2], [0.10, 0.20], atol=1e-8)
+    np.testing.assert_allclose(npv(rates[:3], cash_flows[:3]), 0, atol=1e-6)
+    assert np.isnan(rates[3])
+
+
+def test_loan_amortizes_to_zero():
+    payment = loan_payment(100_000, 0.06, 30)
+    np.testing.assert_allclose(payment, 7_264.89, atol=0.01)
+    np.testing.assert_allclose(remaining_balance(100_000, 0.06, 30, 30), 0, atol=1e-6)
+    np.testing.assert_allclose(remaining_balance(100_000, 0.06, 0, 10), 100_000)
+
+
+def test_pro_forma_batch_matches_single_rows():
+    portfolio = pd.DataFrame({
+        "Offer Price": [4_000_000, 2_000_000],
+        "Income": [500_000, 260_000],
+        "Expenses": [200_000, 120_000],
+        "Equity": [1_200_000, 2_000_000],
+        "Interest Rate (%)": [6.5, 0],
+        "Holding Period": [5, 7],
+        "Market Growth Rate": [3, 2],
+        "Projected Cap Rate at Sale": [6.5, 0],
+        "CapEx": [20_000, 5_000],
+    })
+    batch = run_pro_forma(portfolio)
+    for idx in portfolio.index:
+        single = run_pro_forma(portfolio.loc[[idx]])
+        pd.testing.assert_frame_equal(batch.loc[[idx]], single)
+    assert (batch["Equity Multiple"] > 1).all()
+
+
+def test_loan_sizing_takes_the_binding_constraint():
+    from utils.debt import amortization_schedules, size_loans, size_loans_grid
+
+    portfolio = pd.DataFrame({
+        "Offer Price": [4_000_000, 10_000_000],
+        "Income": [500_000, 900_000],
+        "Expenses": [200_000, 300_000],
+        "Interest Rate (%)": [6.5, 7.0],
+        "Interest Only (Years)": [0, 2],
+    })
+    sized = size_loans(portfolio)
+    assert sized["Binding Constraint"].tolist() == ["LTV", "DSCR"]
+    assert sized.loc[0, "Max Loan ($)"] == 3_000_000 and sized.loc[0, "Equity Required ($)"] == 1_000_000
+    np.testing.assert_allclose(sized.loc[1, "DSCR"], 1.25, atol=0.01)
+
+    # The grid matches sizing each scenario on its own
+    grid = size_loans_grid(portfolio, [5.0, 7.0], [25, 30])
+    assert len(grid) == 8
+    single = size_loans(portfolio.iloc[[1]].assign(**{"Interest Rate (%)": 5.0, "Amortization (Years)": 25}))
+    assert grid.loc[(1, 5.0, 25.0), "Max Loan ($)"] == single["Max Loan ($)"].iloc[0]
+
+    # Interest only for two years, then amortizing; the balloon is repaid at the end of the term
+    schedule = amortization_schedules(2_000_000, 6.5, 30, io_years=2, term_years=10)
+    assert schedule["Principal"][0, 1:3].tolist() == [0.0, 0.0]
+    np.testing.assert_allclose(schedule["Principal"][0].sum(), 2_000_000)
+    assert schedule["Balance"][0, -1] == 0
@@ -0,0 +1,37 @@
+import pandas as pd
+
+from utils.calculations import calculate_metrics
+from utils.proforma import scheduled_debt_service
+from utils.scenarios import ScenarioEvaluator, default_scenarios, scenario_diff
+
+
+def test_scenarios_are_evaluated_incrementally():
+    base = {"Offer Price": 4_000_000, "Income": 500_000, "Expenses": 200_000, "Equity": 1_000_000,
+            "Debt Service": 180_000, "Interest Rate (%)": 6.5, "Holding Period": 5}
+    scenarios = default_scenarios(base)
+    evaluator = ScenarioEvaluator()
+    results, computed = evaluator.evaluate(scenarios)
+    assert computed == ["Base", "Downside", "Value-Add"]
+
+    # Each row matches calculate_metrics on the same inputs
+    single = calculate_metrics(pd.DataFrame({"Income": [450_000.0], "Expenses": [210_000.0]}), 4_000_000,
+                               {"Equity": 1_000_000, "Debt Service": 180_000})
+    assert results.loc["Downside", "Cap Rate (%)"] == single["Cap Rate (%)"]
+    assert results.loc["Value-Add", "NOI"] == 350_000
+
+    scenarios.loc["Rate Shock"] = scenarios.loc["Base"]
+    scenarios.loc["Rate Shock", "Interest Rate (%)"] = 9.0
+    results, computed = evaluator.evaluate(scenarios)
+    assert computed == ["Rate Shock"]
+
+    diff = scenario_diff(results)
+    assert list(diff.index) == ["Downside", "Value-Add", "Rate Shock"]
+    assert diff.loc["Downside", "NOI"] == -60_000 and diff.loc["Rate Shock", "NOI"] == 0
+
+    # DSCR is measured on the same debt as the pro forma, so a rate shock lowers it
+    debt_service = scheduled_debt_service(scenarios.loc[["Rate Shock"]])[0]
+    assert results.loc["Rate Shock", "DSCR"] == round(300_000 / debt_service, 2) < results.loc["Base", "DSCR"]
+
+    # Frames with the same values under different columns are not confused
+    swapped = scenarios[["Income", "Expenses"]].rename(columns={"Income": "Expenses", "Expenses": "Income"})
+    assert evaluator.evaluate(swapped)[0].loc["Base", "NOI"] == 0
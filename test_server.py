@@ -0,0 +1,99 @@
+import asyncio
+
+import httpx
+
+from server import UnderwritingService
+from utils.calculations import calculate_batch_metrics
+
+
+def test_concurrent_requests_are_micro_batched():
+    async def scenario():
+        service = await UnderwritingService(port=0, max_workers=0, max_wait_ms=50).start()
+        try:
+            deals = [{"Offer Price": 1_000_000.0 + i, "Income": 120_000.0 + i, "Expenses": 50_000.0, "Debt Service": 40_000.0}
+                     for i in range(20)]
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{service.port}") as client:
+                responses = await asyncio.gather(*[client.post("/underwrite", json=deal) for deal in deals])
+                portfolio = await client.post("/underwrite", json={"deals": deals[:3]})
+                bad = await client.post("/underwrite", content=b"{not json")
+                stats = (await client.get("/metrics")).json()
+            return deals, responses, portfolio, bad, stats
+        finally:
+            await service.stop()
+
+    deals, responses, portfolio, bad, stats = asyncio.run(scenario())
+
+    import pandas as pd
+    expected = calculate_batch_metrics(pd.DataFrame(deals)).to_dict("records")
+    assert [response.json()["metrics"] for response in responses] == expected
+    assert portfolio.json()["metrics"] == expected[:3]
+    assert bad.status_code == 400
+
+    assert stats["batches"]["count"] < len(deals)
+    assert stats["routes"]["POST /underwrite"]["requests"] == len(deals) + 2
+    assert stats["routes"]["POST /underwrite"]["p99_ms"] >= stats["routes"]["POST /underwrite"]["p50_ms"]
+
+
+def test_malformed_requests_get_an_error_response():
+    async def scenario():
+        service = await UnderwritingService(port=0, max_workers=0).start()
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{service.port}") as client:
+                not_object = await client.post("/insights", json=[1])
+                bad_property = await client.post("/insights", json={"properties": {"Elm Street": {"NOI": 1.0}, "Oak Lane": 5}})
+                health = await client.get("/health")  # The connection handler survives
+
+            reader, writer = await asyncio.open_connection("127.0.0.1", service.port)
+            writer.write(b"POST /underwrite HTTP/1.1\r\nContent-Length: abc\r\n\r\n")
+            await writer.drain()
+            status_line = await reader.readline()
+            writer.close()
+            return not_object, bad_property, health, status_line
+        finally:
+            await service.stop()
+
+    not_object, bad_property, health, status_line = asyncio.run(scenario())
+    assert not_object.status_code == 400
+    assert bad_property.status_code == 400
+    assert health.status_code == 200
+    assert status_line.startswith(b"HTTP/1.1 400")
+
+
+def test_a_bad_deal_only_fails_its_own_request(monkeypatch):
+    import server
+
+    underwrite_rows = server._underwrite_rows
+
+    def failing_underwrite(rows):
+        # Stands in for a deal that passes validation but fails in the vectorized call
+        if any(row["Income"] == 13.0 for row in rows):
+            raise ValueError("Cannot underwrite this deal.")
+        return underwrite_rows(rows)
+
+    async def scenario():
+        service = await UnderwritingService(port=0, max_workers=0, max_wait_ms=50).start()
+        monkeypatch.setattr(server, "_underwrite_rows", failing_underwrite)
+        try:
+            good = {"Offer Price": 1_000_000.0, "Income": "120000", "Expenses": 50_000.0}
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{service.port}") as client:
+                responses = await asyncio.gather(
+                    client.post("/underwrite", json=good),
+                    client.post("/underwrite", json={"Income": 13.0, "Expenses": 0.0}),
+                    client.post("/underwrite", json=good),
+                )
+                invalid = await client.post("/underwrite", json={"deals": [good, {"Income": "abc", "Expenses": 1.0}]})
+                missing = await client.post("/underwrite", json={"Offer Price": 1.0})
+                for i in range(3):
+                    await client.get(f"/no/such/path/{i}")
+                stats = (await client.get("/metrics")).json()
+            return responses, invalid, missing, stats
+        finally:
+            await service.stop()
+
+    responses, invalid, missing, stats = asyncio.run(scenario())
+    assert [response.status_code for response in responses] == [200, 422, 200]
+    assert responses[0].json()["metrics"]["NOI"] == 70_000
+    assert invalid.status_code == 400 and invalid.json()["error"].startswith("Deal 1: Field 'Income'")
+    assert missing.status_code == 400
+    assert stats["routes"]["unmatched"]["requests"] == 3
+    assert not any("/no/such/path" in route for route in stats["routes"])
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from utils.visualization import lttb, metrics_figure, render_chart, scatter_figure, series_figure
+
+
+def test_render_chart_is_in_memory_and_cached():
+    metrics = {"NOI": 300000.0, "Cap Rate (%)": 7.5, "DSCR": 1.42}
+    png = render_chart(metrics, chart_type="bar", dpi=72)
+    assert png.startswith(b"\x89PNG")
+    assert render_chart(dict(metrics), chart_type="bar", dpi=72) is png
+    assert render_chart(metrics, chart_type="line", dpi=72) is not png
+
+    with pytest.raises(ValueError):
+        render_chart({"NOI": 0.0})
+
+
+def test_batch_reports_are_zipped_with_unique_names():
+    import io
+    import zipfile
+
+    from utils.reporting import generate_batch_reports
+
+    reports = [
+        {"name": "Maple Court", "metrics": {"NOI": 300000.0, "DSCR": 1.42}, "insights": "Solid “core” deal"},
+        {"name": "Maple Court", "metrics": {"NOI": 0.0}},
+        {"name": "../Oak St", "metrics": {"NOI": 120000.0, "DSCR": 0.95}},
+    ]
+    zip_bytes, stats = generate_batch_reports(reports, dpi=50, max_workers=1)
+    names = zipfile.ZipFile(io.BytesIO(zip_bytes)).namelist()
+    assert names == ["Maple_Court.pdf", "Maple_Court_2.pdf", "Oak_St.pdf"]
+    assert stats["reports"] == 3
+    assert all(entry["bytes"] > 0 for entry in stats["per_report"])
+
+
+def test_lttb_keeps_endpoints_and_peaks():
+    x = np.arange(100_000)
+    y = np.sin(x / 2_000.0)
+    y[54_321] = 50.0
+    kept = lttb(x, y, 500)
+    assert len(kept) == 500 and kept[0] == 0 and kept[-1] == len(x) - 1
+    assert np.all(np.diff(kept) > 0) and 54_321 in kept
+    assert len(lttb(x[:100], y[:100], 500)) == 100
+
+
+def test_figure_specs_are_downsampled_and_cached():
+    metrics = {"NOI": 300000.0, "Cap Rate (%)": 7.5}
+    assert metrics_figure(metrics, "bar") is metrics_figure(dict(metrics), "bar")
+    with pytest.raises(ValueError):
+        metrics_figure(metrics, "area")
+
+    x = np.arange(50_000)
+    figure = series_figure(x, {"NOI": x * 2.0, "Cash Flow": x * 1.0}, "Cash Flows", max_points=1_000)
+    assert [len(trace["x"]) for trace in figure["data"]] == [1_000, 1_000]
+    assert figure["data"][0]["type"] == "scattergl"
+
+    figure = scatter_figure(np.random.default_rng(0).random(20_000), x[:20_000], "Deals", text=x[:20_000].astype(str), max_points=1_000)
+    assert len(figure["data"][0]["x"]) == len(figure["data"][0]["text"]) == 1_000
@@ -0,0 +1,273 @@
+import asyncio
+import json
+import os
+import random
+
+import httpx
+
+from utils.profiling import timed
+from utils.llm_analysis import (
+    INSIGHT_TYPES, OPENAI_API_KEY, TEMPERATURE, InsightCache, build_batch_messages, build_messages, plan_batches,
+    split_batch_response,
+)
+
+# Any OpenAI-compatible endpoint works, e.g. a local stub server for tests
+DEFAULT_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class AsyncInsightsClient:
+    """
+    asyncio client for the Chat Completions API that fans insight requests out concurrently.
+
+    Requests share one HTTP connection pool, at most `max_concurrency` are in flight at once,
+    and rate-limit/server errors are retried with exponential backoff. With a cache, responses
+    are memoized by (model, insight_type, canonicalized metrics, context).
+    """
+
+    def __init__(self, api_key=None, base_url=DEFAULT_BASE_URL, max_concurrency=4, max_retries=3,
+                 backoff=0.5, timeout=60.0, cache=None):
+        self.api_key = api_key or OPENAI_API_KEY
+        self.base_url = base_url.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.cache = cache
+
+    async def _post(self, client, semaphore, payload):
+        for attempt in range(self.max_retries + 1):
+            async with semaphore:
+                try:
+                    response = await client.post(f"{self.base_url}/chat/completions", json=payload)
+                except httpx.TransportError as e:
+                    if attempt == self.max_retries:
+                        raise ValueError(f"OpenAI API connection error: {e}")
+                    response = None
+
+            if response is not None:
+                if response.status_code == 401:
+                    raise ValueError("Invalid OpenAI API key. Please check your configuration.")
+                if response.status_code not in RETRY_STATUS_CODES:
+                    if response.status_code >= 400:
+                        raise ValueError(f"OpenAI API request error: {response.status_code} {response.text}")
+                    return response.json()
+                if attempt == self.max_retries:
+                    raise ValueError(f"OpenAI API error: {response.status_code} {response.text}")
+
+            # Exponential backoff with jitter, honouring Retry-After when the server sends it
+            delay = self.backoff * 2 ** attempt * (1 + random.random())
+            if response is not None and response.headers.get("retry-after", "").isdigit():
+                delay = max(delay, float(response.headers["retry-after"]))
+            await asyncio.sleep(delay)
+
+    async def _generate(self, client, semaphore, metrics, model, insight_type, context):
+        cache_key = InsightCache.key(model, insight_type, metrics, context) if self.cache is not None else None
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        messages, max_tokens = build_messages(metrics, insight_type, context)
+        payload = {"model": model, "messages": messages, "max_tokens": max_tokens, "temperature": TEMPERATURE}
+        response = await self._post(client, semaphore, payload)
+        try:
+            insights = response["choices"][0]["message"]["content"].strip()
+        except (KeyError, IndexError, TypeError) as e:
+            raise ValueError(f"Unexpected OpenAI API response: {e}")
+
+        if cache_key is not None:
+            self.cache.put(cache_key, insights)
+        return insights
+
+    async def generate_many(self, metrics, model="gpt-4", insight_types=INSIGHT_TYPES, contexts=None):
+        """
+        Generate several insight types for the same metrics concurrently.
+
+        Args:
+            metrics: Dictionary of financial metrics.
+            model: OpenAI model to use.
+            insight_types: Insight types to generate.
+            contexts: Mapping of insight type to additional prompt context (optional).
+
+        Returns:
+            dict: Insight type to generated text.
+        """
+        if not self.api_key:
+            raise ValueError("OpenAI API key is not set. Please check your .env file.")
+
+        contexts = contexts or {}
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        async with httpx.AsyncClient(headers=headers, timeout=self.timeout) as client:
+            results = await asyncio.gather(*[
+                self._generate(client, semaphore, metrics, model, insight_type, contexts.get(insight_type))
+                for insight_type in insight_types
+            ])
+        return dict(zip(insight_types, results))
+
+    async def _generate_batch(self, client, semaphore, properties, model, insight_type):
+        messages, max_tokens = build_batch_messages(properties, insight_type)
+        payload = {"model": model, "messages": messages, "max_tokens": max_tokens, "temperature": TEMPERATURE}
+        response = await self._post(client, semaphore, payload)
+        try:
+            text = response["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError) as e:
+            raise ValueError(f"Unexpected OpenAI API response: {e}")
+        return split_batch_response(text, list(properties))
+
+    async def generate_batch(self, properties, model="gpt-4", insight_type="general"):
+        """
+        Generate one insight type for many properties, several properties per request.
+
+        Properties are packed into requests that fit the batch token budget, the requests run
+        concurrently, and each answer is split back out per property. With a cache, answers are
+        memoized per property, so only uncached properties are sent.
+
+        Args:
+            properties: Ordered mapping of property name to its metrics dictionary.
+            model: OpenAI model to use.
+            insight_type: Type of insights to generate.
+
+        Returns:
+            dict: Property name to generated text (empty when the model skipped a property).
+        """
+        if not self.api_key:
+            raise ValueError("OpenAI API key is not set. Please check your .env file.")
+
+        # Batch answers are shorter than single ones, so they are cached under their own type
+        cache_type = f"{insight_type} (batch)"
+        results = {}
+        pending = {}
+        for name, metrics in properties.items():
+            cached = self.cache.get(InsightCache.key(model, cache_type, metrics)) if self.cache is not None else None
+            if cached is not None:
+                results[name] = cached
+            else:
+                pending[name] = metrics
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        async with httpx.AsyncClient(headers=headers, timeout=self.timeout) as client:
+            answers = await asyncio.gather(*[
+                self._generate_batch(client, semaphore, {name: pending[name] for name in batch}, model, insight_type)
+                for batch in plan_batches(pending)
+            ])
+        for answer in answers:
+            for name, text in answer.items():
+                results[name] = text
+                if text and self.cache is not None:
+                    self.cache.put(InsightCache.key(model, cache_type, pending[name]), text)
+        return {name: results[name] for name in properties}
+
+
+@timed()
+def generate_all_insights(metrics, model="gpt-4", insight_types=INSIGHT_TYPES, contexts=None, **client_options):
+    """
+    Synchronous wrapper around AsyncInsightsClient.generate_many, for scripts and Streamlit.
+
+    Args:
+        metrics: Dictionary of financial metrics.
+        model: OpenAI model to use.
+        insight_types: Insight types to generate.
+        contexts: Mapping of insight type to additional prompt context (optional).
+        **client_options: Keyword arguments for AsyncInsightsClient (api_key, base_url, cache, ...).
+
+    Returns:
+        dict: Insight type to generated text.
+    """
+    client = AsyncInsightsClient(**client_options)
+    return asyncio.run(client.generate_many(metrics, model, list(insight_types), contexts))
+
+
+@timed()
+def generate_batch_insights(properties, model="gpt-4", insight_type="general", **client_options):
+    """
+    Synchronous wrapper around AsyncInsightsClient.generate_batch, for portfolio runs.
+
+    Args:
+        properties: Ordered mapping of property name to its metrics dictionary.
+        model: OpenAI model to use.
+        insight_type: Type of insights to generate.
+        **client_options: Keyword arguments for AsyncInsightsClient (api_key, base_url, cache, ...).
+
+    Returns:
+        dict: Property name to generated text.
+    """
+    client = AsyncInsightsClient(**client_options)
+    return asyncio.run(client.generate_batch(properties, model, insight_type))
+
+
+def stream_insights(metrics, model="gpt-4", insight_type="general", context=None, api_key=None,
+                    base_url=DEFAULT_BASE_URL, timeout=60.0, cache=None):
+    """
+    Generate insights as a stream, yielding text as soon as the model produces it.
+
+    Every yielded chunk is a complete piece of text, so whatever was received before the
+    consumer stops iterating is valid output. Only complete responses (ended by [DONE] or a
+    finish_reason) are written to the cache; a cached response is yielded as a single chunk.
+
+    Args:
+        metrics: Dictionary of financial metrics.
+        model: OpenAI model to use.
+        insight_type: Type of insights to generate.
+        context: Additional text to ground the analysis (optional).
+        api_key: OpenAI API key (defaults to the key loaded from .env).
+        base_url: Base URL of the OpenAI-compatible API.
+        timeout: Request timeout in seconds.
+        cache: InsightCache used to reuse and store responses (optional).
+
+    Yields:
+        str: Successive chunks of the generated insights.
+    """
+    cache_key = InsightCache.key(model, insight_type, metrics, context) if cache is not None else None
+    if cache_key is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+    api_key = api_key or OPENAI_API_KEY
+    if not api_key:
+        raise ValueError("OpenAI API key is not set. Please check your .env file.")
+
+    messages, max_tokens = build_messages(metrics, insight_type, context)
+    payload = {
+        "model": model,
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "temperature": TEMPERATURE,
+        "stream": True,
+    }
+    headers = {"Authorization": f"Bearer {api_key}"}
+    parts = []
+    finished = False
+    # Leaving the `with` blocks (including on GeneratorExit when the consumer stops) closes the connection
+    with httpx.Client(headers=headers, timeout=timeout) as client:
+        with client.stream("POST", f"{base_url.rstrip('/')}/chat/completions", json=payload) as response:
+            if response.status_code == 401:
+                raise ValueError("Invalid OpenAI API key. Please check your configuration.")
+            if response.status_code >= 400:
+                raise ValueError(f"OpenAI API error: {response.status_code} {response.read().decode('utf-8', 'replace')}")
+
+            for line in response.iter_lines():
+                # Server-sent events: "data: {json}" lines, terminated by "data: [DONE]"
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    finished = True
+                    break
+                try:
+                    choice = json.loads(data)["choices"][0]
+                    delta = choice["delta"].get("content")
+                except (ValueError, KeyError, IndexError) as e:
+                    raise ValueError(f"Unexpected OpenAI API stream event: {e}")
+                finished = finished or choice.get("finish_reason") is not None
+                if delta:
+                    parts.append(delta)
+                    yield delta
+
+    # A stream cut off before [DONE] or a finish_reason is not cached, so the next call asks again
+    if cache_key is not None and finished:
+        cache.put(cache_key, "".join(parts).strip())
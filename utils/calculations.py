@@ -1,81 +1,288 @@
-def calculate_metrics(data, offer_price, additional_inputs=None):
+import numpy as np
+import pandas as pd
+
+from utils.profiling import timed
+
+class MetricGraph:
+    """
+    Dependency graph of derived quantities, memoized per node.
+
+    Each node is computed from named inputs or earlier nodes, and remembers the dependency
+    values it was last computed from. Evaluating the graph again only recomputes the nodes
+    whose dependencies changed, so e.g. a new laundry income touches Other Income alone.
+
+    Each node remembers only its latest evaluation, so callers that interleave unrelated inputs
+    (Streamlit sessions, server threads) should each evaluate their own graph (see copy()).
+    """
+
+    def __init__(self, inputs, nodes):
+        """
+        Args:
+            inputs: Names of the leaf values passed to evaluate().
+            nodes: Dictionary of node name -> (dependency names, formula), in dependency order.
+        """
+        known = set(inputs)
+        for name, (dependencies, _) in nodes.items():
+            unknown = [dep for dep in dependencies if dep not in known]
+            if unknown:
+                raise ValueError(f"Node '{name}' depends on unknown or later nodes: {unknown}")
+            known.add(name)
+        self.inputs = list(inputs)
+        self.nodes = nodes
+        self._memo = {}
+
+    def copy(self):
+        """Same inputs and nodes with an empty memo, e.g. one graph per Streamlit session."""
+        return MetricGraph(self.inputs, self.nodes)
+
+    def evaluate(self, inputs):
+        """
+        Compute every node from the given leaf values, reusing memoized nodes whose inputs are unchanged.
+
+        Returns:
+            tuple: (values, recomputed) where values maps every input and node name to its value,
+                   and recomputed lists the nodes that were actually recomputed.
+        """
+        values = {name: inputs[name] for name in self.inputs}
+        recomputed = []
+        for name, (dependencies, formula) in self.nodes.items():
+            args = tuple(values[dep] for dep in dependencies)
+            memo = self._memo.get(name)
+            if memo is not None and memo[0] == args:
+                values[name] = memo[1]
+                continue
+            values[name] = formula(*args)
+            # One (args, value) tuple per node, replaced in one assignment so a graph read from several
+            # threads never sees a torn entry (though they evict each other's memo)
+            self._memo[name] = (args, values[name])
+            recomputed.append(name)
+        return values, recomputed
+
+
+# Leaf inputs of calculate_metrics taken from additional_inputs, with their defaults
+METRIC_INPUTS = {
+    "Equity": 0,
+    "Debt Service": 0,
+    "Market Rent": 0,
+    "Number of Units": 0,
+    "Projected Cap Rate at Sale": 0,
+    "Market Growth Rate": 0,
+    "Parking Income": 0,
+    "Laundry Income": 0,
+    "Rent Variation": 0,
+    "Expense Variation": 0,
+    "Benchmark Cap Rate (%)": 0,
+}
+
+METRICS_GRAPH = MetricGraph(
+    ["Income", "Expenses", "Offer Price", *METRIC_INPUTS],
+    {
+        "NOI": (("Income", "Expenses"), lambda income, expenses: income - expenses),
+        "Cap Rate (%)": (("NOI", "Offer Price"), lambda noi, price: (noi / price) * 100 if price > 0 else 0),
+        "Cash on Cash Return (%)": (("NOI", "Equity"), lambda noi, equity: (noi / equity) * 100 if equity > 0 else 0),
+        "DSCR": (("NOI", "Debt Service"), lambda noi, debt_service: noi / debt_service if debt_service > 0 else 0),
+        "Breakeven Occupancy (%)": (
+            ("Expenses", "Income"), lambda expenses, income: (expenses / income) * 100 if income > 0 else 0
+        ),
+        # Per Unit Metrics
+        "Rent Per Unit ($)": (("Income", "Number of Units"), lambda income, units: income / units if units > 0 else 0),
+        "Expense Per Unit ($)": (
+            ("Expenses", "Number of Units"), lambda expenses, units: expenses / units if units > 0 else 0
+        ),
+        # Market Comparison (if Market Rent is provided). Market Rent is $/unit/month and Rent Per Unit
+        # is annual, so the gap is taken on monthly rent per unit
+        "Rent Gap ($)": (
+            ("Market Rent", "Rent Per Unit ($)"),
+            lambda market_rent, rent_per_unit: market_rent - rent_per_unit / 12 if market_rent > 0 and rent_per_unit > 0 else 0,
+        ),
+        "Rent Gap (%)": (
+            ("Rent Gap ($)", "Market Rent"), lambda gap, market_rent: (gap / market_rent) * 100 if market_rent > 0 else 0
+        ),
+        "Projected Cap Rate at Sale (%)": (("Projected Cap Rate at Sale",), lambda value: value),
+        "Market Growth Rate (%)": (("Market Growth Rate",), lambda value: value),
+        # Comps benchmark: 100 means the deal prices in line with its comps, above 100 a higher yield
+        "Benchmark Cap Rate (%)": (("Benchmark Cap Rate (%)",), lambda value: value),
+        "Cap Rate vs Comps (%)": (
+            ("Cap Rate (%)", "Benchmark Cap Rate (%)"),
+            lambda cap_rate, benchmark: (cap_rate / benchmark) * 100 if benchmark > 0 else 0,
+        ),
+        # Tenant and Income Analysis
+        "Parking Income ($)": (("Parking Income",), lambda value: value),
+        "Laundry Income ($)": (("Laundry Income",), lambda value: value),
+        "Other Income ($)": (("Parking Income", "Laundry Income"), lambda parking, laundry: parking + laundry),
+        # Sensitivity Analysis
+        "Adjusted Income ($)": (
+            ("Income", "Rent Variation"), lambda income, variation: income * (1 + variation / 100)
+        ),
+        "Adjusted Expenses ($)": (
+            ("Expenses", "Expense Variation"), lambda expenses, variation: expenses * (1 + variation / 100)
+        ),
+        "Adjusted NOI ($)": (
+            ("Adjusted Income ($)", "Adjusted Expenses ($)"), lambda income, expenses: income - expenses
+        ),
+    },
+)
+
+# Order of the metrics returned by calculate_metrics
+METRIC_NAMES = [
+    "NOI", "Cap Rate (%)", "Cash on Cash Return (%)", "DSCR", "Breakeven Occupancy (%)",
+    "Rent Per Unit ($)", "Expense Per Unit ($)", "Rent Gap ($)", "Rent Gap (%)",
+    "Projected Cap Rate at Sale (%)", "Market Growth Rate (%)", "Benchmark Cap Rate (%)",
+    "Cap Rate vs Comps (%)", "Parking Income ($)",
+    "Laundry Income ($)", "Other Income ($)", "Adjusted NOI ($)", "Adjusted Income ($)",
+    "Adjusted Expenses ($)",
+]
+
+
+@timed()
+def calculate_metrics(data, offer_price, additional_inputs=None, graph=METRICS_GRAPH):
     """
     Calculate financial metrics such as NOI, Cap Rate, Cash on Cash Return, DSCR, and others.
+    Metrics are evaluated on a memoized dependency graph, so only those whose inputs
+    changed since the previous call are recomputed.
     
     Args:
         data: DataFrame containing financial data (Income, Expenses, etc.).
         offer_price: Purchase price of the property.
         additional_inputs: Dictionary containing additional data like equity, debt service, and other parameters.
+        graph: MetricGraph the metrics are evaluated on (default: the process-wide METRICS_GRAPH;
+               pass a METRICS_GRAPH.copy() per session to keep memoization per user).
     
     Returns:
         dict: A dictionary containing calculated financial metrics.
     """
     try:
-        # Extract basic data
-        income = data.get('Income', []).sum()
-        expenses = data.get('Expenses', []).sum()
-        noi = income - expenses
+        additional_inputs = additional_inputs or {}
+        inputs = {name: additional_inputs.get(name, default) for name, default in METRIC_INPUTS.items()}
+        inputs.update({
+            "Income": data.get('Income', []).sum(),
+            "Expenses": data.get('Expenses', []).sum(),
+            "Offer Price": offer_price,
+        })
+        values, _ = graph.evaluate(inputs)
+
+        # Filter out metrics with invalid values (e.g., negative or infinite)
+        metrics = {key: round(values[key], 2) if values[key] >= 0 else 0 for key in METRIC_NAMES}
+        
+        return metrics
+    except KeyError as e:
+        raise ValueError(f"Missing required column in the data: {e}")
+    except Exception as e:
+        raise ValueError(f"Error calculating metrics: {e}")
 
-        # Basic metrics
-        cap_rate = (noi / offer_price) * 100 if offer_price > 0 else 0
 
-        # Additional metrics
-        equity = additional_inputs.get("Equity", 0) if additional_inputs else 0
-        debt_service = additional_inputs.get("Debt Service", 0) if additional_inputs else 0
-        market_rent = additional_inputs.get("Market Rent", 0)
-        num_units = additional_inputs.get("Number of Units", 0)
-        cash_on_cash_return = (noi / equity) * 100 if equity > 0 else 0
-        dscr = noi / debt_service if debt_service > 0 else 0
-        breakeven_occupancy = (expenses / income) * 100 if income > 0 else 0
-        projected_cap_rate_at_sale = additional_inputs.get("Projected Cap Rate at Sale", 0)
-        market_growth_rate = additional_inputs.get("Market Growth Rate", 0)
+# Columns read by calculate_batch_metrics, mapped to the default used when a column is absent.
+BATCH_INPUT_COLUMNS = {
+    "Offer Price": 0.0,
+    "Income": 0.0,
+    "Expenses": 0.0,
+    "Equity": 0.0,
+    "Debt Service": 0.0,
+    "Market Rent": 0.0,
+    "Number of Units": 0.0,
+    "Projected Cap Rate at Sale": 0.0,
+    "Market Growth Rate": 0.0,
+    "Parking Income": 0.0,
+    "Laundry Income": 0.0,
+    "Rent Variation": 0.0,
+    "Expense Variation": 0.0,
+    "Benchmark Cap Rate (%)": 0.0,
+}
 
-        # Tenant and Income Analysis
-        parking_income = additional_inputs.get("Parking Income", 0)
-        laundry_income = additional_inputs.get("Laundry Income", 0)
-        other_income = parking_income + laundry_income
 
-        # Per Unit Metrics
-        rent_per_unit = (income / num_units) if num_units > 0 else 0
-        expense_per_unit = (expenses / num_units) if num_units > 0 else 0
+def _safe_divide(numerator, denominator):
+    """
+    Element-wise division that returns 0 wherever the denominator is not positive,
+    mirroring the `x / y if y > 0 else 0` guards used by calculate_metrics.
+    """
+    numerator = np.asarray(numerator, dtype="float64")
+    denominator = np.asarray(denominator, dtype="float64")
+    out = np.zeros(np.broadcast(numerator, denominator).shape, dtype="float64")
+    np.divide(numerator, denominator, out=out, where=denominator > 0)
+    return out
 
-        # Market Comparison (if Market Rent is provided)
-        rent_gap = (market_rent - rent_per_unit) if market_rent > 0 and rent_per_unit > 0 else 0
-        rent_gap_percentage = (rent_gap / market_rent) * 100 if market_rent > 0 else 0
 
-        # Sensitivity Analysis
-        rent_variation = additional_inputs.get("Rent Variation", 0)
-        expense_variation = additional_inputs.get("Expense Variation", 0)
-        adjusted_income = income * (1 + rent_variation / 100)
-        adjusted_expenses = expenses * (1 + expense_variation / 100)
+@timed()
+def calculate_batch_metrics(portfolio):
+    """
+    Calculate the calculate_metrics metrics for many properties at once.
+
+    Every metric is computed as a NumPy column operation over the whole portfolio,
+    so there is no per-property Python loop and the results match calculate_metrics
+    row for row.
+
+    Args:
+        portfolio: DataFrame with one row per property. Recognised columns are the keys of
+                   BATCH_INPUT_COLUMNS ("Offer Price", "Income", "Expenses", "Equity",
+                   "Debt Service", "Number of Units", "Market Rent", ...). Missing columns
+                   default to 0.
+
+    Returns:
+        DataFrame: One row per property (same index as `portfolio`) with the same metric
+                   columns as the dictionary returned by calculate_metrics.
+    """
+    try:
+        columns = {}
+        for col, default in BATCH_INPUT_COLUMNS.items():
+            if col in portfolio.columns:
+                values = pd.to_numeric(portfolio[col], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+                columns[col] = np.nan_to_num(values, nan=default)
+            else:
+                columns[col] = np.full(len(portfolio), default, dtype="float64")
+
+        offer_price = columns["Offer Price"]
+        income = columns["Income"]
+        expenses = columns["Expenses"]
+        market_rent = columns["Market Rent"]
+        num_units = columns["Number of Units"]
+
+        noi = income - expenses
+        cap_rate = _safe_divide(noi, offer_price) * 100
+        cash_on_cash_return = _safe_divide(noi, columns["Equity"]) * 100
+        dscr = _safe_divide(noi, columns["Debt Service"])
+        breakeven_occupancy = _safe_divide(expenses, income) * 100
+
+        other_income = columns["Parking Income"] + columns["Laundry Income"]
+
+        rent_per_unit = _safe_divide(income, num_units)
+        expense_per_unit = _safe_divide(expenses, num_units)
+
+        rent_gap = np.where((market_rent > 0) & (rent_per_unit > 0), market_rent - rent_per_unit / 12, 0.0)
+        rent_gap_percentage = _safe_divide(rent_gap, market_rent) * 100
+
+        adjusted_income = income * (1 + columns["Rent Variation"] / 100)
+        adjusted_expenses = expenses * (1 + columns["Expense Variation"] / 100)
         adjusted_noi = adjusted_income - adjusted_expenses
 
-        # Compile metrics into a dictionary
-        metrics = {
-            "NOI": noi,
-            "Cap Rate (%)": cap_rate,
-            "Cash on Cash Return (%)": cash_on_cash_return,
-            "DSCR": dscr,
-            "Breakeven Occupancy (%)": breakeven_occupancy,
-            "Rent Per Unit ($)": rent_per_unit,
-            "Expense Per Unit ($)": expense_per_unit,
-            "Rent Gap ($)": rent_gap,
-            "Rent Gap (%)": rent_gap_percentage,
-            "Projected Cap Rate at Sale (%)": projected_cap_rate_at_sale,
-            "Market Growth Rate (%)": market_growth_rate,
-            "Parking Income ($)": parking_income,
-            "Laundry Income ($)": laundry_income,
-            "Other Income ($)": other_income,
-            "Adjusted NOI ($)": adjusted_noi,
-            "Adjusted Income ($)": adjusted_income,
-            "Adjusted Expenses ($)": adjusted_expenses,
-        }
+        metrics = pd.DataFrame(
+            {
+                "NOI": noi,
+                "Cap Rate (%)": cap_rate,
+                "Cash on Cash Return (%)": cash_on_cash_return,
+                "DSCR": dscr,
+                "Breakeven Occupancy (%)": breakeven_occupancy,
+                "Rent Per Unit ($)": rent_per_unit,
+                "Expense Per Unit ($)": expense_per_unit,
+                "Rent Gap ($)": rent_gap,
+                "Rent Gap (%)": rent_gap_percentage,
+                "Projected Cap Rate at Sale (%)": columns["Projected Cap Rate at Sale"],
+                "Market Growth Rate (%)": columns["Market Growth Rate"],
+                "Benchmark Cap Rate (%)": columns["Benchmark Cap Rate (%)"],
+                "Cap Rate vs Comps (%)": _safe_divide(cap_rate, columns["Benchmark Cap Rate (%)"]) * 100,
+                "Parking Income ($)": columns["Parking Income"],
+                "Laundry Income ($)": columns["Laundry Income"],
+                "Other Income ($)": other_income,
+                "Adjusted NOI ($)": adjusted_noi,
+                "Adjusted Income ($)": adjusted_income,
+                "Adjusted Expenses ($)": adjusted_expenses,
+            },
+            index=portfolio.index,
+        )
 
-        # Filter out metrics with invalid values (e.g., negative or infinite)
-        metrics = {key: round(value, 2) if value >= 0 else 0 for key, value in metrics.items()}
-        
-        return metrics
-    except KeyError as e:
-        raise ValueError(f"Missing required column in the data: {e}")
+        # Same filtering as calculate_metrics: negative (or NaN) values become 0, the rest are rounded
+        values = metrics.to_numpy()
+        with np.errstate(invalid="ignore"):
+            values = np.where(values >= 0, np.round(values, 2), 0.0)
+        return pd.DataFrame(values, index=metrics.index, columns=metrics.columns)
     except Exception as e:
-        raise ValueError(f"Error calculating metrics: {e}")
+        raise ValueError(f"Error calculating batch metrics: {e}")
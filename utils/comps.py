@@ -0,0 +1,200 @@
+import hashlib
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from utils.profiling import timed
+
+DEFAULT_COMPS_DIR = os.getenv("UNDERWRITE_COMPS_DIR", "comps")
+
+# Columns of the comps store; Market Rent is the monthly rent per unit
+COMP_COLUMNS = ["Property", "Latitude", "Longitude", "Year Built", "Units", "Price Per Unit", "Cap Rate (%)", "Market Rent"]
+
+# The index searches a space where one unit of distance is 1 km between properties. Vintage
+# and size are scaled onto it: 10 years apart or a 2x size difference each count like 1 km.
+YEARS_PER_KM = 10.0
+SIZE_RATIO_PER_KM = 2.0
+EARTH_RADIUS_KM = 6371.0
+
+INDEX_VERSION = 1
+
+
+def _features(latitude, longitude, year_built, units, reference_latitude):
+    """Project properties onto the search space (equirectangular km plus scaled vintage and size)."""
+    latitude = np.radians(np.asarray(latitude, dtype="float64"))
+    longitude = np.radians(np.asarray(longitude, dtype="float64"))
+    units = np.maximum(np.asarray(units, dtype="float64"), 1)
+    return np.column_stack([
+        EARTH_RADIUS_KM * longitude * np.cos(np.radians(reference_latitude)),
+        EARTH_RADIUS_KM * latitude,
+        np.asarray(year_built, dtype="float64") / YEARS_PER_KM,
+        np.log(units) / np.log(SIZE_RATIO_PER_KM),
+    ])
+
+
+def _data_hash(comps):
+    return hashlib.sha256(pd.util.hash_pandas_object(comps, index=False).to_numpy().tobytes()).hexdigest()
+
+
+class CompsIndex:
+    """
+    Nearest-neighbor index over a store of past deals.
+
+    Uses scipy's cKDTree when scipy is installed; otherwise an exact vectorized search over the
+    same feature matrix, which stays in the low milliseconds for stores of a few 100k deals.
+    The comps are stored as Parquet and the built index is persisted next to them, keyed by a
+    hash of the data, so it is only rebuilt when the store changes.
+    """
+
+    def __init__(self, comps, tree=None, features=None, reference_latitude=None):
+        missing = [col for col in COMP_COLUMNS if col not in comps.columns]
+        if missing:
+            raise ValueError(f"Comps are missing required columns: {missing}")
+        self.comps = comps.reset_index(drop=True)
+        self.reference_latitude = (
+            float(self.comps["Latitude"].mean()) if reference_latitude is None else reference_latitude
+        )
+        self.features = features if features is not None else _features(
+            self.comps["Latitude"], self.comps["Longitude"], self.comps["Year Built"], self.comps["Units"],
+            self.reference_latitude,
+        )
+        self.tree = tree if tree is not None else self._build_tree(self.features)
+
+    @staticmethod
+    def _build_tree(features):
+        try:
+            from scipy.spatial import cKDTree
+        except ImportError:
+            return None
+        return cKDTree(features)
+
+    @timed()
+    def query(self, latitude, longitude, year_built, units, k=5):
+        """
+        Find the k comps closest to a subject property.
+
+        Args:
+            latitude: Subject latitude in degrees.
+            longitude: Subject longitude in degrees.
+            year_built: Subject year built.
+            units: Subject number of units.
+            k: Number of comps to return.
+
+        Returns:
+            DataFrame: The nearest comps, closest first, with a 'Distance' column (search-space km).
+        """
+        k = min(k, len(self.comps))
+        if k == 0:
+            return self.comps.assign(Distance=pd.Series(dtype="float64"))
+        subject = _features([latitude], [longitude], [year_built], [units], self.reference_latitude)[0]
+        if self.tree is not None:
+            distances, positions = self.tree.query(subject, k=k)
+            distances, positions = np.atleast_1d(distances), np.atleast_1d(positions)
+        else:
+            squared = ((self.features - subject) ** 2).sum(axis=1)
+            positions = np.argpartition(squared, k - 1)[:k]
+            positions = positions[np.argsort(squared[positions])]
+            distances = np.sqrt(squared[positions])
+        return self.comps.iloc[positions].assign(Distance=np.round(distances, 3)).reset_index(drop=True)
+
+    def save(self, directory=DEFAULT_COMPS_DIR):
+        """Persist the comps (Parquet) and the built index under `directory`."""
+        os.makedirs(directory, exist_ok=True)
+        self.comps.to_parquet(os.path.join(directory, "comps.parquet"), index=False)
+        with open(os.path.join(directory, "index.pkl"), "wb") as f:
+            pickle.dump({
+                "version": INDEX_VERSION,
+                "data_hash": _data_hash(self.comps),
+                "reference_latitude": self.reference_latitude,
+                "features": self.features,
+                "tree": self.tree,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, directory=DEFAULT_COMPS_DIR):
+        """
+        Load a saved comps store, reusing its persisted index when it still matches the data.
+
+        Returns:
+            CompsIndex: The loaded index, or None when no store exists in `directory`.
+        """
+        comps_path = os.path.join(directory, "comps.parquet")
+        if not os.path.exists(comps_path):
+            return None
+        comps = pd.read_parquet(comps_path)
+        try:
+            with open(os.path.join(directory, "index.pkl"), "rb") as f:
+                saved = pickle.load(f)
+            if saved["version"] == INDEX_VERSION and saved["data_hash"] == _data_hash(comps):
+                # A tree pickled without scipy is None; an index saved with scipy needs it to load
+                return cls(comps, saved["tree"], saved["features"], saved["reference_latitude"])
+        except (OSError, KeyError, pickle.UnpicklingError, ModuleNotFoundError):
+            pass
+
+        index = cls(comps)
+        index.save(directory)
+        return index
+
+    @classmethod
+    def from_file(cls, uploaded_file, directory=DEFAULT_COMPS_DIR):
+        """
+        Build the comps store from a CSV/XLSX of past deals and persist it.
+
+        Args:
+            uploaded_file: File object with the COMP_COLUMNS.
+            directory: Where the store and its index are saved.
+
+        Returns:
+            CompsIndex: The new index.
+        """
+        from utils.data_processing import parse_file
+
+        result = parse_file(uploaded_file, required_columns=COMP_COLUMNS[1:])
+        if result["missing_columns"]:
+            raise ValueError(f"Comps file is missing required columns: {result['missing_columns']}")
+        comps = result["data"]
+        if "Property" not in comps.columns:
+            comps.insert(0, "Property", [f"Comp {i + 1}" for i in range(len(comps))])
+        comps[COMP_COLUMNS[1:]] = comps[COMP_COLUMNS[1:]].astype("float64")
+        # parse_file turns blank coordinates into 0; such deals cannot be located
+        comps = comps.loc[(comps["Latitude"] != 0) | (comps["Longitude"] != 0), COMP_COLUMNS]
+        index = cls(comps)
+        index.save(directory)
+        return index
+
+
+def comp_benchmarks(comps):
+    """
+    Distance-weighted benchmarks from a set of comps.
+
+    Args:
+        comps: DataFrame returned by CompsIndex.query.
+
+    Returns:
+        dict: 'Market Rent', 'Benchmark Cap Rate (%)' and 'Price Per Unit' (0 when no comps).
+    """
+    if comps.empty:
+        return {"Market Rent": 0, "Benchmark Cap Rate (%)": 0, "Price Per Unit": 0}
+    weights = 1 / (comps["Distance"].to_numpy() + 1.0)  # Closer comps count more; +1 km avoids blowing up on exact matches
+    return {
+        "Market Rent": round(float(np.average(comps["Market Rent"], weights=weights)), 2),
+        "Benchmark Cap Rate (%)": round(float(np.average(comps["Cap Rate (%)"], weights=weights)), 2),
+        "Price Per Unit": round(float(np.average(comps["Price Per Unit"], weights=weights)), 2),
+    }
+
+
+def format_comps_context(comps, benchmarks):
+    """Summarize comps and their benchmarks as prompt context for the LLM."""
+    lines = [
+        f"Comparable properties ({len(comps)} nearest by location, vintage and size):",
+        f"- Benchmark cap rate {benchmarks['Benchmark Cap Rate (%)']:.2f}%, market rent "
+        f"${benchmarks['Market Rent']:,.0f}/unit/month, price per unit ${benchmarks['Price Per Unit']:,.0f}",
+    ]
+    for comp in comps.to_dict("records"):
+        lines.append(
+            f"- {comp['Property']}: built {int(comp['Year Built'])}, {int(comp['Units'])} units, "
+            f"cap rate {comp['Cap Rate (%)']:.2f}%, rent ${comp['Market Rent']:,.0f}, ${comp['Price Per Unit']:,.0f}/unit"
+        )
+    return "\n".join(lines)
@@ -1,6 +1,132 @@
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import pandas as pd
 
-def parse_file(uploaded_file, required_columns=None, optional_columns=None):
+from utils.parse_cache import file_cache_key
+from utils.profiling import timed
+
+
+def _read_bytes(uploaded_file):
+    """Return the raw bytes of an uploaded file (Streamlit UploadedFile or any binary file object)."""
+    if hasattr(uploaded_file, "getvalue"):
+        return uploaded_file.getvalue()
+    file_bytes = uploaded_file.read()
+    uploaded_file.seek(0)
+    return file_bytes
+
+
+# Declared dtypes of the columns underwriting reads. Only these are coerced; every other column
+# (tenant names, notes, ...) is kept exactly as read. Money and rates stay float64: float32 carries
+# ~7 significant digits, which is not enough for portfolio-level dollar totals and turns a 6.1%
+# rate into 6.0999999. Counts are int32 only when every value is whole (see _coerce_column).
+COLUMN_SCHEMA = {
+    "Income": "float64",
+    "Expenses": "float64",
+    "Offer Price": "float64",
+    "Equity": "float64",
+    "Debt Service": "float64",
+    "Loan Amount": "float64",
+    "Market Rent": "float64",
+    "Rent": "float64",
+    "Parking Income": "float64",
+    "Laundry Income": "float64",
+    "Renovation Cost": "float64",
+    "CapEx": "float64",
+    "Occupancy Rate": "float64",
+    "Projected Cap Rate at Sale": "float64",
+    "Market Growth Rate": "float64",
+    "Expense Growth Rate": "float64",
+    "Rent Variation": "float64",
+    "Expense Variation": "float64",
+    "Interest Rate (%)": "float64",
+    "Selling Costs (%)": "float64",
+    "Amortization (Years)": "float32",
+    "Holding Period": "float32",
+    "Number of Units": "int32",
+    "Units": "int32",
+    "Year Built": "int32",
+    "Unit Type": "category",
+    "Tenant Type": "category",
+    "Occupied": "str",
+    "Lease Start": "datetime64[ns]",
+    "Lease End": "datetime64[ns]",
+}
+
+_NUMERIC_DTYPES = ("float64", "float32", "int32")
+
+# Columns that accumulate across rows (monthly lines, units). Every other numeric column is a
+# per-property attribute (price, equity, year built, ...) that rows repeat and must not be summed.
+FLOW_COLUMNS = ["Income", "Expenses", "Parking Income", "Laundry Income", "CapEx"]
+
+# Optional columns whose absence is meaningful, so they never get a zero placeholder: a rent roll
+# without monthly Rent falls back to Income / 12 (see rent_roll.normalize_rent_roll).
+_NO_PLACEHOLDER_COLUMNS = {"Rent"}
+
+
+def _coerce_column(values, dtype):
+    """
+    Coerce one column to its declared dtype; unparseable or missing numbers become 0, unparseable
+    dates NaT. An int32 column with fractional values (e.g. 12.5 units) is kept as float64.
+    """
+    if dtype in ("category", "str"):
+        return values.astype(dtype)
+    if dtype.startswith("datetime64"):
+        return pd.to_datetime(values, errors="coerce")
+    numbers = pd.to_numeric(values, errors="coerce").fillna(0)
+    if dtype == "int32" and not (numbers % 1 == 0).all():
+        dtype = "float64"
+    return numbers.astype(dtype)
+
+
+def _coerce_frame(data, listed_columns, schema):
+    """Coerce only the declared and listed columns; other text columns are left untouched."""
+    for col in data.columns:
+        dtype = schema.get(col, "float64" if col in listed_columns else None)
+        if dtype is not None:
+            data[col] = _coerce_column(data[col], dtype)
+    return data
+
+
+def _add_placeholders(data, optional_columns, schema):
+    """Add missing numeric optional columns as zero placeholders, in one step."""
+    placeholders = {
+        col: _coerce_column(pd.Series(0, index=data.index), schema.get(col, "float64"))
+        for col in optional_columns or []
+        if col not in data.columns and col not in _NO_PLACEHOLDER_COLUMNS
+        and schema.get(col, "float64") in _NUMERIC_DTYPES
+    }
+    return data.assign(**placeholders) if placeholders else data
+
+
+def memory_footprint(data):
+    """
+    Report how much memory a parsed DataFrame takes, per column.
+
+    Args:
+        data: DataFrame to measure.
+
+    Returns:
+        dict: A dictionary containing:
+              - 'total_bytes': Memory used by all columns (including the index).
+              - 'columns': List of {'column', 'dtype', 'bytes'} per column, largest first.
+    """
+    usage = data.memory_usage(deep=True)
+    columns = [
+        {"column": col, "dtype": str(data[col].dtype), "bytes": int(usage[col])}
+        for col in data.columns
+    ]
+    return {
+        "total_bytes": int(usage.sum()),
+        "columns": sorted(columns, key=lambda entry: entry["bytes"], reverse=True),
+    }
+
+
+@timed()
+def parse_file(uploaded_file, required_columns=None, optional_columns=None, cache=None, listed_only=False,
+               schema=COLUMN_SCHEMA):
     """
     Parse the uploaded file into a Pandas DataFrame.
     Supports Excel and CSV formats. Handles required and optional columns dynamically.
@@ -9,26 +135,48 @@ def parse_file(uploaded_file, required_columns=None, optional_columns=None):
         uploaded_file: File object (Excel or CSV).
         required_columns: List of mandatory column names (optional).
         optional_columns: List of additional column names to handle (optional).
+        cache: utils.parse_cache.ParseCache used to skip re-parsing unchanged files (optional).
+        listed_only: Read only the required and optional columns, skipping every other column of the file.
+        schema: Declared dtype per column name. Declared columns are coerced, listed columns missing from
+                the schema become float64, and every other column is kept as read.
     
     Returns:
         dict: A dictionary containing:
               - 'data': DataFrame with parsed and validated data.
               - 'missing_columns': List of missing required columns (if any).
               - 'detected_columns': List of detected optional/relevant columns.
+              - 'memory_footprint': Memory used by the parsed data (see memory_footprint).
     """
     try:
-        # Load the file based on format
+        listed_columns = list(dict.fromkeys((required_columns or []) + (optional_columns or [])))
+        usecols = (lambda name: name in listed_columns) if listed_only and listed_columns else None
+        categories = {col: "category" for col, dtype in schema.items() if dtype == "category"}
+
+        cache_key = None
+        if cache is not None:
+            file_bytes = _read_bytes(uploaded_file)
+            cache_key = file_cache_key(
+                file_bytes, os.path.splitext(uploaded_file.name)[1], required_columns, optional_columns,
+                listed_only, schema,
+            )
+            cached = cache.get(cache_key)
+            if cached is not None:
+                cached["memory_footprint"] = memory_footprint(cached["data"])
+                return cached
+            source = io.BytesIO(file_bytes)
+        else:
+            source = uploaded_file
+
+        # Load the file based on format, skipping unlisted columns at read time
         if uploaded_file.name.endswith(".xlsx"):
-            excel_file = pd.ExcelFile(uploaded_file)
+            excel_file = pd.ExcelFile(source)
             if len(excel_file.sheet_names) > 1:
                 # If multiple sheets, select the first by default
-                sheet_to_use = excel_file.sheet_names[0]
-                print(f"Multiple sheets found. Defaulting to the first sheet: {sheet_to_use}")
-                data = pd.read_excel(uploaded_file, sheet_name=sheet_to_use)
-            else:
-                data = pd.read_excel(uploaded_file)
+                print(f"Multiple sheets found. Defaulting to the first sheet: {excel_file.sheet_names[0]}")
+            # Parse from the already opened workbook instead of reading the file a second time
+            data = excel_file.parse(excel_file.sheet_names[0], usecols=usecols)
         elif uploaded_file.name.endswith(".csv"):
-            data = pd.read_csv(uploaded_file)
+            data = pd.read_csv(source, usecols=usecols, dtype=categories)
         else:
             raise ValueError("Unsupported file format. Please upload .xlsx or .csv files.")
         
@@ -46,20 +194,8 @@ def parse_file(uploaded_file, required_columns=None, optional_columns=None):
         if optional_columns:
             detected_columns = [col for col in optional_columns if col in data.columns]
 
-        # Handle missing values and data types
-        data = data.fillna(0)  # Fill NaN values with 0
-        for col in data.columns:
-            if data[col].dtype == "object":
-                try:
-                    data[col] = pd.to_numeric(data[col], errors="coerce").fillna(0)
-                except:
-                    pass  # Leave as-is if not convertible
-
-        # Add missing additional input columns as placeholders
-        if optional_columns:
-            for col in optional_columns:
-                if col not in data.columns:
-                    data[col] = 0  # Add missing columns with default value 0
+        data = _coerce_frame(data, listed_columns, schema)
+        data = _add_placeholders(data, optional_columns, schema)
 
         # Summarize results
         result = {
@@ -67,6 +203,269 @@ def parse_file(uploaded_file, required_columns=None, optional_columns=None):
             "missing_columns": missing_columns,
             "detected_columns": detected_columns,
         }
+        if cache_key is not None:
+            cache.put(cache_key, result)
+        result["memory_footprint"] = memory_footprint(data)
+        return result
+    except Exception as e:
+        raise ValueError(f"Error processing file: {e}")
+
+
+SHEET_COLUMN = "Sheet"
+
+# Below these sizes, starting worker processes and re-opening the workbook in each costs more than
+# parallel parsing saves (a typical 2-5 sheet T-12), so parse_workbook parses serially by default
+PARALLEL_MIN_SHEETS = 8
+PARALLEL_MIN_BYTES = 2 * 1024 * 1024
+
+
+def _parse_sheets(args):
+    """
+    Worker entry point: open the workbook once and parse a group of its sheets.
+    Returns (sheet name, coerced DataFrame) pairs.
+    """
+    file_bytes, sheet_names, usecols_list, listed_columns, schema = args
+    usecols = (lambda name: name in usecols_list) if usecols_list else None
+    with pd.ExcelFile(io.BytesIO(file_bytes)) as excel_file:
+        return [
+            (sheet, _coerce_frame(excel_file.parse(sheet, usecols=usecols), listed_columns, schema))
+            for sheet in sheet_names
+        ]
+
+
+@timed()
+def parse_workbook(uploaded_file, sheets=None, required_columns=None, optional_columns=None, cache=None,
+                   listed_only=False, schema=COLUMN_SCHEMA, max_workers=None, executor=None):
+    """
+    Parse several sheets of an Excel workbook (one per property or month) into one long-format DataFrame.
+    The file is read once. Workbooks with at least PARALLEL_MIN_SHEETS sheets and PARALLEL_MIN_BYTES
+    bytes are parsed in worker processes: sheets are split into one group per worker, and each worker
+    opens the in-memory workbook once for its whole group. Smaller workbooks are parsed serially.
+
+    Args:
+        uploaded_file: Excel file object.
+        sheets: Sheet names to parse (default: all sheets).
+        required_columns: List of mandatory column names, checked per sheet (optional).
+        optional_columns: List of additional column names to handle (optional).
+        cache: utils.parse_cache.ParseCache used to skip re-parsing unchanged files (optional).
+        listed_only: Read only the required and optional columns of every sheet.
+        schema: Declared dtype per column name (see parse_file).
+        max_workers: Number of worker processes; parses serially when 1. By default, the CPU count for
+                     workbooks above the parallel thresholds and 1 otherwise.
+        executor: Executor (e.g. a shared ProcessPoolExecutor) to reuse instead of starting one per call (optional).
+
+    Returns:
+        dict: A dictionary containing:
+              - 'data': Long-format DataFrame with a leading 'Sheet' column identifying each row's sheet.
+              - 'sheets': Names of the parsed sheets, in workbook order.
+              - 'missing_columns': Sheet name -> missing required columns, for sheets missing any.
+              - 'detected_columns': Optional columns detected in at least one sheet.
+              - 'memory_footprint': Memory used by the parsed data (see memory_footprint).
+    """
+    try:
+        if not uploaded_file.name.endswith(".xlsx"):
+            raise ValueError("Multi-sheet ingestion requires an .xlsx workbook.")
+        listed_columns = list(dict.fromkeys((required_columns or []) + (optional_columns or [])))
+        file_bytes = _read_bytes(uploaded_file)
+
+        cache_key = None
+        if cache is not None:
+            cache_key = file_cache_key(
+                file_bytes, "workbook", sheets, required_columns, optional_columns, listed_only, schema
+            )
+            cached = cache.get(cache_key)
+            if cached is not None:
+                cached["sheets"] = list(cached["data"][SHEET_COLUMN].cat.categories)
+                cached["memory_footprint"] = memory_footprint(cached["data"])
+                return cached
+
+        with pd.ExcelFile(io.BytesIO(file_bytes)) as excel_file:
+            available = excel_file.sheet_names
+            if sheets is None:
+                sheet_names = available
+            else:
+                unknown = [sheet for sheet in sheets if sheet not in available]
+                if unknown:
+                    raise ValueError(f"Sheets not found in workbook: {unknown}")
+                sheet_names = [sheet for sheet in available if sheet in sheets]
+
+            if max_workers is None and (len(sheet_names) < PARALLEL_MIN_SHEETS or len(file_bytes) < PARALLEL_MIN_BYTES):
+                max_workers = 1
+            max_workers = min(max_workers or os.cpu_count() or 1, len(sheet_names))
+            usecols_list = listed_columns if listed_only else None
+            if max_workers <= 1:
+                usecols = (lambda name: name in usecols_list) if usecols_list else None
+                parsed = [
+                    (sheet, _coerce_frame(excel_file.parse(sheet, usecols=usecols), listed_columns, schema))
+                    for sheet in sheet_names
+                ]
+        if max_workers > 1:
+            groups = [sheet_names[i::max_workers] for i in range(max_workers)]
+            tasks = [(file_bytes, group, usecols_list, listed_columns, schema) for group in groups]
+            if executor is not None:
+                by_sheet = dict(pair for group in executor.map(_parse_sheets, tasks) for pair in group)
+            else:
+                with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                    by_sheet = dict(pair for group in pool.map(_parse_sheets, tasks) for pair in group)
+            parsed = [(sheet, by_sheet[sheet]) for sheet in sheet_names]
+
+        missing_columns = {}
+        for sheet, frame in parsed:
+            missing = [col for col in required_columns or [] if col not in frame.columns]
+            if missing:
+                missing_columns[sheet] = missing
+        if missing_columns:
+            print(f"Missing required columns per sheet: {missing_columns}")
+
+        data = pd.concat(
+            [frame.assign(**{SHEET_COLUMN: sheet}) for sheet, frame in parsed], ignore_index=True
+        )
+        data[SHEET_COLUMN] = pd.Categorical(data[SHEET_COLUMN], categories=sheet_names)
+        data = data[[SHEET_COLUMN] + [col for col in data.columns if col != SHEET_COLUMN]]
+        # Columns present in only some sheets come back with gaps; re-coerce them as declared
+        data = _add_placeholders(_coerce_frame(data, listed_columns, schema), optional_columns, schema)
+
+        result = {
+            "data": data,
+            "missing_columns": missing_columns,
+            "detected_columns": [col for col in optional_columns or [] if any(col in frame.columns for _, frame in parsed)],
+        }
+        if cache_key is not None:
+            cache.put(cache_key, result)
+        result["sheets"] = sheet_names
+        result["memory_footprint"] = memory_footprint(data)
         return result
+    except Exception as e:
+        raise ValueError(f"Error processing workbook: {e}")
+
+
+def sheets_to_portfolio(data, key=SHEET_COLUMN):
+    """
+    Collapse a long-format workbook frame into one row per sheet (property), ready for
+    calculate_batch_metrics or run_pro_forma.
+
+    Flow columns (FLOW_COLUMNS) are summed per sheet, e.g. a rent roll's unit incomes or a T-12's
+    monthly lines. Other numeric columns are per-property attributes (offer price, equity, units, ...)
+    that rows may repeat, so each sheet keeps its first value.
+
+    Args:
+        data: DataFrame returned by parse_workbook.
+        key: Column identifying the property of each row.
+
+    Returns:
+        DataFrame: One row per sheet, indexed by `key`.
+    """
+    numeric = data.select_dtypes("number").columns
+    aggregations = {col: "sum" if col in FLOW_COLUMNS else "first" for col in numeric if col != key}
+    return data.groupby(key, observed=True, sort=False).agg(aggregations)
+
+
+DEFAULT_CHUNKSIZE = 100_000
+
+
+def _iter_xlsx_rows(uploaded_file, chunksize):
+    """Yield DataFrames of `chunksize` rows from the first sheet using openpyxl's read-only row iterator."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(uploaded_file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(name) if name is not None else f"Unnamed: {i}" for i, name in enumerate(header)]
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= chunksize:
+                yield pd.DataFrame(batch, columns=header)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=header)
+    finally:
+        workbook.close()
+
+
+def iter_file_chunks(uploaded_file, columns=None, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Stream an uploaded file as DataFrame chunks without loading it whole.
+    CSV files are read with pandas' chunked reader, Excel files with openpyxl in read-only mode.
+
+    Args:
+        uploaded_file: File object (Excel or CSV).
+        columns: Column names to keep; other columns are dropped as each chunk is read (optional).
+        chunksize: Number of rows per chunk.
+
+    Yields:
+        DataFrame: The next chunk of rows, restricted to `columns` when given.
+    """
+    if uploaded_file.name.endswith(".xlsx"):
+        chunks = _iter_xlsx_rows(uploaded_file, chunksize)
+    elif uploaded_file.name.endswith(".csv"):
+        usecols = (lambda name: name in columns) if columns else None
+        chunks = pd.read_csv(uploaded_file, chunksize=chunksize, usecols=usecols)
+    else:
+        raise ValueError("Unsupported file format. Please upload .xlsx or .csv files.")
+
+    for chunk in chunks:
+        if columns:
+            chunk = chunk[[col for col in chunk.columns if col in columns]]
+        yield chunk
+
+
+@timed()
+def summarize_file_streaming(uploaded_file, required_columns=None, optional_columns=None, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Aggregate an uploaded file chunk by chunk, for files too large to parse into one DataFrame.
+    Each chunk's columns are coerced to numbers as they arrive: flow columns (FLOW_COLUMNS) are
+    summed and every other column keeps its first non-missing value, so only one chunk is ever
+    held in memory. Without column lists, every column of the file is aggregated.
+
+    Args:
+        uploaded_file: File object (Excel or CSV).
+        required_columns: List of mandatory column names (optional).
+        optional_columns: List of additional column names to handle (optional).
+        chunksize: Number of rows per chunk.
+
+    Returns:
+        dict: A dictionary containing:
+              - 'data': One-row DataFrame of column totals and attribute values, usable with calculate_metrics.
+              - 'rows': Number of data rows read.
+              - 'invalid_values': Per-column count of non-numeric values coerced to 0.
+              - 'missing_columns': List of missing required columns (if any).
+              - 'detected_columns': List of detected optional/relevant columns.
+    """
+    try:
+        columns = list(dict.fromkeys((required_columns or []) + (optional_columns or [])))
+        totals = {col: 0.0 if col in FLOW_COLUMNS else np.nan for col in columns}
+        invalid_values = {col: 0 for col in columns}
+        seen_columns = set()
+        rows = 0
+
+        for chunk in iter_file_chunks(uploaded_file, columns or None, chunksize):
+            rows += len(chunk)
+            for col in chunk.columns:
+                seen_columns.add(col)
+                values = pd.to_numeric(chunk[col], errors="coerce")
+                invalid_values[col] = invalid_values.get(col, 0) + int((values.isna() & chunk[col].notna()).sum())
+                if col in FLOW_COLUMNS:
+                    totals[col] = totals.get(col, 0.0) + float(values.sum())
+                elif pd.isna(totals.get(col, np.nan)) and values.notna().any():
+                    totals[col] = float(values.dropna().iloc[0])
+                else:
+                    totals.setdefault(col, np.nan)
+
+        missing_columns = [col for col in (required_columns or []) if col not in seen_columns]
+        if missing_columns:
+            print(f"Missing required columns: {missing_columns}")
+        detected_columns = [col for col in (optional_columns or []) if col in seen_columns]
+
+        return {
+            "data": pd.DataFrame({col: [0.0 if pd.isna(total) else total] for col, total in totals.items()}),
+            "rows": rows,
+            "invalid_values": {col: count for col, count in invalid_values.items() if count},
+            "missing_columns": missing_columns,
+            "detected_columns": detected_columns,
+        }
     except Exception as e:
         raise ValueError(f"Error processing file: {e}")
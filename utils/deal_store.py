@@ -0,0 +1,235 @@
+import hashlib
+import json
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timezone
+
+import pandas as pd
+
+DEFAULT_DEAL_DB = os.getenv("UNDERWRITE_DEAL_DB", os.path.join("deals", "deals.sqlite"))
+
+# Metrics stored in their own indexed columns, so screening never has to parse JSON
+INDEXED_METRICS = {
+    "noi": "NOI",
+    "cap_rate": "Cap Rate (%)",
+    "dscr": "DSCR",
+    "cash_on_cash": "Cash on Cash Return (%)",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS deals (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    inputs_hash TEXT NOT NULL UNIQUE,
+    inputs_json TEXT NOT NULL,
+    data_ref TEXT,
+    metrics_json TEXT NOT NULL,
+    noi REAL,
+    cap_rate REAL,
+    dscr REAL,
+    cash_on_cash REAL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_deals_cap_rate ON deals (cap_rate);
+CREATE INDEX IF NOT EXISTS idx_deals_dscr ON deals (dscr);
+CREATE INDEX IF NOT EXISTS idx_deals_noi ON deals (noi);
+CREATE INDEX IF NOT EXISTS idx_deals_created_at ON deals (created_at);
+CREATE TABLE IF NOT EXISTS insights (
+    deal_id INTEGER NOT NULL REFERENCES deals (id) ON DELETE CASCADE,
+    insight_type TEXT NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (deal_id, insight_type)
+);
+CREATE TABLE IF NOT EXISTS charts (
+    deal_id INTEGER NOT NULL REFERENCES deals (id) ON DELETE CASCADE,
+    chart_type TEXT NOT NULL,
+    png BLOB NOT NULL,
+    PRIMARY KEY (deal_id, chart_type)
+);
+"""
+
+SCREEN_COLUMNS = ["id", "name", "noi", "cap_rate", "dscr", "cash_on_cash", "created_at", "updated_at"]
+SCREEN_ORDERS = {"created_at", "updated_at", "noi", "cap_rate", "dscr", "cash_on_cash", "name"}
+
+
+def inputs_hash(inputs):
+    """Stable hash of a deal's inputs: the same inputs always map to the same saved deal."""
+    payload = json.dumps(inputs, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+class DealStore:
+    """
+    SQLite file persisting analyzed deals: inputs, a reference to the parsed upload, metrics,
+    insights and chart PNGs. Headline metrics live in indexed columns for screening queries.
+
+    Every operation opens its own short-lived connection, so one store can be shared across
+    Streamlit sessions and threads.
+    """
+
+    def __init__(self, path=DEFAULT_DEAL_DB):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")  # Readers do not block the writer
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @staticmethod
+    def _deal_row(name, inputs, metrics, data_ref, now):
+        row = {
+            "name": name,
+            "inputs_hash": inputs_hash(inputs),
+            "inputs_json": json.dumps(inputs, sort_keys=True, default=str),
+            "data_ref": data_ref,
+            "metrics_json": json.dumps(metrics, default=float),
+            "created_at": now,
+            "updated_at": now,
+        }
+        for column, metric in INDEXED_METRICS.items():
+            value = metrics.get(metric)
+            row[column] = float(value) if value is not None else None
+        return row
+
+    def save_deal(self, name, inputs, metrics, data_ref=None, insights=None, charts=None):
+        """
+        Save an analyzed deal, updating the existing deal with the same inputs.
+
+        Args:
+            name: Display name of the deal.
+            inputs: Dictionary of the inputs the deal was analyzed with.
+            metrics: Dictionary returned by calculate_metrics.
+            data_ref: Reference to the parsed upload, e.g. file name and content hash (optional).
+            insights: Insight type -> generated text (optional).
+            charts: Chart type -> PNG bytes, replacing the charts saved before (optional).
+
+        Returns:
+            int: The deal id.
+        """
+        return self.save_deals([{
+            "name": name, "inputs": inputs, "metrics": metrics, "data_ref": data_ref,
+            "insights": insights, "charts": charts,
+        }])[0]
+
+    def save_deals(self, deals):
+        """
+        Save many deals in one transaction (see save_deal for the keys of each dictionary).
+
+        Returns:
+            list: The deal ids, in input order.
+        """
+        now = _now()
+        ids = []
+        with closing(self._connect()) as conn, conn:
+            for deal in deals:
+                row = self._deal_row(deal["name"], deal["inputs"], deal["metrics"], deal.get("data_ref"), now)
+                conn.execute(
+                    f"""
+                    INSERT INTO deals ({", ".join(row)}) VALUES ({", ".join("?" * len(row))})
+                    ON CONFLICT (inputs_hash) DO UPDATE SET
+                        name = excluded.name, data_ref = COALESCE(excluded.data_ref, data_ref),
+                        metrics_json = excluded.metrics_json, noi = excluded.noi, cap_rate = excluded.cap_rate,
+                        dscr = excluded.dscr, cash_on_cash = excluded.cash_on_cash, updated_at = excluded.updated_at
+                    """,
+                    list(row.values()),
+                )
+                deal_id = conn.execute("SELECT id FROM deals WHERE inputs_hash = ?", (row["inputs_hash"],)).fetchone()[0]
+                conn.executemany(
+                    "INSERT OR REPLACE INTO insights (deal_id, insight_type, text) VALUES (?, ?, ?)",
+                    [(deal_id, insight_type, text) for insight_type, text in (deal.get("insights") or {}).items() if text],
+                )
+                if deal.get("charts") is not None:
+                    # The charts saved with a deal are the ones of its latest analysis
+                    conn.execute("DELETE FROM charts WHERE deal_id = ?", (deal_id,))
+                conn.executemany(
+                    "INSERT OR REPLACE INTO charts (deal_id, chart_type, png) VALUES (?, ?, ?)",
+                    [(deal_id, chart_type, png) for chart_type, png in (deal.get("charts") or {}).items() if png],
+                )
+                ids.append(deal_id)
+        return ids
+
+    def _load(self, conn, row):
+        if row is None:
+            return None
+        deal_id = row["id"]
+        return {
+            "id": deal_id,
+            "name": row["name"],
+            "inputs": json.loads(row["inputs_json"]),
+            "data_ref": row["data_ref"],
+            "metrics": json.loads(row["metrics_json"]),
+            "insights": dict(conn.execute("SELECT insight_type, text FROM insights WHERE deal_id = ?", (deal_id,)).fetchall()),
+            "charts": dict(conn.execute("SELECT chart_type, png FROM charts WHERE deal_id = ?", (deal_id,)).fetchall()),
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    def get_deal(self, deal_id):
+        """Return a saved deal with its inputs, metrics, insights and charts, or None."""
+        with closing(self._connect()) as conn:
+            return self._load(conn, conn.execute("SELECT * FROM deals WHERE id = ?", (deal_id,)).fetchone())
+
+    def find_by_inputs(self, inputs):
+        """Return the saved deal analyzed with exactly these inputs, or None."""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM deals WHERE inputs_hash = ?", (inputs_hash(inputs),)).fetchone()
+            return self._load(conn, row)
+
+    def delete_deal(self, deal_id):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM deals WHERE id = ?", (deal_id,))
+
+    def screen(self, min_cap_rate=None, max_cap_rate=None, min_dscr=None, max_dscr=None, min_noi=None, max_noi=None,
+               since=None, until=None, order_by="created_at", descending=True, limit=None):
+        """
+        Screen saved deals on their indexed metrics, e.g. screen(max_dscr=1.25, min_cap_rate=6).
+        Lower bounds are inclusive and upper bounds exclusive.
+
+        Args:
+            min_cap_rate, max_cap_rate: Cap rate bounds in %.
+            min_dscr, max_dscr: DSCR bounds.
+            min_noi, max_noi: NOI bounds.
+            since, until: Bounds on the creation date (ISO date or datetime strings).
+            order_by: Column to sort by (created_at, updated_at, noi, cap_rate, dscr, cash_on_cash, name).
+            descending: Sort direction.
+            limit: Maximum number of deals returned (optional).
+
+        Returns:
+            DataFrame: id, name, noi, cap_rate, dscr, cash_on_cash, created_at and updated_at per matching deal.
+        """
+        if order_by not in SCREEN_ORDERS:
+            raise ValueError(f"Unsupported order_by: {order_by}. Please choose one of {sorted(SCREEN_ORDERS)}.")
+        bounds = [
+            ("cap_rate >= ?", min_cap_rate), ("cap_rate < ?", max_cap_rate),
+            ("dscr >= ?", min_dscr), ("dscr < ?", max_dscr),
+            ("noi >= ?", min_noi), ("noi < ?", max_noi),
+            ("created_at >= ?", since), ("created_at < ?", until),
+        ]
+        conditions = [condition for condition, value in bounds if value is not None]
+        params = [value for _, value in bounds if value is not None]
+
+        query = f"SELECT {', '.join(SCREEN_COLUMNS)} FROM deals"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += f" ORDER BY {order_by} {'DESC' if descending else 'ASC'}"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(int(limit))
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(query, conn, params=params)
+
+    def count(self):
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM deals").fetchone()[0]
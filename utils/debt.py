@@ -0,0 +1,198 @@
+import numpy as np
+import pandas as pd
+
+from utils.profiling import timed
+from utils.proforma import loan_payment, remaining_balance
+
+# Columns read by size_loans, mapped to the default used when a column is absent.
+# A constraint set to 0 is not applied.
+DEBT_INPUT_COLUMNS = {
+    "Offer Price": 0.0,
+    "Income": 0.0,
+    "Expenses": 0.0,
+    "Renovation Cost": 0.0,
+    "Interest Rate (%)": 0.0,
+    "Amortization (Years)": 30.0,
+    "Interest Only (Years)": 0.0,
+    "Loan Term (Years)": 10.0,
+    "Min DSCR": 1.25,
+    "Max LTV (%)": 75.0,
+    "Min Debt Yield (%)": 8.0,
+}
+
+# Sizing constraints in the order they are reported as binding
+CONSTRAINTS = ["DSCR", "LTV", "Debt Yield"]
+
+
+def _read_columns(portfolio):
+    columns = {}
+    for col, default in DEBT_INPUT_COLUMNS.items():
+        if col in portfolio.columns:
+            values = pd.to_numeric(portfolio[col], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+            columns[col] = np.nan_to_num(values, nan=default)
+        else:
+            columns[col] = np.full(len(portfolio), default, dtype="float64")
+    return columns
+
+
+def _balances(loan, annual_rate, amortization_years, io_years, years):
+    """Balance after each year: flat during the interest-only period, then amortizing."""
+    loan, annual_rate, amortization_years, io_years = (
+        np.asarray(value, dtype="float64")[:, None] for value in (loan, annual_rate, amortization_years, io_years)
+    )
+    amortizing_years = np.clip(years - io_years, 0, None)
+    return remaining_balance(loan, annual_rate, amortization_years, amortizing_years)
+
+
+@timed()
+def size_loans(portfolio):
+    """
+    Size the maximum loan of every property under DSCR, LTV and debt-yield constraints.
+
+    The DSCR constraint is sized on the amortizing payment, so an interest-only period does
+    not inflate the loan. The binding constraint is the one giving the smallest loan.
+
+    Args:
+        portfolio: DataFrame with one row per property; see DEBT_INPUT_COLUMNS for the
+                   recognised columns (rates in %). NOI is Income less Expenses.
+
+    Returns:
+        DataFrame: One row per property (same index as `portfolio`) with the loan allowed by
+                   each constraint, 'Max Loan ($)', 'Binding Constraint', 'Annual Debt Service ($)',
+                   'Interest Only Payment ($)', the resulting 'DSCR', 'LTV (%)' and 'Debt Yield (%)',
+                   'Balloon Balance ($)' at the end of the term and 'Equity Required ($)'.
+    """
+    try:
+        columns = _read_columns(portfolio)
+        price = columns["Offer Price"]
+        noi = columns["Income"] - columns["Expenses"]
+        rate = columns["Interest Rate (%)"] / 100
+        amortization = columns["Amortization (Years)"]
+        io_years = np.clip(columns["Interest Only (Years)"], 0, None)
+        term = columns["Loan Term (Years)"]
+
+        # Debt service per dollar borrowed; 0 only for a 0% interest-only loan, which DSCR cannot limit
+        loan_constant = loan_payment(1.0, rate, amortization)
+        max_debt_service = np.divide(noi, columns["Min DSCR"], out=np.full_like(noi, np.inf), where=columns["Min DSCR"] > 0)
+        debt_yield = columns["Min Debt Yield (%)"] / 100
+        limits = np.column_stack([
+            np.divide(max_debt_service, loan_constant, out=np.full_like(noi, np.inf), where=loan_constant > 0),
+            np.where(columns["Max LTV (%)"] > 0, price * columns["Max LTV (%)"] / 100, np.inf),
+            np.divide(noi, debt_yield, out=np.full_like(noi, np.inf), where=debt_yield > 0),
+        ])
+        limits = np.clip(limits, 0, None)
+        binding = limits.argmin(axis=1)
+        loan = limits[np.arange(len(price)), binding]
+        unconstrained = ~np.isfinite(loan)
+        loan = np.where(unconstrained, 0.0, loan)
+
+        debt_service = loan * loan_constant
+        balloon = _balances(loan, rate, amortization, io_years, term[:, None])[:, 0]
+        metrics = pd.DataFrame(
+            {
+                "Loan (DSCR) ($)": limits[:, 0],
+                "Loan (LTV) ($)": limits[:, 1],
+                "Loan (Debt Yield) ($)": limits[:, 2],
+                "Max Loan ($)": loan,
+                "Binding Constraint": np.where(unconstrained, "None", np.array(CONSTRAINTS)[binding]),
+                "Annual Debt Service ($)": debt_service,
+                "Interest Only Payment ($)": np.where(io_years > 0, loan * rate, 0.0),
+                "DSCR": np.divide(noi, debt_service, out=np.zeros_like(noi), where=debt_service > 0),
+                "LTV (%)": np.divide(loan, price, out=np.zeros_like(noi), where=price > 0) * 100,
+                "Debt Yield (%)": np.divide(noi, loan, out=np.zeros_like(noi), where=loan > 0) * 100,
+                "Balloon Balance ($)": balloon,
+                "Equity Required ($)": price + columns["Renovation Cost"] - loan,
+            },
+            index=portfolio.index,
+        )
+        numeric = metrics.columns != "Binding Constraint"
+        # Unconstrained limits stay inf so the table shows which constraints were not applied
+        metrics.loc[:, numeric] = metrics.loc[:, numeric].round(2)
+        return metrics
+    except Exception as e:
+        raise ValueError(f"Error sizing loans: {e}")
+
+
+@timed()
+def size_loans_grid(portfolio, interest_rates, amortization_years):
+    """
+    Size every property's loan across a grid of interest rates and amortization periods in one call.
+
+    Args:
+        portfolio: DataFrame with one row per property (see size_loans).
+        interest_rates: Interest rates in % to stress-test.
+        amortization_years: Amortization periods in years to stress-test.
+
+    Returns:
+        DataFrame: The size_loans columns for every (property, rate, amortization), indexed by
+                   the portfolio index plus 'Interest Rate (%)' and 'Amortization (Years)'.
+    """
+    rates, amortizations = np.meshgrid(
+        np.asarray(interest_rates, dtype="float64"), np.asarray(amortization_years, dtype="float64"), indexing="ij"
+    )
+    n_scenarios = rates.size
+    scenarios = portfolio.iloc[np.repeat(np.arange(len(portfolio)), n_scenarios)].copy()
+    scenarios["Interest Rate (%)"] = np.tile(rates.ravel(), len(portfolio))
+    scenarios["Amortization (Years)"] = np.tile(amortizations.ravel(), len(portfolio))
+
+    index_names = [name or "Property" for name in portfolio.index.names]
+    sized = size_loans(scenarios.reset_index(drop=True))
+    sized.index = pd.MultiIndex.from_arrays(
+        [np.repeat(portfolio.index.to_numpy(), n_scenarios), scenarios["Interest Rate (%)"].to_numpy(),
+         scenarios["Amortization (Years)"].to_numpy()],
+        names=[*index_names, "Interest Rate (%)", "Amortization (Years)"],
+    )
+    return sized
+
+
+def amortization_schedules(loan_amount, interest_rate, amortization_years, io_years=0, term_years=10):
+    """
+    Year-by-year amortization schedules of many loans at once.
+
+    Args:
+        loan_amount: Loan amount(s).
+        interest_rate: Interest rate(s) in %.
+        amortization_years: Amortization period(s) in years (0 means interest only).
+        io_years: Interest-only years before amortization starts.
+        term_years: Number of years scheduled.
+
+    Returns:
+        dict: Arrays shaped (loans, term + 1), year 0 first: 'Balance' (end of year),
+              'Payment', 'Interest' and 'Principal'; the final 'Principal' includes the balloon.
+    """
+    loan, rate, amortization, io_years = np.broadcast_arrays(
+        *(np.atleast_1d(np.asarray(value, dtype="float64")) for value in (loan_amount, interest_rate, amortization_years, io_years))
+    )
+    rate = rate / 100
+    years = np.arange(int(term_years) + 1)[None, :]
+    balance = _balances(loan, rate, amortization, io_years, years)
+
+    interest = np.zeros_like(balance)
+    interest[:, 1:] = balance[:, :-1] * rate[:, None]
+    principal = np.zeros_like(balance)
+    principal[:, 1:] = balance[:, :-1] - balance[:, 1:]
+    # The balloon is repaid at the end of the term
+    principal[:, -1] += balance[:, -1]
+    balance[:, -1] = 0.0
+    return {
+        "Balance": balance,
+        "Payment": interest + principal,
+        "Interest": interest,
+        "Principal": principal,
+    }
+
+
+def amortization_table(schedules, row=0):
+    """
+    Amortization schedule of one loan, for display.
+
+    Args:
+        schedules: Result of amortization_schedules.
+        row: Position of the loan.
+
+    Returns:
+        DataFrame: One row per year with payment, interest, principal and ending balance.
+    """
+    table = pd.DataFrame({name: schedules[name][row] for name in ["Payment", "Interest", "Principal", "Balance"]})
+    table.index.name = "Year"
+    return table.iloc[1:].round(2)
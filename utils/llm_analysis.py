@@ -1,12 +1,307 @@
-import openai
+import hashlib
+import json
 import os
 from dotenv import load_dotenv
 
+from utils.profiling import timed
+
 # Load API key from .env file
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-def generate_insights(metrics, model="gpt-4", insight_type="general"):
+INSIGHT_TYPES = ["general", "improvement", "risk analysis", "investment potential"]
+SYSTEM_PROMPT = "You are a financial analysis assistant specializing in real estate underwriting."
+MAX_TOKENS = 700  # Increased to allow for more detailed insights
+TEMPERATURE = 0.5  # Balanced creativity
+
+DEFAULT_INSIGHT_CACHE_DIR = os.getenv(
+    "UNDERWRITE_INSIGHT_CACHE_DIR", os.path.join(".underwrite_cache", "insights")
+)
+
+
+# Fixed guidance shared by every insight type. It sits in the system message ahead of the
+# property data, so requests for the same property share one prompt prefix (which providers
+# cache) and differ only in the closing instruction.
+ANALYSIS_GUIDANCE = (
+    "Consider NOI, Cap Rate, Cash-on-Cash Return, DSCR, Breakeven Occupancy, Year Built, "
+    "Number of Units, Market Rent and market trends, sensitivity to rent and expense changes, "
+    "and amenity income such as parking and laundry. Metrics that are not listed were not provided."
+)
+
+INSIGHT_INSTRUCTIONS = {
+    "general": "Provide a general analysis of the financial health and performance of the property.",
+    "improvement": "Suggest ways to improve these metrics and optimize property performance.",
+    "risk analysis": "Identify potential risks associated with these metrics and propose mitigation strategies.",
+    "investment potential": "Evaluate the investment potential of this property based on these metrics.",
+}
+
+# Per-request token budget (prompt + completion), estimated locally before sending
+TOKEN_BUDGET = 2000
+MIN_COMPLETION_TOKENS = 150
+
+# Batch mode: many properties per request, each answered under its own heading
+BATCH_TOKEN_BUDGET = 8000
+BATCH_TOKENS_PER_PROPERTY = 250
+BATCH_MAX_PROPERTIES = 10  # Keeps each answer focused even when the budget would allow more
+BATCH_HEADING = "### "
+
+# Bump when the prompt layout changes so cached insights from older prompts are not reused
+PROMPT_VERSION = 2
+
+
+def estimate_tokens(text):
+    """
+    Estimate the number of tokens in `text`.
+
+    Uses tiktoken's cl100k_base encoding when tiktoken is installed, otherwise the usual
+    ~4 characters per token approximation for English text.
+    """
+    encoding = _token_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def _token_encoding():
+    global _ENCODING
+    if _ENCODING is False:
+        try:
+            import tiktoken
+
+            _ENCODING = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _ENCODING = None
+    return _ENCODING
+
+
+_ENCODING = False  # Resolved on first use
+
+
+def _format_value(key, value):
+    """Format one metric compactly: $1.25M, $480k, 6.75%, 1.42x."""
+    if key.endswith("(%)"):
+        return f"{value:.2f}".rstrip("0").rstrip(".") + "%"
+    if key == "DSCR":
+        return f"{value:.2f}x"
+    if "($" in key or key in ("NOI",):
+        magnitude = abs(value)
+        if magnitude >= 1_000_000:
+            return f"${value / 1_000_000:.2f}M"
+        if magnitude >= 10_000:
+            return f"${value / 1_000:.0f}k"
+        return f"${value:,.0f}"
+    return f"{value:,.2f}".rstrip("0").rstrip(".")
+
+
+def format_metrics(metrics):
+    """
+    Render metrics as compact "Name: value" lines, dropping zero, missing and non-numeric values.
+
+    Args:
+        metrics: Dictionary of financial metrics.
+
+    Returns:
+        str: One metric per line, units moved from the name into the value.
+    """
+    lines = []
+    for key, value in metrics.items():
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            continue
+        if value == 0 or value != value:  # Zero or NaN: not provided
+            continue
+        name = key.replace(" (%)", "").replace(" ($/yr)", "").replace(" ($)", "")
+        lines.append(f"{name}: {_format_value(key, value)}{'/yr' if key.endswith('($/yr)') else ''}")
+    return "\n".join(lines)
+
+
+def _fit_context(context, available_tokens):
+    """Drop trailing context lines until the context fits in `available_tokens`."""
+    lines = context.splitlines()
+    while lines and estimate_tokens("\n".join(lines)) > available_tokens:
+        lines.pop()
+    return "\n".join(lines)
+
+
+def build_prompt(metrics, insight_type="general", context=None):
+    """
+    Build the user prompt sent to the model for one insight type.
+
+    Args:
+        metrics: Dictionary of financial metrics.
+        insight_type: Type of insights to generate.
+        context: Additional text to ground the analysis (optional).
+
+    Returns:
+        str: The prompt text.
+    """
+    prompt = f"Property metrics:\n{format_metrics(metrics)}"
+    if context:
+        prompt += f"\n\nAdditional context (cite these figures where relevant):\n{context}"
+    instruction = INSIGHT_INSTRUCTIONS.get(insight_type, "Provide useful insights related to these metrics.")
+    return f"{prompt}\n\n{instruction}"
+
+
+def build_messages(metrics, insight_type="general", context=None, token_budget=TOKEN_BUDGET, max_tokens=None):
+    """
+    Build the chat messages for one insight request within a token budget.
+
+    The system message (role and shared guidance) is identical for every request. When the
+    prompt would leave less than MIN_COMPLETION_TOKENS of the budget for the answer, the
+    context is trimmed line by line.
+
+    Args:
+        metrics: Dictionary of financial metrics.
+        insight_type: Type of insights to generate.
+        context: Additional text to ground the analysis (optional).
+        token_budget: Maximum prompt plus completion tokens for the request.
+        max_tokens: Upper bound on the completion (default: MAX_TOKENS).
+
+    Returns:
+        tuple: (messages, max_tokens) where max_tokens is what is left of the budget for the answer.
+    """
+    system = f"{SYSTEM_PROMPT} {ANALYSIS_GUIDANCE}"
+    prompt = build_prompt(metrics, insight_type, context)
+    prompt_tokens = estimate_tokens(system) + estimate_tokens(prompt)
+    if context and prompt_tokens > token_budget - MIN_COMPLETION_TOKENS:
+        without_context = estimate_tokens(system) + estimate_tokens(build_prompt(metrics, insight_type))
+        context = _fit_context(context, token_budget - MIN_COMPLETION_TOKENS - without_context - 20)
+        prompt = build_prompt(metrics, insight_type, context)
+        prompt_tokens = estimate_tokens(system) + estimate_tokens(prompt)
+    if prompt_tokens > token_budget - MIN_COMPLETION_TOKENS:
+        raise ValueError(f"Prompt of ~{prompt_tokens} tokens does not fit the {token_budget}-token budget.")
+
+    messages = [{"role": "system", "content": system}, {"role": "user", "content": prompt}]
+    return messages, min(max_tokens or MAX_TOKENS, token_budget - prompt_tokens)
+
+
+def build_batch_messages(properties, insight_type="general", token_budget=BATCH_TOKEN_BUDGET):
+    """
+    Build one request analyzing several properties, each to be answered under its own heading.
+
+    Args:
+        properties: Ordered mapping of property name to its metrics dictionary.
+        insight_type: Type of insights to generate for every property.
+        token_budget: Maximum prompt plus completion tokens for the request.
+
+    Returns:
+        tuple: (messages, max_tokens).
+    """
+    blocks = [f"{BATCH_HEADING}{name}\n{format_metrics(metrics)}" for name, metrics in properties.items()]
+    instruction = INSIGHT_INSTRUCTIONS.get(insight_type, "Provide useful insights related to these metrics.")
+    prompt = (
+        "\n\n".join(blocks)
+        + f"\n\nFor each property above: {instruction} Answer every property separately, starting each "
+        f"answer with a line '{BATCH_HEADING}<property name>' exactly as given, in the same order, "
+        f"in at most {BATCH_TOKENS_PER_PROPERTY * 3 // 4} words each."
+    )
+    system = f"{SYSTEM_PROMPT} {ANALYSIS_GUIDANCE}"
+    prompt_tokens = estimate_tokens(system) + estimate_tokens(prompt)
+    completion_tokens = BATCH_TOKENS_PER_PROPERTY * len(properties)
+    if prompt_tokens + completion_tokens > token_budget:
+        raise ValueError(f"Batch of {len(properties)} properties does not fit the {token_budget}-token budget.")
+    return [{"role": "system", "content": system}, {"role": "user", "content": prompt}], completion_tokens
+
+
+def plan_batches(properties, token_budget=BATCH_TOKEN_BUDGET, max_properties=BATCH_MAX_PROPERTIES):
+    """
+    Split properties into consecutive batches that each fit `token_budget` and hold at most
+    `max_properties` properties.
+
+    Returns:
+        list: Lists of property names, one per request.
+    """
+    overhead = estimate_tokens(f"{SYSTEM_PROMPT} {ANALYSIS_GUIDANCE}") + 80
+    batches, current, used = [], [], overhead
+    for name, metrics in properties.items():
+        cost = estimate_tokens(f"{BATCH_HEADING}{name}\n{format_metrics(metrics)}") + BATCH_TOKENS_PER_PROPERTY
+        if current and (used + cost > token_budget or len(current) >= max_properties):
+            batches.append(current)
+            current, used = [], overhead
+        current.append(name)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def split_batch_response(text, names):
+    """
+    Split a batch answer back into one text per property.
+
+    Args:
+        text: Model response with one '### <name>' section per property.
+        names: Property names in the order they were sent.
+
+    Returns:
+        dict: Property name -> its section (empty string when the model skipped it).
+    """
+    sections = {}
+    current = None
+    lines = []
+    for line in text.splitlines():
+        heading = line.strip().lstrip("#").strip().strip("*").strip()
+        if line.strip().startswith("#") and heading in names:
+            if current is not None:
+                sections[current] = "\n".join(lines).strip()
+            current, lines = heading, []
+        elif current is not None:
+            lines.append(line)
+    if current is not None:
+        sections[current] = "\n".join(lines).strip()
+    return {name: sections.get(name, "") for name in names}
+
+
+def _canonical_metrics(metrics):
+    """Metrics as a JSON-stable mapping: sorted keys, plain floats rounded to cents."""
+    canonical = {}
+    for key, value in sorted(metrics.items()):
+        try:
+            canonical[str(key)] = round(float(value), 2)
+        except (TypeError, ValueError):
+            canonical[str(key)] = str(value)
+    return canonical
+
+
+class InsightCache:
+    """
+    On-disk memo of generated insights, keyed by (model, insight_type, canonicalized metrics, context),
+    so reruns and PDF exports of the same analysis do not call the API again.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_INSIGHT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(model, insight_type, metrics, context=None):
+        payload = json.dumps(
+            [PROMPT_VERSION, model, insight_type, _canonical_metrics(metrics), context or ""], sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def get(self, key):
+        """Return the cached insight text for `key`, or None on a miss."""
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)["text"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, key, text):
+        """Store the insight text for `key`."""
+        tmp_path = f"{self._path(key)}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"text": text}, f)
+        os.replace(tmp_path, self._path(key))
+
+
+@timed()
+def generate_insights(metrics, model="gpt-4", insight_type="general", context=None, cache=None):
     """
     Generate insights using OpenAI Chat API.
 
@@ -14,51 +309,36 @@ def generate_insights(metrics, model="gpt-4", insight_type="general"):
         metrics: Dictionary of financial metrics.
         model: OpenAI model to use (default: "gpt-4").
         insight_type: Type of insights to generate (e.g., "general", "improvement", "risk analysis", "investment potential").
+        context: Additional text to ground the analysis, e.g. a Monte Carlo risk summary (optional).
+        cache: InsightCache used to reuse earlier responses for the same inputs (optional).
     
     Returns:
         str: Generated insights.
     """
+    cache_key = InsightCache.key(model, insight_type, metrics, context) if cache is not None else None
+    if cache_key is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+
     if not OPENAI_API_KEY:
         raise ValueError("OpenAI API key is not set. Please check your .env file.")
     
+    import openai  # Imported on first use to keep headless start-up fast
+
     openai.api_key = OPENAI_API_KEY
 
-    # Construct prompt dynamically
-    prompt = f"Analyze the following financial metrics and property details:\n{metrics}\n\n"
-
-    # Add dynamic insight type handling
-    if insight_type == "general":
-        prompt += "Provide a general analysis of the financial health and performance of the property."
-    elif insight_type == "improvement":
-        prompt += "Suggest ways to improve these metrics and optimize property performance."
-    elif insight_type == "risk analysis":
-        prompt += "Identify potential risks associated with these metrics and propose mitigation strategies."
-    elif insight_type == "investment potential":
-        prompt += "Evaluate the investment potential of this property based on these metrics."
-    else:
-        prompt += "Provide useful insights related to these metrics."
-
-    # Include detailed context for OpenAI analysis
-    prompt += (
-        "\nConsider factors such as Net Operating Income (NOI), Cap Rate, "
-        "Cash-on-Cash Return, Debt Service Coverage Ratio (DSCR), Breakeven Occupancy, "
-        "Year Built, Number of Units, Market Rent, and market trends in your analysis. "
-        "Additionally, evaluate sensitivity to rent variations, expense changes, and "
-        "amenities such as parking and laundry income."
-    )
+    messages, max_tokens = build_messages(metrics, insight_type, context)
 
     try:
         # Generate the response from OpenAI
         response = openai.ChatCompletion.create(
             model=model,
-            messages=[
-                {"role": "system", "content": "You are a financial analysis assistant specializing in real estate underwriting."},
-                {"role": "user", "content": prompt},
-            ],
-            max_tokens=700,  # Increased to allow for more detailed insights
-            temperature=0.5,  # Balanced creativity
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=TEMPERATURE,
         )
-        return response['choices'][0]['message']['content'].strip()
+        insights = response['choices'][0]['message']['content'].strip()
     except openai.error.InvalidRequestError as e:
         raise ValueError(f"OpenAI API request error: {e}")
     except openai.error.AuthenticationError:
@@ -67,3 +347,7 @@ def generate_insights(metrics, model="gpt-4", insight_type="general"):
         raise ValueError(f"OpenAI API error: {e}")
     except Exception as e:
         raise ValueError(f"Unexpected error: {e}")
+
+    if cache_key is not None:
+        cache.put(cache_key, insights)
+    return insights
@@ -0,0 +1,139 @@
+import hashlib
+import io
+import json
+import os
+import pickle
+import tempfile
+
+import pandas as pd
+
+DEFAULT_CACHE_DIR = os.getenv("UNDERWRITE_CACHE_DIR", os.path.join(".underwrite_cache", "parse"))
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # 512 MB
+
+# Bump when parse_file output changes so stale entries are never served
+CACHE_VERSION = 4
+
+
+def file_cache_key(file_bytes, *spec):
+    """
+    Build a cache key from the raw file bytes plus anything else that affects the parse
+    (file extension, column lists, ...).
+
+    Args:
+        file_bytes: Raw bytes of the uploaded file.
+        *spec: JSON-serialisable values describing how the file is parsed.
+
+    Returns:
+        str: Hex SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+    digest.update(file_bytes)
+    digest.update(json.dumps([CACHE_VERSION, *spec], sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """
+    Size-bounded on-disk cache of parse_file results.
+
+    Each entry is a columnar Parquet file (pickle when pyarrow is unavailable or the frame
+    cannot be stored as Parquet) plus a small JSON sidecar holding the column lists. Hits
+    refresh the entry's modification time, and the least recently used entries are evicted
+    once the cache grows past `max_bytes`.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + ".json", base + ".data"
+
+    def get(self, key):
+        """
+        Return the cached parse_file result for `key`, or None on a miss.
+        """
+        meta_path, data_path = self._paths(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["format"] == "parquet":
+                data = pd.read_parquet(data_path)
+            else:
+                with open(data_path, "rb") as f:
+                    data = pickle.load(f)
+            os.utime(meta_path)
+            os.utime(data_path)
+        except (OSError, ValueError, KeyError, pickle.UnpicklingError):
+            return None
+
+        return {
+            "data": data,
+            "missing_columns": meta["missing_columns"],
+            "detected_columns": meta["detected_columns"],
+        }
+
+    def put(self, key, result):
+        """
+        Store a parse_file result under `key`, then evict old entries if over budget.
+        """
+        meta_path, data_path = self._paths(key)
+        buffer = io.BytesIO()
+        try:
+            result["data"].to_parquet(buffer)
+            file_format = "parquet"
+        except Exception:
+            buffer = io.BytesIO(pickle.dumps(result["data"], protocol=pickle.HIGHEST_PROTOCOL))
+            file_format = "pickle"
+
+        meta = {
+            "format": file_format,
+            "missing_columns": result["missing_columns"],
+            "detected_columns": list(result["detected_columns"]),
+        }
+        # Write to temporary files first so concurrent readers never see a partial entry
+        self._atomic_write(data_path, buffer.getvalue())
+        self._atomic_write(meta_path, json.dumps(meta).encode("utf-8"))
+        self._evict()
+
+    def _atomic_write(self, path, payload):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _evict(self):
+        entries = {}
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".tmp"):
+                continue
+            key = os.path.splitext(name)[0]
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue  # Evicted by another session meanwhile
+            size, last_used = entries.get(key, (0, 0))
+            entries[key] = (size + stat.st_size, max(last_used, stat.st_mtime))
+
+        total = sum(size for size, _ in entries.values())
+        for key, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+            if total <= self.max_bytes:
+                break
+            for path in self._paths(key):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+    def clear(self):
+        """Remove every cached entry."""
+        for name in os.listdir(self.cache_dir):
+            os.remove(os.path.join(self.cache_dir, name))
@@ -0,0 +1,190 @@
+import contextvars
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from functools import wraps
+
+logger = logging.getLogger("underwrite.profiling")
+
+# Stage timings are logged for every call when enabled globally (UNDERWRITE_PROFILE=1), and
+# collected whenever a ProfilingRun is active. Otherwise @timed costs one flag check.
+_enabled = os.getenv("UNDERWRITE_PROFILE", "").lower() not in ("", "0", "false", "no")
+_current_run = contextvars.ContextVar("underwrite_profiling_run", default=None)
+
+CAPTURE_MODES = (None, "cprofile", "tracemalloc")
+
+# cProfile and tracemalloc are process-wide, so only one run captures at a time (e.g. across
+# Streamlit sessions); the others skip the capture but still collect their own stage timings.
+_capture_lock = threading.Lock()
+
+
+def enable(flag=True):
+    """Turn per-stage structured logging on or off for the whole process."""
+    global _enabled
+    _enabled = bool(flag)
+
+
+def is_enabled():
+    return _enabled
+
+
+def _record(stage, seconds, run):
+    if run is not None:
+        run.timings.append({"stage": stage, "seconds": seconds})
+    if _enabled:
+        logger.info(json.dumps({
+            "event": "stage", "stage": stage, "seconds": round(seconds, 6),
+            "run": run.run_id if run is not None else None,
+        }))
+
+
+@contextmanager
+def timed_stage(stage):
+    """
+    Time a block of code as a named stage.
+
+    Args:
+        stage: Name recorded for the block.
+    """
+    run = _current_run.get()
+    if run is None and not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(stage, time.perf_counter() - start, run)
+
+
+def timed(stage=None):
+    """
+    Decorator recording the wall time of each call as a stage.
+
+    Args:
+        stage: Name recorded for the stage (default: the function name).
+    """
+    def decorator(fn):
+        name = stage or fn.__qualname__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            run = _current_run.get()
+            if run is None and not _enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _record(name, time.perf_counter() - start, run)
+
+        return wrapper
+
+    return decorator
+
+
+class ProfilingRun:
+    """
+    Collects the stage timings of one pipeline run (e.g. one Analyze click), optionally
+    capturing a cProfile profile or tracemalloc peak memory for the same span.
+
+    Use as a context manager, or call start() and stop() explicitly. When another run is
+    already capturing, this run's capture is skipped (capture_skipped is True).
+    """
+
+    def __init__(self, name="run", capture=None):
+        if capture not in CAPTURE_MODES:
+            raise ValueError(f"Unsupported capture mode: {capture}. Please choose one of {CAPTURE_MODES}.")
+        self.name = name
+        self.capture = capture
+        self.run_id = uuid.uuid4().hex[:12]
+        self.timings = []
+        self.total_seconds = None
+        self.peak_memory_mb = None
+        self.profile_text = None
+        self.capture_skipped = False
+        self._capturing = False
+        self._profiler = None
+        self._token = None
+        self._start = None
+
+    def start(self):
+        self._capturing = self.capture is not None and _capture_lock.acquire(blocking=False)
+        self.capture_skipped = self.capture is not None and not self._capturing
+        try:
+            if self._capturing and self.capture == "cprofile":
+                profiler = cProfile.Profile()
+                profiler.enable()
+                self._profiler = profiler
+            elif self._capturing and self.capture == "tracemalloc":
+                tracemalloc.start()
+        except Exception:
+            self._release()
+            raise
+        self._token = _current_run.set(self)
+        self._start = time.perf_counter()
+        return self
+
+    def _release(self):
+        if self._capturing:
+            self._capturing = False
+            _capture_lock.release()
+
+    def stop(self):
+        if self._start is None:
+            return self  # start() failed or was never called
+        self.total_seconds = time.perf_counter() - self._start
+        try:
+            if self._profiler is not None:
+                self._profiler.disable()
+                stream = io.StringIO()
+                pstats.Stats(self._profiler, stream=stream).sort_stats("cumulative").print_stats(25)
+                self.profile_text = stream.getvalue()
+            elif self._capturing and self.capture == "tracemalloc":
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                self.peak_memory_mb = round(peak / 1024 / 1024, 3)
+        finally:
+            self._release()
+            _current_run.reset(self._token)
+
+        logger.info(json.dumps({
+            "event": "run", "name": self.name, "run": self.run_id,
+            "total_seconds": round(self.total_seconds, 6), "peak_memory_mb": self.peak_memory_mb,
+            "stages": self.breakdown(),
+        }))
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def breakdown(self):
+        """
+        Aggregate the recorded timings per stage, slowest first.
+
+        Returns:
+            list: Dictionaries with 'stage', 'calls', 'seconds' and 'share' (of the run's total time).
+        """
+        totals = {}
+        for timing in self.timings:
+            calls, seconds = totals.get(timing["stage"], (0, 0.0))
+            totals[timing["stage"]] = (calls + 1, seconds + timing["seconds"])
+
+        total = self.total_seconds or sum(seconds for _, seconds in totals.values()) or 1
+        rows = [
+            {"stage": stage, "calls": calls, "seconds": round(seconds, 6), "share": round(seconds / total, 4)}
+            for stage, (calls, seconds) in totals.items()
+        ]
+        return sorted(rows, key=lambda row: row["seconds"], reverse=True)
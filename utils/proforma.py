@@ -0,0 +1,335 @@
+import numpy as np
+import pandas as pd
+
+from utils.profiling import timed
+
+# Columns read by project_cash_flows, mapped to the default used when a column is absent.
+PRO_FORMA_INPUT_COLUMNS = {
+    "Offer Price": 0.0,
+    "Income": 0.0,
+    "Expenses": 0.0,
+    "Equity": 0.0,
+    "Loan Amount": np.nan,  # Derived from Equity when absent
+    "Debt Service": 0.0,
+    "Interest Rate (%)": 0.0,
+    "Amortization (Years)": 30.0,
+    "Holding Period": 5.0,
+    "Market Growth Rate": 0.0,
+    "Expense Growth Rate": np.nan,  # Follows Market Growth Rate when absent
+    "Projected Cap Rate at Sale": 0.0,
+    "Renovation Cost": 0.0,
+    "CapEx": 0.0,
+    "Selling Costs (%)": 0.0,
+}
+
+
+def loan_payment(principal, annual_rate, amortization_years):
+    """
+    Annual payment of a fully amortizing loan (interest only when amortization is 0).
+
+    Args:
+        principal: Loan amount(s).
+        annual_rate: Interest rate(s) as a decimal (e.g. 0.065).
+        amortization_years: Amortization period(s) in years.
+
+    Returns:
+        ndarray: Annual debt service for every input (broadcast together).
+    """
+    principal, annual_rate, amortization_years = np.broadcast_arrays(
+        np.asarray(principal, dtype="float64"),
+        np.asarray(annual_rate, dtype="float64"),
+        np.asarray(amortization_years, dtype="float64"),
+    )
+    payment = principal * annual_rate  # Interest only
+    amortizing = amortization_years > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        growth = (1 + annual_rate) ** amortization_years
+        annuity = principal * annual_rate * growth / (growth - 1)
+        straight_line = principal / amortization_years
+    payment = np.where(amortizing & (annual_rate != 0), annuity, payment)
+    payment = np.where(amortizing & (annual_rate == 0), straight_line, payment)
+    return payment
+
+
+def remaining_balance(principal, annual_rate, amortization_years, years_elapsed):
+    """
+    Outstanding balance of a loan after `years_elapsed` annual payments.
+
+    Args:
+        principal: Loan amount(s).
+        annual_rate: Interest rate(s) as a decimal.
+        amortization_years: Amortization period(s) in years (0 means interest only).
+        years_elapsed: Number of payments made.
+
+    Returns:
+        ndarray: Outstanding balance for every input (broadcast together).
+    """
+    principal, annual_rate, amortization_years, years_elapsed = np.broadcast_arrays(
+        np.asarray(principal, dtype="float64"),
+        np.asarray(annual_rate, dtype="float64"),
+        np.asarray(amortization_years, dtype="float64"),
+        np.asarray(years_elapsed, dtype="float64"),
+    )
+    payment = loan_payment(principal, annual_rate, amortization_years)
+    growth = (1 + annual_rate) ** years_elapsed
+    with np.errstate(divide="ignore", invalid="ignore"):
+        balance = np.where(
+            annual_rate != 0,
+            principal * growth - payment * (growth - 1) / annual_rate,
+            principal - payment * years_elapsed,
+        )
+    balance = np.where(amortization_years > 0, balance, principal)
+    return np.clip(balance, 0, None)
+
+
+def npv(rate, cash_flows):
+    """
+    Net present value of rows of annual cash flows (year 0 first).
+
+    Args:
+        rate: Discount rate(s) as a decimal; a scalar or one rate per row.
+        cash_flows: 2-D array shaped (properties, years + 1).
+
+    Returns:
+        ndarray: NPV of every row.
+    """
+    cash_flows = np.atleast_2d(np.asarray(cash_flows, dtype="float64"))
+    rate = np.asarray(rate, dtype="float64").reshape(-1, 1)
+    periods = np.arange(cash_flows.shape[1])
+    return (cash_flows / (1 + rate) ** periods).sum(axis=1)
+
+
+def irr(cash_flows, low=-0.99, high=10.0, tol=1e-10, max_iter=100):
+    """
+    Internal rate of return of rows of annual cash flows, solved for all rows at once.
+
+    Uses a bracketed Newton method: every row keeps a bracket [low, high] where NPV changes
+    sign, takes a Newton step when it stays inside the bracket and bisects otherwise, and
+    the bracket is tightened after each iteration. Rows without a sign change in the
+    bracket return NaN.
+
+    Args:
+        cash_flows: 2-D array shaped (properties, years + 1), year 0 first.
+        low: Lower bound of the initial bracket (as a decimal).
+        high: Upper bound of the initial bracket (as a decimal).
+        tol: Convergence tolerance on the rate.
+        max_iter: Maximum number of iterations.
+
+    Returns:
+        ndarray: IRR of every row as a decimal.
+    """
+    cash_flows = np.atleast_2d(np.asarray(cash_flows, dtype="float64"))
+    n_rows = cash_flows.shape[0]
+    periods = np.arange(cash_flows.shape[1])
+
+    def npv_and_derivative(flows, rate):
+        discount = (1 + rate[:, None]) ** -periods
+        value = (flows * discount).sum(axis=1)
+        derivative = (-periods * flows * discount).sum(axis=1) / (1 + rate)
+        return value, derivative
+
+    f_lo, _ = npv_and_derivative(cash_flows, np.full(n_rows, low))
+    f_hi, _ = npv_and_derivative(cash_flows, np.full(n_rows, high))
+    result = np.full(n_rows, np.nan)
+
+    # Only rows that have not converged yet are carried through each iteration
+    rows = np.flatnonzero(np.sign(f_lo) != np.sign(f_hi))
+    flows = cash_flows[rows]
+    f_lo = f_lo[rows]
+    lo = np.full(len(rows), low)
+    hi = np.full(len(rows), high)
+    rate = np.clip(np.full(len(rows), 0.1), lo, hi)
+
+    for _ in range(max_iter):
+        if not len(rows):
+            break
+        value, derivative = npv_and_derivative(flows, rate)
+
+        # Tighten the bracket around the root using the sign of NPV at the current rate
+        same_as_lo = np.sign(value) == np.sign(f_lo)
+        lo = np.where(same_as_lo, rate, lo)
+        f_lo = np.where(same_as_lo, value, f_lo)
+        hi = np.where(same_as_lo, hi, rate)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            newton = rate - value / derivative
+        inside = np.isfinite(newton) & (newton > lo) & (newton < hi)
+        next_rate = np.where(inside, newton, (lo + hi) / 2)
+
+        converged = (np.abs(next_rate - rate) < tol) | (value == 0)
+        result[rows[converged]] = next_rate[converged]
+        keep = ~converged
+        rows, flows, f_lo, lo, hi, rate = rows[keep], flows[keep], f_lo[keep], lo[keep], hi[keep], next_rate[keep]
+
+    # Rows still running after max_iter keep their best estimate
+    result[rows] = rate
+    return result
+
+
+def _read_columns(portfolio):
+    columns = {}
+    for col, default in PRO_FORMA_INPUT_COLUMNS.items():
+        if col in portfolio.columns:
+            values = pd.to_numeric(portfolio[col], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+            columns[col] = values if np.isnan(default) else np.nan_to_num(values, nan=default)
+        else:
+            columns[col] = np.full(len(portfolio), default, dtype="float64")
+    return columns
+
+
+def _financing(columns):
+    """Loan, equity and annual debt service of every property from its read columns."""
+    price = columns["Offer Price"]
+    renovation = columns["Renovation Cost"]
+    rate = columns["Interest Rate (%)"] / 100
+    # Without an explicit loan, everything above the equity is assumed to be borrowed
+    loan = np.where(
+        np.isnan(columns["Loan Amount"]),
+        np.clip(price + renovation - columns["Equity"], 0, None) * (columns["Equity"] > 0),
+        columns["Loan Amount"],
+    )
+    equity = price + renovation - loan
+    annual_debt_service = np.where(rate > 0, loan_payment(loan, rate, columns["Amortization (Years)"]), columns["Debt Service"])
+    return loan, equity, annual_debt_service
+
+
+def scheduled_debt_service(portfolio):
+    """
+    Annual debt service project_cash_flows uses for every property: the amortizing payment on
+    the loan when an interest rate is given, otherwise the flat "Debt Service".
+
+    Args:
+        portfolio: DataFrame with one row per property (see PRO_FORMA_INPUT_COLUMNS).
+
+    Returns:
+        ndarray: Annual debt service of every property.
+    """
+    return _financing(_read_columns(portfolio))[2]
+
+
+def project_cash_flows(portfolio):
+    """
+    Project year-by-year levered cash flows for every property of a portfolio.
+
+    Income grows at "Market Growth Rate" and expenses at "Expense Growth Rate"; debt service
+    comes from an amortizing loan ("Loan Amount", "Interest Rate (%)", "Amortization (Years)"),
+    or from the flat "Debt Service" when no rate is given. "CapEx" is drawn every year,
+    "Renovation Cost" is funded with the equity at year 0, and the property is sold at the
+    end of its own "Holding Period" for the next year's NOI capitalised at "Projected Cap
+    Rate at Sale" (the going-in cap rate when that is 0), less selling costs and the loan
+    balance. Properties with shorter holding periods have zeros after their exit year.
+
+    Args:
+        portfolio: DataFrame with one row per property; see PRO_FORMA_INPUT_COLUMNS for the
+                   recognised columns (rates in %).
+
+    Returns:
+        dict: A dictionary of arrays shaped (properties, years + 1), year 0 first:
+              'NOI', 'Debt Service', 'CapEx', 'Reversion' and 'Cash Flow', plus the per-property
+              arrays 'Equity Required', 'Loan Amount', 'Sale Price' and 'Holding Period'.
+    """
+    columns = _read_columns(portfolio)
+
+    price = columns["Offer Price"]
+    renovation = columns["Renovation Cost"]
+    holding_period = np.clip(np.round(columns["Holding Period"]), 1, None).astype(int)
+    market_growth = columns["Market Growth Rate"] / 100
+    expense_growth = np.where(np.isnan(columns["Expense Growth Rate"]), market_growth, columns["Expense Growth Rate"] / 100)
+    rate = columns["Interest Rate (%)"] / 100
+    amortization = columns["Amortization (Years)"]
+    loan, equity, annual_debt_service = _financing(columns)
+
+    # Years 0..max holding period + 1 as columns; the extra year is only used to value the exit
+    years = np.arange(holding_period.max() + 2)[None, :]
+    in_hold = (years >= 1) & (years <= holding_period[:, None])
+    income = columns["Income"][:, None] * (1 + market_growth[:, None]) ** (years - 1)
+    expenses = columns["Expenses"][:, None] * (1 + expense_growth[:, None]) ** (years - 1)
+    noi = income - expenses
+
+    forward_noi = noi[np.arange(len(price)), holding_period + 1]
+    going_in_cap = np.divide(noi[:, 1], price, out=np.zeros_like(price), where=price > 0)
+    exit_cap = np.where(columns["Projected Cap Rate at Sale"] > 0, columns["Projected Cap Rate at Sale"] / 100, going_in_cap)
+    sale_price = np.divide(forward_noi, exit_cap, out=np.zeros_like(price), where=exit_cap > 0)
+    balance = np.where(
+        rate > 0,
+        remaining_balance(loan, rate, amortization, holding_period),
+        loan,
+    )
+    net_sale = sale_price * (1 - columns["Selling Costs (%)"] / 100) - balance
+
+    years = years[:, :-1]
+    in_hold = in_hold[:, :-1]
+    noi = np.where(in_hold, noi[:, :-1], 0.0)
+    debt_service = np.where(in_hold, annual_debt_service[:, None], 0.0)
+    capex = np.where(in_hold, columns["CapEx"][:, None], 0.0)
+    reversion = np.where(years == holding_period[:, None], net_sale[:, None], 0.0)
+
+    cash_flow = noi - debt_service - capex + reversion
+    cash_flow[:, 0] = -equity
+
+    return {
+        "NOI": noi,
+        "Debt Service": debt_service,
+        "CapEx": capex,
+        "Reversion": reversion,
+        "Cash Flow": cash_flow,
+        "Equity Required": equity,
+        "Loan Amount": loan,
+        "Sale Price": sale_price,
+        "Holding Period": holding_period,
+    }
+
+
+@timed()
+def run_pro_forma(portfolio, discount_rate=8.0):
+    """
+    Project every property and summarise its returns.
+
+    Args:
+        portfolio: DataFrame with one row per property (see project_cash_flows).
+        discount_rate: Discount rate in % used for NPV.
+
+    Returns:
+        DataFrame: One row per property (same index as `portfolio`) with 'IRR (%)',
+                   'Equity Multiple', 'NPV ($)', 'Equity Required ($)', 'Loan Amount ($)'
+                   and 'Sale Price ($)'.
+    """
+    try:
+        projection = project_cash_flows(portfolio)
+        cash_flows = projection["Cash Flow"]
+        equity = projection["Equity Required"]
+
+        equity_multiple = np.divide(cash_flows[:, 1:].sum(axis=1), equity, out=np.zeros_like(equity), where=equity > 0)
+        return pd.DataFrame(
+            {
+                "IRR (%)": np.round(irr(cash_flows) * 100, 2),
+                "Equity Multiple": np.round(equity_multiple, 2),
+                "NPV ($)": np.round(npv(discount_rate / 100, cash_flows), 2),
+                "Equity Required ($)": np.round(equity, 2),
+                "Loan Amount ($)": np.round(projection["Loan Amount"], 2),
+                "Sale Price ($)": np.round(projection["Sale Price"], 2),
+            },
+            index=portfolio.index,
+        )
+    except Exception as e:
+        raise ValueError(f"Error running pro forma: {e}")
+
+
+def pro_forma_table(projection, row=0):
+    """
+    Year-by-year pro forma of one property, for display.
+
+    Args:
+        projection: Result of project_cash_flows.
+        row: Position of the property in the projected portfolio.
+
+    Returns:
+        DataFrame: One row per year (0..holding period) with NOI, debt service, capex,
+                   reversion and cash flow.
+    """
+    last_year = int(projection["Holding Period"][row])
+    table = pd.DataFrame(
+        {name: projection[name][row, :last_year + 1] for name in ["NOI", "Debt Service", "CapEx", "Reversion", "Cash Flow"]}
+    )
+    table.index.name = "Year"
+    return table.round(2)
@@ -0,0 +1,227 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from utils.profiling import timed
+
+# Columns read from a unit-level rent roll. Rent is monthly; when absent it is derived
+# from the annual Income column used elsewhere in the app.
+RENT_ROLL_COLUMNS = ["Unit Type", "Rent", "Income", "Market Rent", "Occupied", "Lease Start", "Lease End"]
+
+OCCUPIED_VALUES = {"1", "1.0", "true", "yes", "y", "occupied", "leased"}
+
+EXPIRED_BUCKET = "Expired / MTM"
+
+_UNIT_MIX_PATTERN = re.compile(r"\s*([^:,;]+?)\s*:\s*(\d+)\s*(?:units?)?\s*(?:[,;]|$)", re.IGNORECASE)
+
+
+def parse_unit_mix(text):
+    """
+    Parse the free-text unit mix input, e.g. "1B1B: 10 units, 2B2B: 5 units".
+
+    Args:
+        text: Unit mix text, entries separated by commas or semicolons.
+
+    Returns:
+        dict: Unit type -> number of units, in the order given.
+    """
+    unit_mix = {}
+    position = 0
+    text = (text or "").strip()
+    while position < len(text):
+        match = _UNIT_MIX_PATTERN.match(text, position)
+        if not match:
+            raise ValueError(f"Could not parse unit mix near '{text[position:]}'. Expected e.g. '1B1B: 10 units, 2B2B: 5 units'.")
+        unit_type, count = match.group(1), int(match.group(2))
+        unit_mix[unit_type] = unit_mix.get(unit_type, 0) + count
+        position = match.end()
+    return unit_mix
+
+
+def _occupied_flags(values, rent):
+    """Vectorized occupancy flags from booleans, 0/1 or yes/no style text; units with rent count as occupied when absent."""
+    if values is None:
+        return rent.to_numpy() > 0
+    if pd.api.types.is_bool_dtype(values):
+        return values.fillna(False).to_numpy(dtype=bool)
+    return values.astype("str").str.strip().str.lower().isin(OCCUPIED_VALUES).to_numpy()
+
+
+@timed()
+def normalize_rent_roll(data, market_rent=None):
+    """
+    Normalize an uploaded rent roll to one row per unit with typed columns.
+
+    Args:
+        data: DataFrame with at least a 'Unit Type' column and 'Rent' (monthly) or 'Income' (annual).
+        market_rent: Monthly market rent used when the roll has no 'Market Rent' column; either one
+                     value for every unit or a dictionary per unit type (optional).
+
+    Returns:
+        DataFrame: 'Unit Type' (category), 'Rent', 'Market Rent' (float64), 'Occupied' (bool),
+                   'Lease Start' and 'Lease End' (datetime64).
+    """
+    if "Unit Type" not in data.columns:
+        raise ValueError("Rent roll requires a 'Unit Type' column.")
+    if "Rent" in data.columns:
+        rent = pd.to_numeric(data["Rent"], errors="coerce").fillna(0).astype("float64")
+    elif "Income" in data.columns:
+        rent = pd.to_numeric(data["Income"], errors="coerce").fillna(0).astype("float64") / 12
+    else:
+        raise ValueError("Rent roll requires a 'Rent' (monthly) or 'Income' (annual) column.")
+
+    unit_type = data["Unit Type"].astype("category")
+    if isinstance(market_rent, dict):
+        market = unit_type.map(market_rent).astype("float64")
+    elif market_rent:
+        market = pd.Series(float(market_rent), index=data.index)
+    elif "Market Rent" in data.columns:
+        market = pd.to_numeric(data["Market Rent"], errors="coerce").astype("float64")
+    else:
+        market = pd.Series(np.nan, index=data.index)
+
+    lease_start, lease_end = (
+        pd.to_datetime(data[col], errors="coerce") if col in data.columns else pd.Series(pd.NaT, index=data.index)
+        for col in ("Lease Start", "Lease End")
+    )
+    return pd.DataFrame({
+        "Unit Type": unit_type,
+        "Rent": rent,
+        "Market Rent": market.fillna(0),
+        "Occupied": _occupied_flags(data.get("Occupied"), rent),
+        "Lease Start": lease_start,
+        "Lease End": lease_end,
+    }, index=data.index)
+
+
+@timed()
+def unit_type_summary(rent_roll):
+    """
+    Summarize a normalized rent roll per unit type, including rent gaps and loss-to-lease.
+
+    Args:
+        rent_roll: DataFrame returned by normalize_rent_roll.
+
+    Returns:
+        DataFrame: One row per unit type with Units, Occupied Units, Occupancy (%),
+                   Avg Rent ($), Avg Market Rent ($), Rent Gap ($), Rent Gap (%) and
+                   Loss to Lease ($/yr). Rents are averaged over occupied units.
+    """
+    occupied = rent_roll["Occupied"]
+    frame = pd.DataFrame({
+        "Unit Type": rent_roll["Unit Type"],
+        "Units": 1,
+        "Occupied Units": occupied.astype("int64"),
+        "Occupied Rent": rent_roll["Rent"].where(occupied, 0.0),
+        "Occupied Market Rent": rent_roll["Market Rent"].where(occupied, 0.0),
+        "Market Rent": rent_roll["Market Rent"],
+    })
+    grouped = frame.groupby("Unit Type", observed=True).sum()
+
+    occupied_units = grouped["Occupied Units"].to_numpy()
+    avg_rent = np.divide(grouped["Occupied Rent"], occupied_units, out=np.zeros(len(grouped)), where=occupied_units > 0)
+    avg_market_rent = grouped["Market Rent"] / grouped["Units"]
+    rent_gap = np.where((avg_market_rent > 0) & (avg_rent > 0), avg_market_rent - avg_rent, 0.0)
+
+    summary = pd.DataFrame({
+        "Units": grouped["Units"],
+        "Occupied Units": grouped["Occupied Units"],
+        "Occupancy (%)": grouped["Occupied Units"] / grouped["Units"] * 100,
+        "Avg Rent ($)": avg_rent,
+        "Avg Market Rent ($)": avg_market_rent,
+        "Rent Gap ($)": rent_gap,
+        "Rent Gap (%)": np.divide(rent_gap, avg_market_rent, out=np.zeros(len(grouped)), where=avg_market_rent > 0) * 100,
+        "Loss to Lease ($/yr)": (grouped["Occupied Market Rent"] - grouped["Occupied Rent"]) * 12,
+    })
+    return summary.round(2).reset_index()
+
+
+@timed()
+def lease_expiration_ladder(rent_roll, as_of=None, freq="Q"):
+    """
+    Count occupied leases expiring per period, with the rent rolling over.
+
+    Args:
+        rent_roll: DataFrame returned by normalize_rent_roll.
+        as_of: Date leases are measured from (default: today). Leases ending before it, or
+               without an end date, are reported as expired / month-to-month.
+        freq: Period of each rung, e.g. "M", "Q" or "Y".
+
+    Returns:
+        DataFrame: Period, Expiring Units, Expiring Rent ($/yr), Share of Units (%) and
+                   Cumulative Share (%), in chronological order after the expired bucket.
+    """
+    as_of = pd.Timestamp(as_of) if as_of is not None else pd.Timestamp.today().normalize()
+    leases = rent_roll.loc[rent_roll["Occupied"], ["Rent", "Lease End"]]
+    expired = leases["Lease End"].isna() | (leases["Lease End"] < as_of)
+
+    active = leases[~expired]
+    periods = active["Lease End"].dt.to_period(freq)
+    ladder = (
+        pd.DataFrame({"Period": periods, "Units": 1, "Rent": active["Rent"]})
+        .groupby("Period", sort=True)
+        .sum()
+    )
+    rungs = pd.DataFrame({
+        "Period": ladder.index.astype("str"),
+        "Expiring Units": ladder["Units"].to_numpy(),
+        "Expiring Rent ($/yr)": ladder["Rent"].to_numpy() * 12,
+    })
+    if expired.any():
+        rungs = pd.concat([pd.DataFrame({
+            "Period": [EXPIRED_BUCKET],
+            "Expiring Units": [int(expired.sum())],
+            "Expiring Rent ($/yr)": [float(leases.loc[expired, "Rent"].sum()) * 12],
+        }), rungs], ignore_index=True)
+
+    total_units = max(len(leases), 1)
+    rungs["Share of Units (%)"] = rungs["Expiring Units"] / total_units * 100
+    rungs["Cumulative Share (%)"] = rungs["Share of Units (%)"].cumsum()
+    return rungs.round(2)
+
+
+def loss_to_lease(rent_roll):
+    """
+    Total loss-to-lease of the occupied units: market rent minus in-place rent.
+
+    Returns:
+        dict: 'Loss to Lease ($/yr)' and 'Loss to Lease (%)' of occupied market rent.
+              Negative values mean the units lease above market.
+    """
+    occupied = rent_roll["Occupied"].to_numpy()
+    market = float(rent_roll["Market Rent"].to_numpy()[occupied].sum()) * 12
+    loss = market - float(rent_roll["Rent"].to_numpy()[occupied].sum()) * 12
+    return {
+        "Loss to Lease ($/yr)": round(loss, 2),
+        "Loss to Lease (%)": round(loss / market * 100, 2) if market > 0 else 0,
+    }
+
+
+def analyze_rent_roll(data, market_rent=None, as_of=None, freq="Q"):
+    """
+    Run every unit-level analysis on an uploaded rent roll.
+
+    Args:
+        data: Rent roll DataFrame (see normalize_rent_roll).
+        market_rent: Monthly market rent, overall or per unit type (optional).
+        as_of: Date the lease ladder is measured from (default: today).
+        freq: Period of each lease ladder rung.
+
+    Returns:
+        dict: A dictionary containing:
+              - 'summary': Per unit type summary (see unit_type_summary).
+              - 'lease_ladder': Lease expiration ladder (see lease_expiration_ladder).
+              - 'loss_to_lease': Portfolio loss-to-lease (see loss_to_lease).
+    """
+    try:
+        rent_roll = normalize_rent_roll(data, market_rent)
+        return {
+            "summary": unit_type_summary(rent_roll),
+            "lease_ladder": lease_expiration_ladder(rent_roll, as_of, freq),
+            "loss_to_lease": loss_to_lease(rent_roll),
+        }
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"Error analyzing rent roll: {e}")
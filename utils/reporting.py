@@ -0,0 +1,156 @@
+import io
+import os
+import re
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.profiling import timed
+from utils.visualization import render_chart
+
+
+def _pdf_text(text):
+    """The core PDF fonts only cover Latin-1; replace anything else instead of failing."""
+    return str(text).encode("latin-1", "replace").decode("latin-1")
+
+
+@timed()
+def build_pdf_report(metrics, insights, chart_png=None):
+    """
+    Build the UnderwritePro PDF report in memory.
+
+    Args:
+        metrics: Dictionary of calculated metrics.
+        insights: Generated insights text (optional).
+        chart_png: PNG bytes of the metrics chart, e.g. from render_chart (optional).
+
+    Returns:
+        bytes: The PDF document.
+    """
+    from fpdf import FPDF
+    from PIL import Image
+
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+
+    # Title
+    pdf.set_font("Arial", style="B", size=16)
+    pdf.cell(200, 10, txt="UnderwritePro Output Report", ln=True, align="C")
+    pdf.ln(10)  # Add space
+
+    # Metrics Section
+    pdf.set_font("Arial", style="B", size=14)
+    pdf.cell(200, 10, txt="Calculated Metrics:", ln=True)
+    pdf.set_font("Arial", size=12)
+    for key, value in metrics.items():
+        pdf.cell(0, 10, txt=_pdf_text(f"{key}: {value}"), ln=True)
+
+    # Insights Section
+    if insights:
+        pdf.ln(10)
+        pdf.set_font("Arial", style="B", size=14)
+        pdf.cell(200, 10, txt="Generated Insights:", ln=True)
+        pdf.set_font("Arial", size=12)
+        pdf.multi_cell(0, 10, txt=_pdf_text(insights))
+
+    # Add Graph
+    if chart_png:
+        with Image.open(io.BytesIO(chart_png)) as img:
+            width, height = img.size
+            aspect_ratio = height / width
+
+        max_width = 180
+        img_width = max_width
+        img_height = max_width * aspect_ratio
+
+        max_height = 200
+        if img_height > max_height:
+            img_height = max_height
+            img_width = max_height / aspect_ratio
+
+        pdf.ln(10)
+        pdf.set_font("Arial", style="B", size=14)
+        pdf.cell(200, 10, txt="Visualization:", ln=True)
+        pdf.image(io.BytesIO(chart_png), x=10, y=None, w=img_width, h=img_height)
+
+    return bytes(pdf.output())
+
+
+def _render_report(args):
+    """Process-pool entry point: render one property's chart and PDF, timing both."""
+    name, metrics, insights, chart_type, dpi = args
+    start = time.perf_counter()
+    try:
+        chart_png = render_chart(metrics, chart_type=chart_type, dpi=dpi)
+    except ValueError:
+        chart_png = None  # Nothing meaningful to plot; the report is still produced
+    pdf_bytes = build_pdf_report(metrics, insights, chart_png)
+    return name, pdf_bytes, time.perf_counter() - start
+
+
+def _report_file_name(name, used):
+    """Filesystem-safe, unique PDF file name for a report inside the ZIP."""
+    stem = re.sub(r"[^A-Za-z0-9._-]+", "_", str(name)).strip("._") or "report"
+    candidate, counter = stem, 1
+    while candidate in used:
+        counter += 1
+        candidate = f"{stem}_{counter}"
+    used.add(candidate)
+    return f"{candidate}.pdf"
+
+
+@timed()
+def generate_batch_reports(reports, chart_type="bar", dpi=150, max_workers=None):
+    """
+    Render PDF reports for a whole portfolio in parallel and bundle them into one ZIP.
+
+    Args:
+        reports: List of dictionaries with 'name', 'metrics' and optionally 'insights'.
+        chart_type: Chart drawn in every report ("bar", "pie", "line").
+        dpi: Chart resolution.
+        max_workers: Number of worker processes (default: CPU count); runs serially when 1.
+
+    Returns:
+        tuple: (zip_bytes, stats) where stats contains:
+               - 'reports': Number of reports produced.
+               - 'total_seconds': Wall time of the whole batch.
+               - 'reports_per_second': Throughput of the batch.
+               - 'per_report': List of {'name', 'file', 'seconds', 'bytes'} per report.
+    """
+    try:
+        tasks = [
+            (report["name"], report["metrics"], report.get("insights"), chart_type, dpi)
+            for report in reports
+        ]
+        max_workers = max_workers or os.cpu_count() or 1
+
+        start = time.perf_counter()
+        if max_workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=min(max_workers, len(tasks))) as executor:
+                results = list(executor.map(_render_report, tasks, chunksize=max(1, len(tasks) // (max_workers * 4))))
+        else:
+            results = [_render_report(task) for task in tasks]
+
+        buffer = io.BytesIO()
+        per_report = []
+        used_names = set()
+        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for name, pdf_bytes, seconds in results:
+                file_name = _report_file_name(name, used_names)
+                archive.writestr(file_name, pdf_bytes)
+                per_report.append({"name": name, "file": file_name, "seconds": round(seconds, 4), "bytes": len(pdf_bytes)})
+        total_seconds = time.perf_counter() - start
+
+        stats = {
+            "reports": len(per_report),
+            "total_seconds": round(total_seconds, 4),
+            "reports_per_second": round(len(per_report) / total_seconds, 2) if total_seconds > 0 else 0,
+            "per_report": per_report,
+        }
+        return buffer.getvalue(), stats
+    except KeyError as e:
+        raise ValueError(f"Missing report field: {e}")
+    except Exception as e:
+        raise ValueError(f"Error generating batch reports: {e}")
@@ -0,0 +1,153 @@
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from utils.calculations import BATCH_INPUT_COLUMNS, calculate_batch_metrics
+from utils.profiling import timed
+from utils.proforma import PRO_FORMA_INPUT_COLUMNS, run_pro_forma, scheduled_debt_service
+
+# Inputs a scenario can set: everything read by calculate_batch_metrics or run_pro_forma
+SCENARIO_INPUT_COLUMNS = list(dict.fromkeys([*BATCH_INPUT_COLUMNS, *PRO_FORMA_INPUT_COLUMNS]))
+
+BASE_SCENARIO = "Base"
+
+# Adjustments of the preset scenarios relative to the base inputs
+DOWNSIDE_INCOME_FACTOR = 0.90
+DOWNSIDE_EXPENSE_FACTOR = 1.05
+DOWNSIDE_GROWTH_DELTA = -2.0  # Market growth, percentage points
+DOWNSIDE_EXIT_CAP_DELTA = 0.5  # Exit cap rate, percentage points
+DOWNSIDE_RATE_DELTA = 1.0  # Interest rate, percentage points
+VALUE_ADD_COST_PER_UNIT = 10_000.0
+VALUE_ADD_COST_SHARE = 0.05  # Of the offer price, when the unit count is unknown
+VALUE_ADD_INCOME_FACTOR = 1.10
+
+
+def default_scenarios(base_inputs):
+    """
+    Base, Downside and Value-Add scenarios derived from one set of inputs.
+
+    Args:
+        base_inputs: Dictionary of SCENARIO_INPUT_COLUMNS values (missing ones default as in
+                     calculate_batch_metrics and run_pro_forma).
+
+    Returns:
+        DataFrame: One row per scenario, indexed by scenario name, with the SCENARIO_INPUT_COLUMNS.
+    """
+    defaults = {**BATCH_INPUT_COLUMNS, **PRO_FORMA_INPUT_COLUMNS}
+    base = {col: base_inputs.get(col, defaults[col]) for col in SCENARIO_INPUT_COLUMNS}
+    price, income, expenses = base["Offer Price"], base["Income"], base["Expenses"]
+    going_in_cap = (income - expenses) / price * 100 if price > 0 else 0.0
+    exit_cap = base["Projected Cap Rate at Sale"] or going_in_cap
+
+    downside = {
+        **base,
+        "Income": income * DOWNSIDE_INCOME_FACTOR,
+        "Expenses": expenses * DOWNSIDE_EXPENSE_FACTOR,
+        "Market Growth Rate": base["Market Growth Rate"] + DOWNSIDE_GROWTH_DELTA,
+        "Projected Cap Rate at Sale": exit_cap + DOWNSIDE_EXIT_CAP_DELTA if exit_cap > 0 else 0.0,
+        "Interest Rate (%)": base["Interest Rate (%)"] + DOWNSIDE_RATE_DELTA if base["Interest Rate (%)"] > 0 else 0.0,
+    }
+    renovation = (
+        base["Number of Units"] * VALUE_ADD_COST_PER_UNIT if base["Number of Units"] > 0 else price * VALUE_ADD_COST_SHARE
+    )
+    value_add = {
+        **base,
+        "Income": income * VALUE_ADD_INCOME_FACTOR,
+        "Renovation Cost": base["Renovation Cost"] + renovation,
+    }
+    scenarios = pd.DataFrame([base, downside, value_add], index=[BASE_SCENARIO, "Downside", "Value-Add"])
+    scenarios.index.name = "Scenario"
+    return scenarios
+
+
+class ScenarioEvaluator:
+    """
+    Evaluates named scenarios together, memoized per scenario.
+
+    Every scenario is one row of a batch: the rows not evaluated before go through
+    calculate_batch_metrics and run_pro_forma in a single vectorized call, and rows whose
+    inputs are unchanged are served from the memo. Adding or editing a scenario therefore
+    only computes that scenario.
+
+    Before the batch runs, each scenario's "Debt Service" is derived from its loan, interest
+    rate and amortization (see proforma.scheduled_debt_service), so DSCR and cash-on-cash use
+    the same debt as the pro forma returns, e.g. under a rate shock.
+    """
+
+    def __init__(self, discount_rate=8.0, max_entries=256):
+        """
+        Args:
+            discount_rate: Discount rate in % used for NPV.
+            max_entries: Number of evaluated scenarios remembered.
+        """
+        self.discount_rate = discount_rate
+        self.max_entries = max_entries
+        self._memo = OrderedDict()
+        self._columns = None
+
+    @staticmethod
+    def _key(columns, row):
+        # NaN never compares equal, so unset optional inputs are keyed as None
+        return (tuple(columns), *(None if pd.isna(value) else float(value) for value in row))
+
+    @timed()
+    def evaluate(self, scenarios):
+        """
+        Evaluate every scenario.
+
+        Args:
+            scenarios: DataFrame with one row per scenario, indexed by scenario name, with any of
+                       the SCENARIO_INPUT_COLUMNS (see default_scenarios).
+
+        Returns:
+            tuple: (results, computed) where results has the calculate_metrics metrics and the
+                   run_pro_forma returns of every scenario (same index as `scenarios`), and
+                   computed lists the scenarios that were not memoized.
+        """
+        if scenarios.empty:
+            raise ValueError("No scenarios to evaluate.")
+        try:
+            inputs = scenarios.reindex(columns=[col for col in SCENARIO_INPUT_COLUMNS if col in scenarios.columns])
+            inputs = inputs.apply(pd.to_numeric, errors="coerce")
+            keys = [(*self._key(inputs.columns, row), self.discount_rate) for row in inputs.itertuples(index=False)]
+            pending = [position for position, key in enumerate(keys) if key not in self._memo]
+
+            if pending:
+                batch = inputs.iloc[pending].reset_index(drop=True)
+                batch["Debt Service"] = scheduled_debt_service(batch)
+                evaluated = pd.concat([calculate_batch_metrics(batch), run_pro_forma(batch, self.discount_rate)], axis=1)
+                for position, row in zip(pending, evaluated.to_numpy()):
+                    self._memo[keys[position]] = row
+                self._columns = evaluated.columns
+            for key in keys:
+                self._memo.move_to_end(key)
+            while len(self._memo) > max(self.max_entries, len(keys)):
+                self._memo.popitem(last=False)
+
+            results = pd.DataFrame(np.vstack([self._memo[key] for key in keys]), index=scenarios.index, columns=self._columns)
+            return results, [scenarios.index[position] for position in pending]
+        except Exception as e:
+            raise ValueError(f"Error evaluating scenarios: {e}")
+
+
+def scenario_diff(results, base=BASE_SCENARIO, relative=False):
+    """
+    Difference of every scenario against the base scenario.
+
+    Args:
+        results: DataFrame returned by ScenarioEvaluator.evaluate.
+        base: Name of the base scenario.
+        relative: Return % changes instead of absolute differences (0 where the base is 0).
+
+    Returns:
+        DataFrame: One row per scenario other than the base, with the same columns as `results`.
+    """
+    if base not in results.index:
+        raise ValueError(f"Base scenario '{base}' not found. Available scenarios: {list(results.index)}")
+    base_row = results.loc[base].to_numpy(dtype="float64")
+    others = results.drop(index=base)
+    diff = others.to_numpy(dtype="float64") - base_row
+    if relative:
+        diff = np.divide(diff, np.abs(base_row), out=np.zeros_like(diff), where=base_row != 0) * 100
+    return pd.DataFrame(np.round(diff, 2), index=others.index, columns=results.columns)
@@ -0,0 +1,186 @@
+import numpy as np
+import pandas as pd
+
+from utils.calculations import _safe_divide
+from utils.profiling import timed
+
+# Same range and step as the "Sensitivity Analysis" sliders in app.py
+DEFAULT_VARIATIONS = np.arange(-50, 55, 5, dtype="float64")
+
+RENT_AXIS = "Rent Variation (%)"
+EXPENSE_AXIS = "Expense Variation (%)"
+GROWTH_AXIS = "Market Growth Rate (%)"
+EXIT_CAP_AXIS = "Cap Rate at Sale (%)"
+
+
+@timed()
+def build_sensitivity_grid(income, expenses, offer_price, equity=0, debt_service=0,
+                           rent_variations=None, expense_variations=None,
+                           growth_rates=None, exit_cap_rates=None, years=1,
+                           base_growth_rate=0, base_exit_cap_rate=None):
+    """
+    Precompute NOI, Cap Rate, DSCR and Cash on Cash Return over a full grid of variations.
+
+    Each axis is laid out on its own array dimension and all metrics are computed in a
+    single broadcasted pass, so any point, slice, heatmap or tornado can be read from the
+    result without recomputing. Unlike calculate_metrics, negative values are kept so the
+    downside of the grid stays visible.
+
+    Args:
+        income: Total income of the property.
+        expenses: Total expenses of the property.
+        offer_price: Purchase price of the property.
+        equity: Equity invested (optional).
+        debt_service: Annual debt service (optional).
+        rent_variations: Rent variations in % (default: -50 to 50 in steps of 5).
+        expense_variations: Expense variations in % (default: -50 to 50 in steps of 5).
+        growth_rates: Optional market growth rates in %, applied to income and expenses for `years` years.
+        exit_cap_rates: Optional cap rates at sale in %, used to value the grown NOI at exit.
+        years: Number of years of growth applied along the growth axis.
+        base_growth_rate: Growth rate treated as the base case on the growth axis.
+        base_exit_cap_rate: Cap rate at sale treated as the base case (default: middle of the axis).
+
+    Returns:
+        dict: A dictionary containing:
+              - 'axes': Ordered mapping of axis name to its values (one array dimension each).
+              - 'base': Mapping of axis name to the index of its base case.
+              - 'metrics': Mapping of metric name to an ndarray shaped like the grid.
+    """
+    try:
+        axes = {
+            RENT_AXIS: np.asarray(DEFAULT_VARIATIONS if rent_variations is None else rent_variations, dtype="float64"),
+            EXPENSE_AXIS: np.asarray(DEFAULT_VARIATIONS if expense_variations is None else expense_variations, dtype="float64"),
+        }
+        if growth_rates is not None:
+            axes[GROWTH_AXIS] = np.asarray(growth_rates, dtype="float64")
+        if exit_cap_rates is not None:
+            axes[EXIT_CAP_AXIS] = np.asarray(exit_cap_rates, dtype="float64")
+
+        # Reshape every axis so that it only varies along its own dimension
+        ndim = len(axes)
+        shaped = {}
+        for position, (name, values) in enumerate(axes.items()):
+            shape = [1] * ndim
+            shape[position] = len(values)
+            shaped[name] = values.reshape(shape)
+
+        adjusted_income = income * (1 + shaped[RENT_AXIS] / 100)
+        adjusted_expenses = expenses * (1 + shaped[EXPENSE_AXIS] / 100)
+        if GROWTH_AXIS in shaped:
+            # Expenses follow market growth, as in the pro forma without an expense growth rate
+            growth = (1 + shaped[GROWTH_AXIS] / 100) ** years
+            adjusted_income = adjusted_income * growth
+            adjusted_expenses = adjusted_expenses * growth
+        noi = adjusted_income - adjusted_expenses
+
+        grid_shape = tuple(len(values) for values in axes.values())
+        metrics = {
+            "NOI": np.broadcast_to(noi, grid_shape),
+            "Cap Rate (%)": np.broadcast_to(_safe_divide(noi, offer_price) * 100, grid_shape),
+            "DSCR": np.broadcast_to(_safe_divide(noi, debt_service), grid_shape),
+            "Cash on Cash Return (%)": np.broadcast_to(_safe_divide(noi, equity) * 100, grid_shape),
+        }
+        if EXIT_CAP_AXIS in shaped:
+            metrics["Exit Value ($)"] = np.broadcast_to(_safe_divide(noi, shaped[EXIT_CAP_AXIS] / 100), grid_shape)
+
+        base = {
+            RENT_AXIS: _nearest_index(axes[RENT_AXIS], 0),
+            EXPENSE_AXIS: _nearest_index(axes[EXPENSE_AXIS], 0),
+        }
+        if GROWTH_AXIS in axes:
+            base[GROWTH_AXIS] = _nearest_index(axes[GROWTH_AXIS], base_growth_rate)
+        if EXIT_CAP_AXIS in axes:
+            base[EXIT_CAP_AXIS] = (
+                len(axes[EXIT_CAP_AXIS]) // 2 if base_exit_cap_rate is None
+                else _nearest_index(axes[EXIT_CAP_AXIS], base_exit_cap_rate)
+            )
+
+        return {"axes": axes, "base": base, "metrics": metrics}
+    except Exception as e:
+        raise ValueError(f"Error building sensitivity grid: {e}")
+
+
+def _nearest_index(values, target):
+    """Return the index of the axis value closest to `target`."""
+    return int(np.abs(np.asarray(values) - target).argmin())
+
+
+def sensitivity_point(grid, selection=None):
+    """
+    Read every metric at one point of a precomputed sensitivity grid.
+
+    Args:
+        grid: Result of build_sensitivity_grid.
+        selection: Mapping of axis name to the desired value. Axes that are not given
+                   stay at their base case; values snap to the nearest grid point.
+
+    Returns:
+        dict: Metric name to value at the selected point.
+    """
+    selection = selection or {}
+    index = tuple(
+        _nearest_index(values, selection[name]) if name in selection else grid["base"][name]
+        for name, values in grid["axes"].items()
+    )
+    return {name: float(values[index]) for name, values in grid["metrics"].items()}
+
+
+def sensitivity_slice(grid, metric="NOI", rows=RENT_AXIS, columns=EXPENSE_AXIS, selection=None):
+    """
+    Extract a 2-D slice of one metric, e.g. for a heatmap.
+
+    Args:
+        grid: Result of build_sensitivity_grid.
+        metric: Metric to extract.
+        rows: Axis laid out along the rows.
+        columns: Axis laid out along the columns.
+        selection: Values for the remaining axes (base case when omitted).
+
+    Returns:
+        DataFrame: Metric values indexed by the `rows` axis, with the `columns` axis as columns.
+    """
+    selection = selection or {}
+    index = []
+    for name, values in grid["axes"].items():
+        if name in (rows, columns):
+            index.append(slice(None))
+        elif name in selection:
+            index.append(_nearest_index(values, selection[name]))
+        else:
+            index.append(grid["base"][name])
+    values = grid["metrics"][metric][tuple(index)]
+
+    names = list(grid["axes"])
+    if names.index(rows) > names.index(columns):
+        values = values.T
+    table = pd.DataFrame(values, index=grid["axes"][rows], columns=grid["axes"][columns])
+    table.index.name = rows
+    table.columns.name = columns
+    return table
+
+
+def tornado_table(grid, metric="NOI"):
+    """
+    Summarise how far each axis swings a metric when the other axes stay at their base case.
+
+    Args:
+        grid: Result of build_sensitivity_grid.
+        metric: Metric to summarise.
+
+    Returns:
+        DataFrame: One row per axis with 'Low', 'High', 'Base' and 'Swing', sorted by swing.
+    """
+    values = grid["metrics"][metric]
+    base_index = tuple(grid["base"][name] for name in grid["axes"])
+    base_value = float(values[base_index])
+
+    rows = []
+    for position, name in enumerate(grid["axes"]):
+        index = list(base_index)
+        index[position] = slice(None)
+        line = values[tuple(index)]
+        rows.append({"Driver": name, "Low": float(line.min()), "High": float(line.max()), "Base": base_value})
+
+    table = pd.DataFrame(rows)
+    table["Swing"] = table["High"] - table["Low"]
+    return table.sort_values("Swing", ascending=False, ignore_index=True)
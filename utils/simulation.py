@@ -0,0 +1,216 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utils.profiling import timed
+
+# Default scenario drivers. Rates are in %, sampled once per scenario and held for the holding period.
+DEFAULT_DISTRIBUTIONS = {
+    "Rent Growth (%)": {"type": "normal", "mean": 3.0, "std": 1.5},
+    "Expense Growth (%)": {"type": "normal", "mean": 3.0, "std": 1.0},
+    "Occupancy (%)": {"type": "triangular", "low": 85.0, "mode": 95.0, "high": 100.0},
+    "Exit Cap Rate (%)": {"type": "normal", "mean": 6.0, "std": 0.75, "min": 2.0},
+}
+
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+DEFAULT_SEED = 0
+SIMULATED_METRICS = ["NOI", "DSCR", "Minimum DSCR", "Cash on Cash Return (%)", "Exit Value ($)"]
+
+
+def _sample(rng, spec, size):
+    """
+    Draw `size` samples from a distribution spec such as {"type": "normal", "mean": 3, "std": 1}.
+    Supported types are normal, lognormal, uniform, triangular and constant; optional
+    "min"/"max" keys clip the samples.
+    """
+    kind = spec.get("type", "normal")
+    if kind == "normal":
+        samples = rng.normal(spec["mean"], spec["std"], size)
+    elif kind == "lognormal":
+        samples = rng.lognormal(spec["mean"], spec["sigma"], size)
+    elif kind == "uniform":
+        samples = rng.uniform(spec["low"], spec["high"], size)
+    elif kind == "triangular":
+        samples = rng.triangular(spec["low"], spec["mode"], spec["high"], size)
+    elif kind == "constant":
+        samples = np.full(size, float(spec["value"]))
+    else:
+        raise ValueError(f"Unsupported distribution type: {kind}")
+
+    if "min" in spec or "max" in spec:
+        samples = np.clip(samples, spec.get("min", -np.inf), spec.get("max", np.inf))
+    return samples
+
+
+def _simulate_chunk(rng, size, income, expenses, debt_service, equity, holding_period,
+                    current_occupancy, distributions):
+    """Simulate one chunk of scenarios; every array is shaped (size,) or (size, holding_period)."""
+    rent_growth = _sample(rng, distributions["Rent Growth (%)"], size)[:, None] / 100
+    expense_growth = _sample(rng, distributions["Expense Growth (%)"], size)[:, None] / 100
+    occupancy = _sample(rng, distributions["Occupancy (%)"], size)[:, None]
+    exit_cap_rate = _sample(rng, distributions["Exit Cap Rate (%)"], size) / 100
+
+    # Years 1..holding_period + 1; the extra year is the forward NOI capitalised at exit
+    years = np.arange(1, holding_period + 2)[None, :]
+    scenario_income = income * (occupancy / current_occupancy) * (1 + rent_growth) ** years
+    scenario_expenses = expenses * (1 + expense_growth) ** years
+    noi = scenario_income - scenario_expenses
+
+    hold_noi = noi[:, :holding_period]
+    if debt_service > 0:
+        dscr = hold_noi / debt_service
+        first_dscr = dscr[:, 0]
+        minimum_dscr = dscr.min(axis=1)
+    else:
+        first_dscr = np.full(size, np.nan)
+        minimum_dscr = np.full(size, np.nan)
+
+    return {
+        "NOI": noi[:, 0],
+        "DSCR": first_dscr,
+        "Minimum DSCR": minimum_dscr,
+        "Cash on Cash Return (%)": noi[:, 0] / equity * 100 if equity > 0 else np.full(size, np.nan),
+        "Exit Value ($)": np.divide(noi[:, -1], exit_cap_rate, out=np.full(size, np.nan), where=exit_cap_rate > 0),
+    }
+
+
+@timed()
+def simulate_risk(income, expenses, debt_service=0, equity=0, holding_period=5, distributions=None,
+                  n_scenarios=100_000, seed=DEFAULT_SEED, chunk_size=50_000, current_occupancy=95.0,
+                  percentiles=DEFAULT_PERCENTILES):
+    """
+    Run a Monte Carlo risk simulation for a single property.
+
+    Rent growth, expense growth, occupancy and exit cap rate are drawn per scenario from
+    `distributions`. Scenarios are simulated in vectorized chunks of `chunk_size`, each with
+    its own child seed, so memory stays bounded and the result only depends on `seed`,
+    `n_scenarios` and `chunk_size`.
+
+    Args:
+        income: Current total income (collected at `current_occupancy`).
+        expenses: Current total expenses.
+        debt_service: Annual debt service (optional; DSCR metrics are skipped when 0).
+        equity: Equity invested (optional; Cash on Cash Return is skipped when 0).
+        holding_period: Number of years to project.
+        distributions: Overrides for DEFAULT_DISTRIBUTIONS, keyed by driver name.
+        n_scenarios: Number of scenarios to draw.
+        seed: Integer seed (or numpy SeedSequence) for reproducible results.
+        chunk_size: Maximum number of scenarios simulated at once.
+        current_occupancy: Occupancy (%) at which `income` was collected.
+        percentiles: Percentiles reported for every metric.
+
+    Returns:
+        dict: A dictionary containing:
+              - 'scenarios': Number of simulated scenarios.
+              - 'seed': Seed used for the run.
+              - 'percentiles': Metric name to {"P5": ..., "P50": ..., ...}.
+              - 'mean': Metric name to the mean outcome.
+              - 'Probability DSCR < 1.0': Share of scenarios where DSCR falls below 1.0 in any
+                year of the holding period (None without debt service).
+    """
+    try:
+        holding_period = max(int(holding_period), 1)
+        merged = dict(DEFAULT_DISTRIBUTIONS)
+        merged.update(distributions or {})
+
+        seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        chunk_sizes = [min(chunk_size, n_scenarios - start) for start in range(0, n_scenarios, chunk_size)]
+        outcomes = {metric: np.empty(n_scenarios) for metric in SIMULATED_METRICS}
+
+        start = 0
+        for child, size in zip(seed_sequence.spawn(len(chunk_sizes)), chunk_sizes):
+            chunk = _simulate_chunk(
+                np.random.default_rng(child), size, income, expenses, debt_service, equity,
+                holding_period, current_occupancy, merged,
+            )
+            for metric, values in chunk.items():
+                outcomes[metric][start:start + size] = values
+            start += size
+
+        if isinstance(seed, np.random.SeedSequence):
+            # Child seeds of a portfolio run are identified by the parent seed plus their spawn key
+            seed = "/".join(str(part) for part in (seed.entropy, *seed.spawn_key))
+        summary = {"scenarios": n_scenarios, "seed": seed, "percentiles": {}, "mean": {}}
+        for metric, values in outcomes.items():
+            if np.isnan(values).all():
+                continue
+            bands = np.nanpercentile(values, percentiles)
+            summary["percentiles"][metric] = {f"P{p:g}": round(float(v), 2) for p, v in zip(percentiles, bands)}
+            summary["mean"][metric] = round(float(np.nanmean(values)), 2)
+
+        summary["Probability DSCR < 1.0"] = (
+            round(float((outcomes["Minimum DSCR"] < 1.0).mean()), 4) if debt_service > 0 else None
+        )
+        return summary
+    except KeyError as e:
+        raise ValueError(f"Missing distribution parameter: {e}")
+    except Exception as e:
+        raise ValueError(f"Error running risk simulation: {e}")
+
+
+def _simulate_portfolio_row(args):
+    """Process-pool entry point: simulate one row of a portfolio."""
+    row, seed_sequence, options = args
+    return simulate_risk(
+        row.get("Income", 0), row.get("Expenses", 0),
+        debt_service=row.get("Debt Service", 0), equity=row.get("Equity", 0),
+        seed=seed_sequence, **options,
+    )
+
+
+@timed()
+def simulate_portfolio_risk(portfolio, seed=DEFAULT_SEED, max_workers=None, **options):
+    """
+    Run simulate_risk for every property of a portfolio, optionally on a process pool.
+
+    Each property gets its own child seed of `seed`, so results are identical whether the
+    portfolio runs serially or across workers.
+
+    Args:
+        portfolio: DataFrame with one row per property ("Income", "Expenses", "Debt Service", "Equity").
+        seed: Integer seed for the whole portfolio.
+        max_workers: Number of worker processes; runs serially when None or 1.
+        **options: Further keyword arguments passed to simulate_risk.
+
+    Returns:
+        DataFrame: One row per property with "<metric> <percentile>" columns and
+                   'Probability DSCR < 1.0'.
+    """
+    rows = portfolio.to_dict("records")
+    seeds = np.random.SeedSequence(seed).spawn(len(rows))
+    tasks = [(row, child, options) for row, child in zip(rows, seeds)]
+
+    if max_workers and max_workers > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_simulate_portfolio_row, tasks))
+    else:
+        results = [_simulate_portfolio_row(task) for task in tasks]
+
+    records = []
+    for result in results:
+        record = {"Probability DSCR < 1.0": result["Probability DSCR < 1.0"]}
+        for metric, bands in result["percentiles"].items():
+            for band, value in bands.items():
+                record[f"{metric} {band}"] = value
+        records.append(record)
+    return pd.DataFrame(records, index=portfolio.index)
+
+
+def format_simulation_summary(summary):
+    """
+    Format a simulate_risk result as plain text for an LLM prompt.
+
+    Args:
+        summary: Result of simulate_risk.
+
+    Returns:
+        str: Multi-line summary of the percentile bands and DSCR breach probability.
+    """
+    lines = [f"Monte Carlo risk simulation ({summary['scenarios']:,} scenarios, seed {summary['seed']}):"]
+    for metric, bands in summary["percentiles"].items():
+        bands_text = ", ".join(f"{band} {value:,.2f}" for band, value in bands.items())
+        lines.append(f"- {metric}: {bands_text}")
+    if summary["Probability DSCR < 1.0"] is not None:
+        lines.append(f"- Probability DSCR < 1.0 during the holding period: {summary['Probability DSCR < 1.0']:.2%}")
+    return "\n".join(lines)
@@ -1,79 +1,282 @@
-import matplotlib.pyplot as plt
-import streamlit as st
+import io
+from functools import lru_cache
 
-def plot_metrics(metrics, chart_type="bar"):
+import numpy as np
+
+from utils.profiling import timed
+
+# Interactive charts are built as plain Plotly figure specs (dicts): building them needs
+# neither plotly nor streamlit, they cache and pickle cheaply, and st.plotly_chart draws them
+# in the browser, so zooming and hovering never rerun the script. matplotlib is only imported
+# by render_chart, for the PNGs embedded in PDF reports and saved deals.
+
+CHART_CACHE_SIZE = 64
+
+# Points drawn per trace; longer series are downsampled with LTTB before they are sent to the browser
+MAX_POINTS = 2000
+
+TITLE_FONT = {"size": 16}
+
+
+def lttb(x, y, threshold=MAX_POINTS):
     """
-    Plot financial metrics as a chart.
-    
+    Largest-Triangle-Three-Buckets downsampling of a series ordered by x.
+
+    The first and last points are kept; every bucket in between keeps the point forming the
+    largest triangle with the previously kept point and the average of the next bucket, so
+    peaks, troughs and trend changes survive the reduction.
+
+    Args:
+        x: Numeric or datetime x values, sorted ascending.
+        y: Numeric y values.
+        threshold: Number of points to keep.
+
+    Returns:
+        ndarray: Positions of the kept points, ascending (all positions when the series is short enough).
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x)
+    x = x.astype("datetime64[ns]").astype("int64").astype("float64") if x.dtype.kind == "M" else x.astype("float64")
+    y = np.asarray(y, dtype="float64")
+
+    # threshold - 2 buckets over the points between the first and the last
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    cum_x = np.concatenate([[0.0], np.cumsum(x)])
+    cum_y = np.concatenate([[0.0], np.cumsum(y)])
+    next_start = np.append(edges[1:-1], n - 1)
+    next_end = np.append(edges[2:], n)
+    avg_x = (cum_x[next_end] - cum_x[next_start]) / (next_end - next_start)
+    avg_y = (cum_y[next_end] - cum_y[next_start]) / (next_end - next_start)
+
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        area = np.abs(
+            (x[previous] - avg_x[bucket]) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y[bucket] - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        kept[bucket + 1] = previous
+    return kept
+
+
+def _layout(title, x_title=None, y_title=None, **layout):
+    return {
+        "title": {"text": title, "font": TITLE_FONT},
+        "xaxis": {"title": {"text": x_title}} if x_title else {},
+        "yaxis": {"title": {"text": y_title}} if y_title else {},
+        **layout,
+    }
+
+
+def metrics_figure(metrics, chart_type="bar"):
+    """
+    Interactive chart of financial metrics, as a Plotly figure spec.
+
+    Specs are cached per (metrics, chart_type); treat the returned dict as read-only.
+
     Args:
         metrics: A dictionary of metrics (key-value pairs).
-        chart_type: Type of chart to display ("bar", "pie", "line").
+        chart_type: Type of chart ("bar", "pie", "line").
+
+    Returns:
+        dict: Plotly figure spec for st.plotly_chart.
     """
     if not metrics or all(value == 0 for value in metrics.values()):
-        st.warning("No meaningful data to plot.")
-        return
-
-    try:
-        # Debugging: Display the chart type and metrics
-        st.write(f"Selected Chart Type: {chart_type}")
-        st.write(f"Metrics: {metrics}")
-
-        # Create the figure
-        fig, ax = plt.subplots(figsize=(12, 7))  # Adjust figure size for better readability
-
-        if chart_type == "bar":
-            # Bar chart customization
-            ax.bar(metrics.keys(), metrics.values(), color='skyblue', edgecolor='black')
-            ax.set_title("Financial Metrics", fontsize=16, fontweight='bold')
-            ax.set_ylabel("Value ($)", fontsize=12)
-            ax.set_xlabel("Metrics", fontsize=12)
-            ax.set_xticks(range(len(metrics.keys())))
-            ax.set_xticklabels(metrics.keys(), rotation=45, fontsize=10)
-            ax.grid(axis='y', linestyle='--', alpha=0.7)
-
-        elif chart_type == "pie":
-            # Pie chart customization
-            if len(metrics) > 10:
-                st.warning("Too many metrics for a pie chart. Consider using a bar or line chart.")
-                return
-            colors = plt.cm.Paired.colors[:len(metrics)]  # Ensure enough colors
-            ax.pie(
-                metrics.values(), 
-                labels=metrics.keys(), 
-                autopct='%1.1f%%', 
-                startangle=90, 
-                colors=colors,
-                textprops={'fontsize': 10}
-            )
-            ax.set_title("Financial Metrics Distribution", fontsize=16, fontweight='bold')
-        
-        elif chart_type == "line":
-            # Line chart customization
-            ax.plot(
-                list(metrics.keys()), 
-                list(metrics.values()), 
-                marker='o', 
-                linestyle='-', 
-                color='skyblue',
-                linewidth=2,
-                label="Financial Metrics"
-            )
-            ax.set_title("Financial Metrics Over Time", fontsize=16, fontweight='bold')
-            ax.set_ylabel("Value ($)", fontsize=12)
-            ax.set_xlabel("Metrics", fontsize=12)
-            ax.set_xticks(range(len(metrics.keys())))
-            ax.set_xticklabels(metrics.keys(), rotation=45, fontsize=10)
-            ax.legend(fontsize=10)
-            ax.grid(axis='both', linestyle='--', alpha=0.7)
-
-        else:
-            st.error(f"Unsupported chart type: {chart_type}. Please choose 'bar', 'pie', or 'line'.")
-            return
-
-        # Display the plot
-        st.pyplot(fig)
-
-    except ValueError as ve:
-        st.error(f"Value error while plotting metrics: {ve}")
-    except Exception as e:
-        st.error(f"Unexpected error plotting metrics: {e}")
+        raise ValueError("No meaningful data to plot.")
+    if chart_type == "pie" and len(metrics) > 10:
+        raise ValueError("Too many metrics for a pie chart. Consider using a bar or line chart.")
+    if chart_type not in ("bar", "pie", "line"):
+        raise ValueError(f"Unsupported chart type: {chart_type}. Please choose 'bar', 'pie', or 'line'.")
+    return _metrics_figure_cached(tuple((str(key), float(value)) for key, value in metrics.items()), chart_type)
+
+
+@lru_cache(maxsize=CHART_CACHE_SIZE)
+def _metrics_figure_cached(items, chart_type):
+    labels = [key for key, _ in items]
+    values = [value for _, value in items]
+    if chart_type == "bar":
+        trace = {"type": "bar", "x": labels, "y": values, "marker": {"color": "skyblue", "line": {"color": "black", "width": 1}}}
+        return {"data": [trace], "layout": _layout("Financial Metrics", "Metrics", "Value ($)", xaxis_tickangle=-45)}
+    if chart_type == "pie":
+        trace = {"type": "pie", "labels": labels, "values": values, "textinfo": "percent", "sort": False}
+        return {"data": [trace], "layout": _layout("Financial Metrics Distribution")}
+    trace = {"type": "scatter", "mode": "lines+markers", "x": labels, "y": values, "name": "Financial Metrics"}
+    return {"data": [trace], "layout": _layout("Financial Metrics Over Time", "Metrics", "Value ($)", xaxis_tickangle=-45)}
+
+
+def series_figure(x, series, title, x_title=None, y_title=None, max_points=MAX_POINTS):
+    """
+    WebGL line chart of one or more series sharing an x axis (e.g. monthly cash flows).
+
+    Each series is downsampled on its own with LTTB to at most `max_points` points.
+
+    Args:
+        x: Shared x values (numbers or dates), sorted ascending.
+        series: Dictionary of series name -> y values.
+        title: Chart title.
+        x_title, y_title: Axis titles (optional).
+        max_points: Points kept per series.
+
+    Returns:
+        dict: Plotly figure spec for st.plotly_chart.
+    """
+    x = np.asarray(x)
+    traces = []
+    for name, y in series.items():
+        y = np.asarray(y, dtype="float64")
+        kept = lttb(x, y, max_points)
+        traces.append({"type": "scattergl", "mode": "lines", "name": name, "x": x[kept], "y": y[kept]})
+    return {"data": traces, "layout": _layout(title, x_title, y_title, hovermode="x unified")}
+
+
+def scatter_figure(x, y, title, x_title=None, y_title=None, text=None, max_points=MAX_POINTS):
+    """
+    WebGL scatter plot of many points (e.g. one per property).
+
+    Above `max_points` points, the points are ordered by x and reduced with LTTB, which keeps
+    the outliers and the shape of the cloud.
+
+    Args:
+        x, y: Point coordinates.
+        title: Chart title.
+        x_title, y_title: Axis titles (optional).
+        text: Hover label per point (optional).
+        max_points: Points drawn.
+
+    Returns:
+        dict: Plotly figure spec for st.plotly_chart.
+    """
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    order = np.argsort(x, kind="stable")
+    kept = order[lttb(x[order], y[order], max_points)] if len(x) > max_points else order
+    trace = {"type": "scattergl", "mode": "markers", "x": x[kept], "y": y[kept], "marker": {"size": 6, "opacity": 0.7}}
+    if text is not None:
+        trace["text"] = np.asarray(text, dtype=object)[kept]
+    subtitle = f" ({len(kept):,} of {len(x):,} shown)" if len(kept) < len(x) else ""
+    return {"data": [trace], "layout": _layout(title + subtitle, x_title, y_title)}
+
+
+def sensitivity_heatmap_figure(table, metric="NOI"):
+    """
+    Heatmap of a precomputed sensitivity slice, as a Plotly figure spec.
+
+    Args:
+        table: DataFrame returned by utils.sensitivity.sensitivity_slice.
+        metric: Name of the metric shown, used for the title and colorbar.
+    """
+    trace = {
+        "type": "heatmap", "z": table.to_numpy(), "colorscale": "RdYlGn", "colorbar": {"title": {"text": metric}},
+        "x": [f"{value:g}" for value in table.columns], "y": [f"{value:g}" for value in table.index],
+    }
+    return {"data": [trace], "layout": _layout(f"{metric} Sensitivity", table.columns.name, table.index.name)}
+
+
+def tornado_figure(table, metric="NOI"):
+    """
+    Tornado chart of the swing each driver causes in a metric, as a Plotly figure spec.
+
+    Args:
+        table: DataFrame returned by utils.sensitivity.tornado_table.
+        metric: Name of the metric shown, used for the title and axis label.
+    """
+    table = table.iloc[::-1]  # Largest swing on top
+    base = float(table["Base"].iloc[0])
+    drivers = table["Driver"].tolist()
+    traces = [
+        {"type": "bar", "orientation": "h", "name": name, "y": drivers, "x": table[column].to_numpy() - base, "base": base,
+         "marker": {"color": color, "line": {"color": "black", "width": 1}}}
+        for name, column, color in (("High", "High", "seagreen"), ("Low", "Low", "indianred"))
+    ]
+    layout = _layout(f"{metric} Tornado", metric, barmode="overlay")
+    layout["shapes"] = [{"type": "line", "x0": base, "x1": base, "y0": 0, "y1": 1, "yref": "paper", "line": {"color": "black"}}]
+    return {"data": traces, "layout": layout}
+
+
+def scenario_figure(changes, metrics):
+    """
+    Grouped bar chart comparing scenarios, as a Plotly figure spec.
+
+    Args:
+        changes: DataFrame of % changes vs the base scenario, one row per scenario
+                 (utils.scenarios.scenario_diff with relative=True).
+        metrics: Columns of `changes` to show.
+
+    Returns:
+        dict: Plotly figure spec for st.plotly_chart.
+    """
+    metrics = [metric for metric in metrics if metric in changes.columns]
+    traces = [
+        {"type": "bar", "name": str(name), "x": metrics, "y": changes.loc[name, metrics].to_numpy(dtype="float64")}
+        for name in changes.index
+    ]
+    return {"data": traces, "layout": _layout("Scenarios vs Base", None, "Change vs Base (%)", barmode="group")}
+
+
+@timed()
+def render_chart(metrics, chart_type="bar", dpi=300):
+    """
+    Render financial metrics to PNG bytes in memory.
+
+    Figures are built with matplotlib's object API rather than pyplot's global state, so
+    concurrent sessions never share a figure or a file, and results are cached per
+    (metrics, chart_type, dpi).
+
+    Args:
+        metrics: A dictionary of metrics (key-value pairs).
+        chart_type: Type of chart to render ("bar", "pie", "line").
+        dpi: Resolution of the PNG.
+
+    Returns:
+        bytes: The PNG image. Wrap in io.BytesIO where a file object is needed.
+    """
+    if not metrics or all(value == 0 for value in metrics.values()):
+        raise ValueError("No meaningful data to plot.")
+    if chart_type == "pie" and len(metrics) > 10:
+        raise ValueError("Too many metrics for a pie chart. Consider using a bar or line chart.")
+    if chart_type not in ("bar", "pie", "line"):
+        raise ValueError(f"Unsupported chart type: {chart_type}. Please choose 'bar', 'pie', or 'line'.")
+    return _render_chart_cached(tuple((str(key), float(value)) for key, value in metrics.items()), chart_type, dpi)
+
+
+@lru_cache(maxsize=CHART_CACHE_SIZE)
+def _render_chart_cached(items, chart_type, dpi):
+    from matplotlib.figure import Figure
+
+    labels = [key for key, _ in items]
+    values = [value for _, value in items]
+
+    fig = Figure(figsize=(10, 6))  # Adjust figure size for better readability
+    ax = fig.subplots()
+
+    if chart_type == "bar":
+        ax.bar(labels, values, color='skyblue', edgecolor='black')
+        ax.set_title("Financial Metrics", fontsize=16, fontweight='bold')
+        ax.set_ylabel("Value ($)", fontsize=12)
+        ax.set_xlabel("Metrics", fontsize=12)
+        ax.set_xticks(range(len(labels)))
+        ax.set_xticklabels(labels, rotation=45, ha="right", fontsize=10)
+        ax.grid(axis='y', linestyle='--', alpha=0.7)
+
+    elif chart_type == "pie":
+        ax.pie(values, labels=labels, autopct='%1.1f%%', startangle=90)
+        ax.set_title("Financial Metrics Distribution", fontsize=16, fontweight='bold')
+
+    elif chart_type == "line":
+        ax.plot(labels, values, marker='o', linestyle='-', linewidth=2)
+        ax.set_title("Financial Metrics Over Time", fontsize=16, fontweight='bold')
+        ax.set_ylabel("Value ($)", fontsize=12)
+        ax.set_xlabel("Metrics", fontsize=12)
+        ax.set_xticks(range(len(labels)))
+        ax.set_xticklabels(labels, rotation=45, ha="right", fontsize=10)
+        ax.grid(axis='both', linestyle='--', alpha=0.7)
+
+    fig.tight_layout()  # Adjust layout to prevent label clipping
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=dpi, bbox_inches="tight")
+    return buffer.getvalue()